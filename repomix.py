@@ -4,233 +4,5105 @@ RepoMixer Component
 This module provides a utility to traverse a repository, filter files according to rules,
 and synthesize them into a single text file for AI context. It includes robust
 file handling, .gitignore compatibility, and defensive programming practices.
+
+Startup is kept short for editor hooks that run it on every save: modules that
+only some options need are imported on first use, and compiled ignore rules are
+cached on disk. Running it as `python -m repomix` also reuses the cached bytecode
+of this file, which `python repomix.py` recompiles on every start.
 """
 # Dependencies: gitignore-parser
 
-import argparse
-import logging
-import sys
-from pathlib import Path
-from typing import Final, Dict, Callable, Iterator
-
-# Third-party dependency: gitignore-parser
-# Justification: Criterion C - Provides robust parsing of complex .gitignore rules,
-# which is non-trivial to implement correctly.
-# Installation: pip install gitignore-parser
-try:
-    # --- FIX START ---
-    # Import the internal function to handle file streams directly
-    from gitignore_parser import _parse_gitignore_lines
-    # --- FIX END ---
-except ImportError:
-    print("Error: 'gitignore-parser' is not installed. Please run 'pip install gitignore-parser'", file=sys.stderr)
-    sys.exit(1)
+# Modules that only some options need (concurrent.futures, subprocess, json, lzma,
+# difflib, tempfile, ctypes, random, cProfile) are imported where they are used.
+import argparse
+import codecs
+import fnmatch
+import hashlib
+import io
+import logging
+import marshal
+import os
+import queue
+import re
+import select
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import ExitStack, redirect_stdout
+from pathlib import Path
+from typing import Final, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+def _import_rule_translator() -> Callable:
+    """
+    Imports gitignore-parser when the first ignore file is compiled; ignore
+    files found in the rule cache never need it.
+
+    :return: The `rule_from_pattern` function of gitignore-parser.
+    :rtype: Callable
+    """
+    # Third-party dependency: gitignore-parser
+    # Justification: Criterion C - Provides robust parsing of complex .gitignore rules,
+    # which is non-trivial to implement correctly.
+    # Installation: pip install gitignore-parser
+    try:
+        # Only the pattern-to-rule translation is used; matching is layered by RepoMixer
+        from gitignore_parser import rule_from_pattern
+    except ImportError:
+        _exit_without_rule_translator()
+    return rule_from_pattern
+
+
+def _check_rule_translator() -> None:
+    """
+    Verifies that gitignore-parser can be imported, without importing it, so
+    that a missing dependency is reported before any output file is opened
+    rather than when the first uncached ignore file is found during the walk.
+    """
+    import importlib.util
+    if importlib.util.find_spec("gitignore_parser") is None:
+        _exit_without_rule_translator()
+
+
+def _exit_without_rule_translator() -> None:
+    """
+    Reports that gitignore-parser is not installed and exits.
+    """
+    print("Error: 'gitignore-parser' is not installed. Please run 'pip install gitignore-parser'",
+          file=sys.stderr)
+    sys.exit(1)
+
+
+# Optional dependencies, imported on first use by `_optional_import`:
+# - zstandard, only needed for --compress zstd. Installation: pip install zstandard
+# - xxhash, a faster content hash for --dedupe (blake2b is used otherwise). Installation: pip install xxhash
+# - numpy, vectorizes MinHash signatures for --near-dedupe. Installation: pip install numpy
+_optional_modules: Dict[str, object] = {}
+
+
+def _optional_import(name: str):
+    """
+    Imports an optional dependency the first time it is needed.
+
+    :param name: The module name.
+    :type name: str
+    :return: The module, or None if it is not installed.
+    """
+    try:
+        return _optional_modules[name]
+    except KeyError:
+        pass
+    try:
+        module = __import__(name)
+    except ImportError:
+        module = None
+    _optional_modules[name] = module
+    return module
+
+# --- System Constants ---
+LOG_FORMAT: Final[str] = "[%(levelname)s] %(message)s"
+DEFAULT_OUTPUT_FILENAME: Final[str] = "repomix.txt"
+DEFAULT_IGNORE_PATTERNS: Final[tuple[str, ...]] = (".git/",)
+IGNORE_FILENAME: Final[str] = ".gitignore"
+BINARY_CHECK_BYTES: Final[int] = 1024
+# UTF-8 validation decodes in chunks of this size to bound the temporary str memory.
+UTF8_VALIDATE_CHUNK_BYTES: Final[int] = 1 << 20
+# Bytes that str.strip() treats as whitespace but bytes.strip() does not.
+EXTRA_ASCII_WHITESPACE: Final[bytes] = b"\x1c\x1d\x1e\x1f"
+# Text files larger than this are streamed by the writer in chunks instead of being
+# loaded, so that peak memory per file stays near STREAM_CHUNK_BYTES.
+LARGE_FILE_BYTES: Final[int] = 16 << 20
+STREAM_CHUNK_BYTES: Final[int] = 1 << 20
+# What to do with text files above --max-file-size.
+OVERSIZE_ACTIONS: Final[Tuple[str, ...]] = ("truncate", "skip")
+# --sample keeps the first and last lines of matching files; at most this many bytes
+# are read from each end, so long lines or huge files cannot inflate the sample.
+DEFAULT_SAMPLE_LINES: Final[int] = 20
+SAMPLE_WINDOW_BYTES: Final[int] = 64 * 1024
+# The summary line counts the lines of sampled files up to this size exactly, with a
+# pass that reads but does not keep the middle; larger files report only their size.
+SAMPLE_COUNT_MAX_BYTES: Final[int] = 64 << 20
+# The binary cache lists the (device, inode, size, mtime_ns) of files known to be binary.
+BINARY_CACHE_MAGIC: Final[bytes] = b"RMXB\x01"
+BINARY_CACHE_ENTRY: Final[struct.Struct] = struct.Struct("<QQQq")
+# Compiled ignore rules are cached in this subdirectory of the cache directory,
+# one marshal file per ignore file content. Entries not used for the maximum age
+# are evicted, then the least recently used ones while the total exceeds the maximum size.
+RULE_CACHE_DIRNAME: Final[str] = "ignore-rules"
+RULE_CACHE_VERSION: Final[int] = 1
+RULE_CACHE_MAX_BYTES: Final[int] = 16 << 20
+RULE_CACHE_MAX_AGE_SECONDS: Final[int] = 30 * 24 * 3600
+# A cache hit refreshes the entry's mtime at most this often, which orders eviction.
+RULE_CACHE_TOUCH_SECONDS: Final[int] = 24 * 3600
+# --partitions splits the walk into about this many units per worker process, expanding
+# directories at most this deep, so that one large subtree does not serialize the run.
+PARTITION_UNITS_PER_WORKER: Final[int] = 4
+PARTITION_MAX_DEPTH: Final[int] = 3
+# Rendered segments kept in flight per worker thread when --jobs > 1.
+READ_AHEAD_PER_JOB: Final[int] = 4
+# Incremental runs keep per-file metadata and segment offsets next to the output.
+MANIFEST_SUFFIX: Final[str] = ".manifest.json"
+MANIFEST_VERSION: Final[int] = 2
+# Watch mode waits for this long without events before regenerating the output.
+WATCH_DEBOUNCE_SECONDS: Final[float] = 0.1
+WATCH_POLL_INTERVAL_SECONDS: Final[float] = 1.0
+# Compressed output: file suffix, default level and valid level range per method.
+COMPRESSION_SUFFIXES: Final[Dict[str, str]] = {"gzip": ".gz", "zstd": ".zst", "xz": ".xz"}
+DEFAULT_COMPRESSION_LEVELS: Final[Dict[str, int]] = {"gzip": 6, "zstd": 3, "xz": 6}
+COMPRESSION_LEVEL_RANGES: Final[Dict[str, Tuple[int, int]]] = {"gzip": (0, 9), "zstd": (1, 22), "xz": (0, 9)}
+# Chunks queued for a background writer thread before the producer blocks.
+WRITER_QUEUE_CHUNKS: Final[int] = 64
+# Sharded runs describe their parts in a manifest next to the output.
+SHARD_MANIFEST_SUFFIX: Final[str] = ".shards.json"
+SHARD_MANIFEST_VERSION: Final[int] = 1
+# Rough per-file overhead of the segment markup, used to balance --shards.
+SEGMENT_OVERHEAD_BYTES: Final[int] = 32
+SIZE_UNITS: Final[Dict[str, int]] = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+# Deduplication leaves file contents shorter than this in place; the stub would save little.
+DEDUPE_MIN_BYTES: Final[int] = 128
+# Near-duplicate detection: MinHash over token shingles, bucketed with LSH.
+# 16 bands of 4 rows make pairs above ~50% similarity likely to share a bucket.
+DEFAULT_NEAR_DEDUPE_THRESHOLD: Final[float] = 0.8
+MINHASH_PERMUTATIONS: Final[int] = 64
+LSH_BANDS: Final[int] = 16
+SHINGLE_TOKENS: Final[int] = 3
+# Files larger than this are not considered, bounding the hashing and diffing cost.
+NEAR_DEDUPE_MAX_BYTES: Final[int] = 256 * 1024
+NEAR_DEDUPE_CONTEXT_LINES: Final[int] = 1
+# Archive members cannot be read again to diff against, so the compressed segments of
+# the files in the near-duplicate index are kept, least recently used first out.
+ARCHIVE_DIFF_BASES_BYTES: Final[int] = 16 << 20
+# Shingles hashed per vectorized block, bounding the temporary matrix to a few MB.
+MINHASH_BLOCK_SHINGLES: Final[int] = 4096
+# Phases timed by RunStats. Worker threads and processes add up, so with --jobs or
+# --partitions the phase totals may exceed the wall time.
+STATS_PHASES: Final[Tuple[str, ...]] = ("walk", "ignore", "binary", "read", "decode", "stream",
+                                        "dedupe", "write", "compress")
+STATS_COUNTERS: Final[Tuple[str, ...]] = ("directories", "ignored", "text", "binary", "binary_cached",
+                                          "streamed", "sampled", "truncated", "skipped", "errors",
+                                          "bytes_read", "bytes_written")
+STATS_VERSION: Final[int] = 1
+
+# Linux inotify event flags (see inotify(7)).
+IN_MODIFY: Final[int] = 0x00000002
+IN_CLOSE_WRITE: Final[int] = 0x00000008
+IN_MOVED_FROM: Final[int] = 0x00000040
+IN_MOVED_TO: Final[int] = 0x00000080
+IN_CREATE: Final[int] = 0x00000100
+IN_DELETE: Final[int] = 0x00000200
+IN_DELETE_SELF: Final[int] = 0x00000400
+IN_MOVE_SELF: Final[int] = 0x00000800
+IN_Q_OVERFLOW: Final[int] = 0x00004000
+IN_IGNORED: Final[int] = 0x00008000
+IN_ISDIR: Final[int] = 0x40000000
+INOTIFY_MASK: Final[int] = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+                            | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EXTENSION_TO_LANG: Final[Dict[str, str]] = {
+    ".py": "python", ".js": "javascript", ".ts": "typescript", ".java": "java",
+    ".c": "c", ".cpp": "cpp", ".cs": "csharp", ".go": "go", ".rs": "rust",
+    ".rb": "ruby", ".php": "php", ".kt": "kotlin", ".swift": "swift", ".html": "html",
+    ".css": "css", ".scss": "scss", ".json": "json", ".xml": "xml", ".yaml": "yaml",
+    ".yml": "yaml", ".md": "markdown", ".sh": "shell", ".bash": "bash",
+    "dockerfile": "dockerfile", ".sql": "sql", ".r": "r", ".pl": "perl",
+}
+
+# --- Ignore Rules ---
+
+# Fragments of the regexes produced by gitignore_parser, used to recognise rules
+# that can be answered by a hash lookup or a bucketed regex instead of a full search.
+_SEPS: Final[str] = "|".join(re.escape(sep) for sep in (os.sep, os.altsep) if sep)
+_SEP_CLASS: Final[str] = f"[{_SEPS}]"
+_NONSEP_CLASS: Final[str] = f"[^{_SEPS}]"
+_UNANCHORED_PREFIX: Final[str] = f"(^|{_SEP_CLASS})"
+_NONSEP_STAR: Final[str] = f"{_NONSEP_CLASS}*"
+_FILE_TAIL: Final[str] = "$"
+_DIR_TAIL: Final[str] = "($|\\/)"
+_REGEX_TOKEN_RE: Final[re.Pattern] = re.compile(r"\\.|\[[^\]]*\]|.", re.DOTALL)
+_REGEX_META: Final[str] = "()*+?{}|^$.]"
+
+
+def _unescape_literal(fragment: str) -> Optional[str]:
+    """
+    Recovers the literal text of a regex fragment made only of escaped characters.
+
+    :param fragment: A fragment produced by `re.escape`.
+    :type fragment: str
+    :return: The literal text, or None if the fragment contains regex syntax.
+    :rtype: Optional[str]
+    """
+    literal = re.sub(r"\\(.)", r"\1", fragment)
+    if not literal or "/" in literal or re.escape(literal) != fragment:
+        return None
+    return literal
+
+
+def _regex_tokens(fragment: str) -> Iterator[Tuple[str, str]]:
+    """
+    Splits a gitignore_parser regex fragment into classified tokens.
+
+    :param fragment: The regex fragment.
+    :type fragment: str
+    :yield: Tuples of (kind, text) where kind is "literal", "sep" or "meta".
+            For literals, text is the unescaped character.
+    :rtype: Iterator[Tuple[str, str]]
+    """
+    for token in _REGEX_TOKEN_RE.findall(fragment):
+        if token.startswith("\\"):
+            yield "literal", token[1:]
+        elif token == _SEP_CLASS:
+            yield "sep", token
+        elif token.startswith("[") or token in _REGEX_META:
+            yield "meta", token
+        else:
+            yield "literal", token
+
+
+class _PatternIndex:
+    """
+    Regexes bucketed by a literal key. The regexes of a bucket are combined
+    into one alternation ordered by descending rule index, so a single match
+    at a fixed position reports the highest-numbered rule that matches.
+
+    A bucket's regex is only compiled when a path first looks it up, since
+    most buckets of a large ignore file are never hit by a given repository.
+    """
+    def __init__(self, method: str):
+        """
+        :param method: The `re.Pattern` method used to match, "match" or "fullmatch".
+        :type method: str
+        """
+        self._method = method
+        self.entries: Dict[Optional[str], List[Tuple[int, str]]] = {}
+        self.buckets: Dict[str, Callable] = {}
+        self.fallback: Optional[Callable] = None
+
+    def add(self, key: Optional[str], index: int, regex: str) -> None:
+        """
+        Adds a rule's regex to a bucket; rules without a key are always tried.
+        """
+        self.entries.setdefault(key, []).append((index, regex))
+
+    def compile(self) -> None:
+        """
+        Prepares the matchers of the buckets, which compile on their first use.
+        """
+        for key, entries in self.entries.items():
+            entries.sort(reverse=True)
+            matcher = self._deferred_matcher(key, "|".join(f"(?P<r{index}>{regex})" for index, regex in entries))
+            if key is None:
+                self.fallback = matcher
+            else:
+                self.buckets[key] = matcher
+
+    def _deferred_matcher(self, key: Optional[str], regex: str) -> Callable:
+        """
+        Returns a matcher that compiles regex, replaces itself with the compiled
+        matcher and then matches.
+        """
+        def compile_and_match(text: str):
+            matcher = getattr(re.compile(regex), self._method)
+            if key is None:
+                self.fallback = matcher
+            else:
+                self.buckets[key] = matcher
+            return matcher(text)
+        return compile_and_match
+
+    def best(self, key: Optional[str], text: str) -> int:
+        """
+        Returns the highest index of the rules matching text, or -1.
+
+        :param key: The lookup key derived from the path, if any.
+        :type key: Optional[str]
+        :param text: The text to match.
+        :type text: str
+        :return: The highest matching rule index, or -1 if none matches.
+        :rtype: int
+        """
+        best = -1
+        if key is not None:
+            matcher = self.buckets.get(key)
+            if matcher is not None:
+                m = matcher(text)
+                if m:
+                    best = int(m.lastgroup[1:])
+        if self.fallback is not None:
+            m = self.fallback(text)
+            if m:
+                best = max(best, int(m.lastgroup[1:]))
+        return best
+
+
+class IgnoreRules:
+    """
+    The compiled rules of a single ignore file. Paths are matched relative to
+    the directory the file applies to, and the last matching rule wins.
+
+    Rules are indexed rather than tried one by one: plain names and extensions
+    go into hash tables, basename globs are bucketed by extension or initial
+    character, anchored patterns by their first path component, and only the
+    remaining rules are searched individually. Every index reports the highest-numbered matching
+    rule, which preserves the last-match-wins semantics of negations.
+    """
+    def __init__(self, lines: Iterable[str], source: str = ""):
+        """
+        Compiles the rules from the lines of an ignore file.
+
+        :param lines: The raw lines of the ignore file.
+        :type lines: Iterable[str]
+        :param source: The ignore file's location, used for diagnostics only.
+        :type source: str
+        """
+        self._reset(source)
+        rule_from_pattern = _import_rule_translator()
+        for line_no, line in enumerate(lines, start=1):
+            rule = rule_from_pattern(line.rstrip("\n"), source=(source, line_no))
+            if not rule:
+                continue
+            regex = rule.regex
+            # Negated directory rules expect a trailing slash on the path. Directory-only
+            # rules are matched against directories alone here, so use the plain form.
+            if rule.directory_only and regex.endswith("/$"):
+                regex = regex[:-2] + _DIR_TAIL
+            self._add_rule(len(self.negations), regex, rule.directory_only)
+            self.negations.append(rule.negation)
+        self._compile()
+
+    @classmethod
+    def _from_state(cls, state: tuple, source: str) -> "IgnoreRules":
+        """
+        Restores rules from `__getstate__` for another location of the same ignore file.
+
+        :param state: The plain data of the rules.
+        :type state: tuple
+        :param source: The ignore file's location, used for diagnostics only.
+        :type source: str
+        :return: The rules.
+        :rtype: IgnoreRules
+        """
+        rules = cls.__new__(cls)
+        rules.__setstate__((source, *state[1:]))
+        return rules
+
+    def _reset(self, source: str) -> None:
+        """
+        Initializes empty rule tables.
+        """
+        self.source = source
+        self.negations: List[bool] = []
+        self.names: Dict[str, int] = {}
+        self.dir_names: Dict[str, int] = {}
+        self.suffixes: Dict[str, int] = {}
+        self.extension_index = _PatternIndex("fullmatch")
+        self.initial_index = _PatternIndex("fullmatch")
+        self.anchored_index = _PatternIndex("match")
+        self.dir_anchored_index = _PatternIndex("match")
+        self.generic: List[Tuple[int, re.Pattern, bool]] = []
+
+    def _compile(self) -> None:
+        """
+        Prepares the indexes once all rules are added.
+        """
+        self.extension_index.compile()
+        self.initial_index.compile()
+        self.anchored_index.compile()
+        self.dir_anchored_index.compile()
+        self.generic.sort(key=lambda item: item[0], reverse=True)
+
+    def __getstate__(self) -> tuple:
+        """
+        Returns the rules as plain data: the source, the classified rules and
+        the regex sources. This is what the rule cache stores, and what worker
+        processes receive instead of compiled regexes.
+
+        :return: A tuple that `marshal` can serialize.
+        :rtype: tuple
+        """
+        return (self.source, self.negations, self.names, self.dir_names, self.suffixes,
+                self.extension_index.entries, self.initial_index.entries,
+                self.anchored_index.entries, self.dir_anchored_index.entries,
+                [(index, pattern.pattern, directory_only) for index, pattern, directory_only in self.generic])
+
+    def __setstate__(self, state: tuple) -> None:
+        """
+        Restores rules from `__getstate__`, without gitignore-parser.
+
+        :param state: The plain data of the rules.
+        :type state: tuple
+        """
+        self._reset(state[0])
+        self.negations, self.names, self.dir_names, self.suffixes = state[1:5]
+        for index, entries in zip((self.extension_index, self.initial_index,
+                                   self.anchored_index, self.dir_anchored_index), state[5:9]):
+            index.entries = entries
+        self.generic = [(index, re.compile(regex), directory_only) for index, regex, directory_only in state[9]]
+        self._compile()
+
+    def _add_rule(self, index: int, regex: str, directory_only: bool) -> None:
+        """
+        Files a rule's regex under the cheapest index that answers it exactly.
+
+        :param index: The rule's position in the file.
+        :type index: int
+        :param regex: The rule's regex.
+        :type regex: str
+        :param directory_only: Whether the rule applies to directories only.
+        :type directory_only: bool
+        """
+        tail = _DIR_TAIL if directory_only else _FILE_TAIL
+        if regex.startswith(_UNANCHORED_PREFIX) and regex.endswith(tail):
+            body = regex[len(_UNANCHORED_PREFIX):-len(tail)]
+            name = _unescape_literal(body)
+            if name is not None:
+                table = self.dir_names if directory_only else self.names
+                table[name] = index
+                return
+            if not directory_only:
+                if body.startswith(_NONSEP_STAR):
+                    suffix = _unescape_literal(body[len(_NONSEP_STAR):])
+                    if suffix is not None and suffix.startswith("."):
+                        self.suffixes[suffix] = index
+                        return
+                # A glob that cannot match a separator only ever matches the basename
+                tokens = list(_regex_tokens(body))
+                if not any(kind == "sep" or (kind == "meta" and text == ".") or
+                           (kind == "meta" and text.startswith("[^") and text != _NONSEP_CLASS)
+                           for kind, text in tokens):
+                    literal_tail = ""
+                    for kind, text in tokens:
+                        literal_tail = literal_tail + text if kind == "literal" else ""
+                    dot = literal_tail.rfind(".")
+                    if dot != -1:
+                        self.extension_index.add(literal_tail[dot:], index, body)
+                    else:
+                        first_kind, first_text = tokens[0] if tokens else ("meta", "")
+                        self.initial_index.add(first_text if first_kind == "literal" else None,
+                                               index, body)
+                    return
+        elif regex.startswith("^") and regex.endswith(tail):
+            head = ""
+            for kind, text in _regex_tokens(regex[1:-len(tail)]):
+                if kind != "literal":
+                    if kind != "sep":
+                        head = ""
+                    break
+                head += text
+            target = self.dir_anchored_index if directory_only else self.anchored_index
+            target.add(head or None, index, regex[1:])
+            return
+        self.generic.append((index, re.compile(regex), directory_only))
+
+    def __bool__(self) -> bool:
+        return bool(self.negations)
+
+    def match(self, relative_path: str, is_dir: bool) -> Optional[bool]:
+        """
+        Evaluates the rules against a path.
+
+        :param relative_path: The POSIX path relative to the ignore file's directory.
+        :type relative_path: str
+        :param is_dir: Whether the path is a directory.
+        :type is_dir: bool
+        :return: True if ignored, False if re-included by a negation, None if no rule matches.
+        :rtype: Optional[bool]
+        """
+        basename = relative_path.rpartition("/")[2]
+        best = self.names.get(basename, -1)
+        if self.suffixes:
+            dot = basename.find(".")
+            while dot != -1:
+                best = max(best, self.suffixes.get(basename[dot:], -1))
+                dot = basename.find(".", dot + 1)
+        dot = basename.rfind(".")
+        best = max(best, self.extension_index.best(basename[dot:] if dot != -1 else None, basename))
+        best = max(best, self.initial_index.best(basename[:1], basename))
+        first_component = relative_path.partition("/")[0]
+        best = max(best, self.anchored_index.best(first_component, relative_path))
+        if is_dir:
+            if self.dir_names:
+                for component in relative_path.split("/"):
+                    best = max(best, self.dir_names.get(component, -1))
+            best = max(best, self.dir_anchored_index.best(first_component, relative_path))
+        for index, pattern, directory_only in self.generic:
+            if index <= best:
+                break
+            if (is_dir or not directory_only) and pattern.search(relative_path):
+                best = index
+                break
+        return None if best < 0 else not self.negations[best]
+
+
+# Identifies the code that produced cached rules; computed by `_rule_cache_tag`.
+_rule_cache_tag_value: Optional[bytes] = None
+
+
+def _rule_cache_tag() -> bytes:
+    """
+    Identifies the code that compiles ignore rules: the cache format, the Python
+    version, and the size and mtime of this file and of gitignore-parser, so that
+    rules compiled by other code are never loaded from the cache.
+
+    :return: The tag, hashed together with the content of each ignore file.
+    :rtype: bytes
+    """
+    global _rule_cache_tag_value
+    if _rule_cache_tag_value is None:
+        import importlib.util
+        spec = importlib.util.find_spec("gitignore_parser")
+        parts = [str(RULE_CACHE_VERSION), sys.version]
+        for origin in (__file__, spec.origin if spec is not None else None):
+            try:
+                st = os.stat(origin)
+                parts.append(f"{origin}:{st.st_size}:{st.st_mtime_ns}")
+            except (OSError, TypeError):
+                parts.append(str(origin))
+        _rule_cache_tag_value = "\0".join(parts).encode("utf-8", errors="surrogateescape")
+    return _rule_cache_tag_value
+
+
+# A chain of (prefix length, rules) pairs ordered from lowest to highest precedence.
+IgnoreLayers = Tuple[Tuple[int, IgnoreRules], ...]
+
+
+def _find_git_dir(root_dir: Path) -> Optional[Path]:
+    """
+    Locates the git directory of a work tree, following `gitdir:` pointer files
+    used by linked work trees and submodules.
+
+    :param root_dir: The work tree root.
+    :type root_dir: Path
+    :return: The git directory, or None if root_dir is not a work tree root.
+    :rtype: Optional[Path]
+    """
+    dot_git = root_dir / ".git"
+    if dot_git.is_dir():
+        return dot_git
+    if dot_git.is_file():
+        try:
+            content = dot_git.read_text(encoding="utf-8", errors="ignore").strip()
+        except OSError:
+            return None
+        if content.startswith("gitdir:"):
+            git_dir = Path(content[len("gitdir:"):].strip())
+            return git_dir if git_dir.is_absolute() else (root_dir / git_dir).resolve()
+    return None
+
+
+def _find_global_excludes(git_dir: Optional[Path]) -> Path:
+    """
+    Resolves the global excludes file the way git does: the last `core.excludesFile`
+    found in the user and repository config files, else `$XDG_CONFIG_HOME/git/ignore`.
+
+    :param git_dir: The repository's git directory, if any.
+    :type git_dir: Optional[Path]
+    :return: The path of the global excludes file, which may not exist.
+    :rtype: Path
+    """
+    xdg_config = Path(os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config")
+    config_files = [xdg_config / "git" / "config", Path.home() / ".gitconfig"]
+    if git_dir is not None:
+        config_files.append(git_dir / "config")
+
+    excludes_file = xdg_config / "git" / "ignore"
+    section_re = re.compile(r'^\s*\[\s*([^\]\s"]+)')
+    key_re = re.compile(r"^\s*excludesfile\s*=\s*(.*?)\s*$", re.IGNORECASE)
+    for config_file in config_files:
+        try:
+            lines = config_file.read_text(encoding="utf-8", errors="ignore").splitlines()
+        except OSError:
+            continue
+        section = ""
+        for line in lines:
+            section_match = section_re.match(line)
+            if section_match:
+                section = section_match.group(1).lower()
+                continue
+            key_match = key_re.match(line)
+            if section == "core" and key_match:
+                excludes_file = Path(os.path.expanduser(key_match.group(1).strip('"')))
+    return excludes_file
+
+def _default_cache_dir() -> Path:
+    """
+    Returns the per-user cache directory of repomix, following the XDG base directory spec.
+
+    :return: The cache directory, which may not exist.
+    :rtype: Path
+    """
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "repomix"
+
+# --- Git Index ---
+
+GIT_INDEX_SIGNATURE: Final[bytes] = b"DIRC"
+GIT_MODE_GITLINK: Final[int] = 0o160000
+GIT_INDEX_ENTRY_FIXED_BYTES: Final[int] = 40
+
+
+def _git_hash_size(git_dir: Path) -> int:
+    """
+    Returns the object id size of a repository: 32 bytes for SHA-256 repositories, else 20.
+
+    :param git_dir: The repository's git directory.
+    :type git_dir: Path
+    :return: The object id size in bytes.
+    :rtype: int
+    """
+    try:
+        config = (git_dir / "config").read_text(encoding="utf-8", errors="ignore")
+    except OSError:
+        return 20
+    return 32 if re.search(r"^\s*objectformat\s*=\s*sha256\s*$", config, re.IGNORECASE | re.MULTILINE) else 20
+
+
+def _read_git_index(index_path: Path, hash_size: int = 20) -> List[str]:
+    """
+    Parses a git index file (versions 2 to 4) and returns the paths of the
+    tracked files, excluding submodules, in index order.
+
+    :param index_path: The path of the index file.
+    :type index_path: Path
+    :param hash_size: The object id size in bytes.
+    :type hash_size: int
+    :return: The tracked POSIX paths relative to the work tree root.
+    :rtype: List[str]
+    :raises ValueError: If the index format is not supported, e.g. a split or sparse index.
+    :raises OSError: If the index cannot be read.
+    """
+    data = index_path.read_bytes()
+    if len(data) < 12 or data[:4] != GIT_INDEX_SIGNATURE:
+        raise ValueError("not a git index file")
+    version, count = struct.unpack_from(">II", data, 4)
+    if version not in (2, 3, 4):
+        raise ValueError(f"unsupported index version {version}")
+
+    paths: List[str] = []
+    pos = 12
+    previous = b""
+    for _ in range(count):
+        entry_start = pos
+        mode = struct.unpack_from(">I", data, pos + 24)[0]
+        pos += GIT_INDEX_ENTRY_FIXED_BYTES + hash_size
+        flags = struct.unpack_from(">H", data, pos)[0]
+        pos += 2
+        if version >= 3 and flags & 0x4000:
+            pos += 2
+        if version == 4:
+            # The path is stored as a varint count of bytes to drop from the previous path
+            byte = data[pos]
+            pos += 1
+            strip = byte & 0x7F
+            while byte & 0x80:
+                byte = data[pos]
+                pos += 1
+                strip = ((strip + 1) << 7) | (byte & 0x7F)
+            end = data.index(b"\0", pos)
+            name = previous[:len(previous) - strip] + data[pos:end]
+            pos = end + 1
+        else:
+            end = data.index(b"\0", pos)
+            name = data[pos:end]
+            # Entries are NUL-padded to a multiple of eight bytes
+            pos = entry_start + ((end - entry_start + 8) & ~7)
+        previous = name
+        if mode & 0o170000 == 0o040000:
+            raise ValueError("sparse index directory entries are not supported")
+        if mode & 0o170000 == GIT_MODE_GITLINK:
+            continue
+        path = os.fsdecode(name)
+        # Unmerged paths have one entry per stage
+        if not paths or paths[-1] != path:
+            paths.append(path)
+
+    # Extensions follow the entries; a split index keeps most entries elsewhere
+    while pos + 8 <= len(data) - hash_size:
+        signature, size = struct.unpack_from(">4sI", data, pos)
+        if signature == b"link":
+            raise ValueError("split index is not supported")
+        pos += 8 + size
+    return paths
+
+# --- Git Object Store ---
+
+GIT_OBJECT_TYPES: Final[Dict[int, str]] = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+GIT_OFS_DELTA: Final[int] = 6
+GIT_REF_DELTA: Final[int] = 7
+GIT_PACK_INDEX_MAGIC: Final[bytes] = b"\377tOc"
+GIT_MODE_TYPE_MASK: Final[int] = 0o170000
+GIT_MODE_TREE: Final[int] = 0o040000
+GIT_MODE_FILE: Final[int] = 0o100000
+# Packed objects are inflated from windows of the memory-mapped pack of this size.
+GIT_INFLATE_WINDOW_BYTES: Final[int] = 64 * 1024
+# Delta bases kept in memory. Packs chain the versions of a file against each other,
+# so a base is usually needed again by the next object of the chain.
+GIT_DELTA_BASE_CACHE_BYTES: Final[int] = 32 << 20
+GIT_MAX_SYMREF_DEPTH: Final[int] = 5
+
+
+def _apply_git_delta(base: bytes, delta: bytes) -> bytes:
+    """
+    Applies a git delta, a sequence of copy-from-base and insert instructions, to its base.
+
+    :param base: The base object's content.
+    :type base: bytes
+    :param delta: The inflated delta.
+    :type delta: bytes
+    :return: The target object's content.
+    :rtype: bytes
+    :raises ValueError: If the delta does not fit the base.
+    """
+    pos = 0
+    sizes = []
+    for _ in range(2):
+        size = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        sizes.append(size)
+    if sizes[0] != len(base):
+        raise ValueError("git delta does not match its base")
+
+    parts = []
+    end = len(delta)
+    while pos < end:
+        opcode = delta[pos]
+        pos += 1
+        if opcode & 0x80:
+            # Copy: up to four offset bytes and three size bytes follow, as flagged
+            offset = size = 0
+            for bit in range(4):
+                if opcode & (1 << bit):
+                    offset |= delta[pos] << (8 * bit)
+                    pos += 1
+            for bit in range(3):
+                if opcode & (0x10 << bit):
+                    size |= delta[pos] << (8 * bit)
+                    pos += 1
+            parts.append(base[offset:offset + (size or 0x10000)])
+        elif opcode:
+            parts.append(delta[pos:pos + opcode])
+            pos += opcode
+        else:
+            raise ValueError("invalid git delta instruction")
+    result = b"".join(parts)
+    if len(result) != sizes[1]:
+        raise ValueError("git delta produced the wrong size")
+    return result
+
+
+class _GitPack:
+    """
+    A packfile and its version 2 index. The index is read whole; the pack is
+    memory-mapped on first use, so objects are inflated without copying the file.
+    """
+    def __init__(self, index_path: Path, hash_size: int):
+        """
+        :param index_path: The path of the `.idx` file.
+        :type index_path: Path
+        :param hash_size: The object id size in bytes.
+        :type hash_size: int
+        :raises ValueError: If the index format is not supported.
+        :raises OSError: If the index cannot be read.
+        """
+        self._index = index_path.read_bytes()
+        if self._index[:4] != GIT_PACK_INDEX_MAGIC or struct.unpack_from(">I", self._index, 4)[0] != 2:
+            raise ValueError(f"unsupported pack index {index_path}")
+        self.fanout = struct.unpack_from(">256I", self._index, 8)
+        self.count = self.fanout[255]
+        self.hash_size = hash_size
+        self.path = index_path.with_suffix(".pack")
+        self._names_start = 8 + 256 * 4
+        # Object names, then a CRC32 per object, then 31-bit offsets, then 64-bit offsets
+        self._offsets_start = self._names_start + self.count * (hash_size + 4)
+        self._large_offsets_start = self._offsets_start + self.count * 4
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _name(self, position: int) -> bytes:
+        start = self._names_start + position * self.hash_size
+        return self._index[start:start + self.hash_size]
+
+    def _bucket(self, first_byte: int) -> Tuple[int, int]:
+        return (self.fanout[first_byte - 1] if first_byte else 0), self.fanout[first_byte]
+
+    def find(self, oid: bytes) -> Optional[int]:
+        """
+        Looks up an object by a binary search of the sorted names.
+
+        :param oid: The object id.
+        :type oid: bytes
+        :return: The object's offset in the pack, or None if the pack does not contain it.
+        :rtype: Optional[int]
+        """
+        lo, hi = self._bucket(oid[0])
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name = self._name(mid)
+            if name < oid:
+                lo = mid + 1
+            elif name > oid:
+                hi = mid
+            else:
+                offset = struct.unpack_from(">I", self._index, self._offsets_start + 4 * mid)[0]
+                if offset & 0x80000000:
+                    offset = struct.unpack_from(">Q", self._index,
+                                                self._large_offsets_start + 8 * (offset & 0x7FFFFFFF))[0]
+                return offset
+        return None
+
+    def find_prefix(self, prefix: str) -> List[bytes]:
+        """
+        :param prefix: At least two lowercase hex digits of an object id.
+        :type prefix: str
+        :return: The ids of the objects whose hex name starts with prefix.
+        :rtype: List[bytes]
+        """
+        lo, hi = self._bucket(int(prefix[:2], 16))
+        return [name for name in map(self._name, range(lo, hi)) if name.hex().startswith(prefix)]
+
+    def data(self):
+        """
+        :return: The memory-mapped pack.
+        :rtype: mmap.mmap
+        :raises OSError: If the pack cannot be opened.
+        """
+        if self._map is None:
+            import mmap
+            with self._lock:
+                if self._map is None:
+                    with open(self.path, "rb") as f:
+                        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def header(self, offset: int) -> Tuple[int, int, int]:
+        """
+        Parses the header of a packed object: a type and a varint size.
+
+        :param offset: The object's offset in the pack.
+        :type offset: int
+        :return: The type number, the inflated size and the offset following the header.
+        :rtype: Tuple[int, int, int]
+        """
+        data = self.data()
+        byte = data[offset]
+        type_number = (byte >> 4) & 7
+        size = byte & 0x0F
+        shift = 4
+        pos = offset + 1
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+        return type_number, size, pos
+
+    def inflate(self, pos: int, size: int) -> bytes:
+        """
+        Inflates the zlib stream of a packed object.
+
+        :param pos: The offset of the stream in the pack.
+        :type pos: int
+        :param size: The inflated size from the object header.
+        :type size: int
+        :return: The inflated data.
+        :rtype: bytes
+        :raises ValueError: If the stream is truncated or has the wrong size.
+        """
+        data = self.data()
+        decompressor = zlib.decompressobj()
+        parts = []
+        # Compressed objects are rarely larger than their content, so one window usually suffices
+        window = size + 64
+        while not decompressor.eof:
+            chunk = data[pos:pos + window]
+            if not chunk:
+                raise ValueError(f"truncated object in {self.path}")
+            pos += len(chunk)
+            parts.append(decompressor.decompress(chunk))
+            window = GIT_INFLATE_WINDOW_BYTES
+        result = b"".join(parts)
+        if len(result) != size:
+            raise ValueError(f"object of the wrong size in {self.path}")
+        return result
+
+
+class _GitObjectStore:
+    """
+    Reads objects straight from a repository's object database without running
+    git: loose objects, and packed objects with their delta chains resolved.
+    Alternates and the common directory of linked work trees are followed.
+    Safe to use from worker threads.
+    """
+    def __init__(self, git_dir: Path):
+        """
+        :param git_dir: The git directory, or a bare repository.
+        :type git_dir: Path
+        """
+        self.git_dir = git_dir
+        self.common_dir = git_dir
+        try:
+            common = (git_dir / "commondir").read_text(encoding="utf-8").strip()
+            self.common_dir = (git_dir / common).resolve()
+        except OSError:
+            pass
+        self.hash_size = _git_hash_size(self.common_dir)
+        self.object_dirs = [self.common_dir / "objects"]
+        try:
+            alternates = (self.common_dir / "objects" / "info" / "alternates").read_text(encoding="utf-8")
+        except OSError:
+            alternates = ""
+        for line in alternates.splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                self.object_dirs.append((self.common_dir / "objects" / line).resolve())
+        self.packs: List[_GitPack] = []
+        for object_dir in self.object_dirs:
+            for index_path in sorted((object_dir / "pack").glob("pack-*.idx")):
+                try:
+                    self.packs.append(_GitPack(index_path, self.hash_size))
+                except (OSError, ValueError, struct.error) as e:
+                    logging.warning(f"Skipping pack {index_path}: {e}")
+        self._packed_refs: Optional[Dict[str, bytes]] = None
+        self._bases: "OrderedDict[Tuple[int, int], Tuple[str, bytes]]" = OrderedDict()
+        self._bases_bytes = 0
+        self._lock = threading.Lock()
+
+    def read(self, oid: bytes) -> Tuple[str, bytes]:
+        """
+        Reads an object.
+
+        :param oid: The object id.
+        :type oid: bytes
+        :return: The object type ("commit", "tree", "blob" or "tag") and its content.
+        :rtype: Tuple[str, bytes]
+        :raises ValueError: If the object is missing or corrupt.
+        :raises OSError: If the object database cannot be read.
+        """
+        try:
+            for pack_number, pack in enumerate(self.packs):
+                offset = pack.find(oid)
+                if offset is not None:
+                    return self._read_packed(pack_number, offset)
+            for object_dir in self.object_dirs:
+                hex_id = oid.hex()
+                try:
+                    raw = zlib.decompress((object_dir / hex_id[:2] / hex_id[2:]).read_bytes())
+                except FileNotFoundError:
+                    continue
+                header, _, content = raw.partition(b"\0")
+                kind, _, size = header.partition(b" ")
+                if not size.isdigit() or int(size) != len(content):
+                    raise ValueError(f"corrupt git object {hex_id}")
+                return kind.decode("ascii", errors="replace"), content
+        except (zlib.error, IndexError, struct.error) as e:
+            raise ValueError(f"corrupt git object {oid.hex()}: {e}") from e
+        raise ValueError(f"missing git object {oid.hex()}")
+
+    def _read_packed(self, pack_number: int, offset: int) -> Tuple[str, bytes]:
+        """
+        Reads a packed object, following its delta chain down to a full object
+        or a cached base and applying the deltas back up.
+
+        :param pack_number: The index of the pack in `packs`.
+        :type pack_number: int
+        :param offset: The object's offset in the pack.
+        :type offset: int
+        :return: The object type and its content.
+        :rtype: Tuple[str, bytes]
+        """
+        pack = self.packs[pack_number]
+        chain = []
+        while True:
+            with self._lock:
+                cached = self._bases.get((pack_number, offset))
+                if cached is not None:
+                    self._bases.move_to_end((pack_number, offset))
+            if cached is not None:
+                kind, content = cached
+                break
+            type_number, size, pos = pack.header(offset)
+            if type_number in GIT_OBJECT_TYPES:
+                kind, content = GIT_OBJECT_TYPES[type_number], pack.inflate(pos, size)
+                if chain:
+                    self._remember(pack_number, offset, kind, content)
+                break
+            data = pack.data()
+            if type_number == GIT_OFS_DELTA:
+                # The base precedes the object at a varint distance
+                byte = data[pos]
+                pos += 1
+                distance = byte & 0x7F
+                while byte & 0x80:
+                    byte = data[pos]
+                    pos += 1
+                    distance = ((distance + 1) << 7) | (byte & 0x7F)
+                chain.append((offset, pos, size))
+                offset -= distance
+            elif type_number == GIT_REF_DELTA:
+                base_oid = bytes(data[pos:pos + self.hash_size])
+                chain.append((offset, pos + self.hash_size, size))
+                kind, content = self.read(base_oid)
+                break
+            else:
+                raise ValueError(f"unknown object type {type_number} in {pack.path}")
+
+        for depth, (delta_offset, pos, size) in enumerate(reversed(chain), 1):
+            content = _apply_git_delta(content, pack.inflate(pos, size))
+            # Intermediate results are the bases of the rest of the chain
+            if depth < len(chain):
+                self._remember(pack_number, delta_offset, kind, content)
+        return kind, content
+
+    def _remember(self, pack_number: int, offset: int, kind: str, content: bytes) -> None:
+        """
+        Adds a delta base to the bounded cache, evicting the least recently used ones.
+        """
+        if len(content) > GIT_DELTA_BASE_CACHE_BYTES // 4:
+            return
+        with self._lock:
+            key = (pack_number, offset)
+            if key in self._bases:
+                return
+            self._bases[key] = (kind, content)
+            self._bases_bytes += len(content)
+            while self._bases_bytes > GIT_DELTA_BASE_CACHE_BYTES:
+                _, (_, evicted) = self._bases.popitem(last=False)
+                self._bases_bytes -= len(evicted)
+
+    def size(self, oid: bytes) -> int:
+        """
+        Returns the size of an object's content, reading only object and delta headers.
+
+        :param oid: The object id.
+        :type oid: bytes
+        :return: The size in bytes.
+        :rtype: int
+        :raises ValueError: If the object is missing or corrupt.
+        :raises OSError: If the object database cannot be read.
+        """
+        try:
+            for pack in self.packs:
+                offset = pack.find(oid)
+                if offset is None:
+                    continue
+                type_number, size, pos = pack.header(offset)
+                if type_number in GIT_OBJECT_TYPES:
+                    return size
+                data = pack.data()
+                if type_number == GIT_OFS_DELTA:
+                    while data[pos] & 0x80:
+                        pos += 1
+                    pos += 1
+                else:
+                    pos += self.hash_size
+                # The delta starts with the varint sizes of its base and of its target
+                head = zlib.decompressobj().decompress(data[pos:pos + 1024], 32)
+                pos = 0
+                while head[pos] & 0x80:
+                    pos += 1
+                size = shift = 0
+                for byte in head[pos + 1:]:
+                    size |= (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        return size
+                raise ValueError(f"corrupt git object {oid.hex()}")
+            for object_dir in self.object_dirs:
+                hex_id = oid.hex()
+                try:
+                    raw = (object_dir / hex_id[:2] / hex_id[2:]).read_bytes()
+                except FileNotFoundError:
+                    continue
+                header = zlib.decompressobj().decompress(raw, 64).partition(b"\0")[0]
+                return int(header.partition(b" ")[2])
+        except (zlib.error, IndexError, struct.error) as e:
+            raise ValueError(f"corrupt git object {oid.hex()}: {e}") from e
+        raise ValueError(f"missing git object {oid.hex()}")
+
+    def read_typed(self, oid: bytes, kind: str) -> bytes:
+        """
+        :param oid: The object id.
+        :type oid: bytes
+        :param kind: The expected object type.
+        :type kind: str
+        :return: The object's content.
+        :rtype: bytes
+        :raises ValueError: If the object is missing, corrupt or of another type.
+        """
+        actual, content = self.read(oid)
+        if actual != kind:
+            raise ValueError(f"git object {oid.hex()} is a {actual}, not a {kind}")
+        return content
+
+    def read_tree(self, oid: bytes) -> List[Tuple[int, bytes, bytes]]:
+        """
+        Parses a tree object. Entries are in git's tree order, sorted by name
+        with directory names compared as if followed by "/".
+
+        :param oid: The tree id.
+        :type oid: bytes
+        :return: (mode, name, object id) for each entry.
+        :rtype: List[Tuple[int, bytes, bytes]]
+        :raises ValueError: If the tree is missing or corrupt.
+        """
+        data = self.read_typed(oid, "tree")
+        entries = []
+        pos = 0
+        try:
+            while pos < len(data):
+                space = data.index(b" ", pos)
+                end = data.index(b"\0", space)
+                entry_oid = data[end + 1:end + 1 + self.hash_size]
+                if len(entry_oid) != self.hash_size:
+                    raise ValueError("truncated entry")
+                entries.append((int(data[pos:space], 8), data[space + 1:end], entry_oid))
+                pos = end + 1 + self.hash_size
+        except ValueError as e:
+            raise ValueError(f"corrupt git tree {oid.hex()}: {e}") from e
+        return entries
+
+    def _read_ref(self, name: str, depth: int = 0) -> Optional[bytes]:
+        """
+        Reads a loose or packed ref, following symbolic refs.
+
+        :param name: The full ref name, e.g. "HEAD" or "refs/tags/v1".
+        :type name: str
+        :param depth: The number of symbolic refs followed so far.
+        :type depth: int
+        :return: The object id, or None if the ref does not exist.
+        :rtype: Optional[bytes]
+        """
+        if depth > GIT_MAX_SYMREF_DEPTH:
+            raise ValueError(f"symbolic ref loop at {name}")
+        for ref_dir in dict.fromkeys((self.git_dir, self.common_dir)):
+            try:
+                content = (ref_dir / name).read_text(encoding="utf-8", errors="ignore").strip()
+            except OSError:
+                continue
+            if content.startswith("ref:"):
+                return self._read_ref(content[len("ref:"):].strip(), depth + 1)
+            if re.fullmatch(r"[0-9a-f]+", content) and len(content) == 2 * self.hash_size:
+                return bytes.fromhex(content)
+        if self._packed_refs is None:
+            self._packed_refs = {}
+            try:
+                lines = (self.common_dir / "packed-refs").read_text(encoding="utf-8", errors="ignore").splitlines()
+            except OSError:
+                lines = []
+            for line in lines:
+                # Comments, and peeled tag lines starting with "^", are not refs
+                oid, _, ref = line.partition(" ")
+                if ref and not line.startswith(("#", "^")):
+                    self._packed_refs[ref.strip()] = bytes.fromhex(oid)
+        return self._packed_refs.get(name)
+
+    def _resolve_name(self, name: str) -> bytes:
+        """
+        Resolves a ref name, in the order `git rev-parse` tries them, or a full
+        or abbreviated object id.
+
+        :param name: The name.
+        :type name: str
+        :return: The object id.
+        :rtype: bytes
+        :raises ValueError: If the name is unknown or ambiguous.
+        """
+        if re.fullmatch(r"[0-9a-fA-F]+", name) and len(name) == 2 * self.hash_size:
+            return bytes.fromhex(name)
+        if name and ".." not in name:
+            for ref in (name, f"refs/{name}", f"refs/tags/{name}", f"refs/heads/{name}",
+                        f"refs/remotes/{name}", f"refs/remotes/{name}/HEAD"):
+                oid = self._read_ref(ref)
+                if oid is not None:
+                    return oid
+        if re.fullmatch(r"[0-9a-fA-F]{4,}", name):
+            prefix = name.lower()
+            matches = set()
+            for pack in self.packs:
+                matches.update(pack.find_prefix(prefix))
+            for object_dir in self.object_dirs:
+                try:
+                    names = os.listdir(object_dir / prefix[:2])
+                except OSError:
+                    continue
+                matches.update(bytes.fromhex(prefix[:2] + entry) for entry in names
+                               if entry.startswith(prefix[2:]) and len(entry) == 2 * self.hash_size - 2)
+            if len(matches) == 1:
+                return matches.pop()
+            if matches:
+                raise ValueError(f"ambiguous revision: {name}")
+        raise ValueError(f"unknown revision: {name}")
+
+    def lookup(self, tree_oid: bytes, path: str) -> Optional[bytes]:
+        """
+        Finds a regular file in a tree.
+
+        :param tree_oid: The root tree id.
+        :type tree_oid: bytes
+        :param path: The POSIX path of the file relative to the tree.
+        :type path: str
+        :return: The blob id, or None if the tree has no regular file at path.
+        :rtype: Optional[bytes]
+        :raises ValueError: If a tree on the path cannot be read.
+        """
+        oid = tree_oid
+        names = path.split("/")
+        for depth, name in enumerate(names):
+            kind = GIT_MODE_TREE if depth < len(names) - 1 else GIT_MODE_FILE
+            name_bytes = os.fsencode(name)
+            entry = next(((mode, entry_oid) for mode, entry_name, entry_oid in self.read_tree(oid)
+                          if entry_name == name_bytes), None)
+            if entry is None or entry[0] & GIT_MODE_TYPE_MASK != kind:
+                return None
+            oid = entry[1]
+        return oid
+
+    def diff_trees(self, base_oid: bytes, tree_oid: bytes) -> List[Tuple[str, bytes]]:
+        """
+        Lists the regular files of a tree that were added or changed relative to a
+        base tree. Subtrees with the same id on both sides are identical and are
+        never read, so the cost follows the size of the change, not of the tree.
+
+        :param base_oid: The base tree id.
+        :type base_oid: bytes
+        :param tree_oid: The tree id.
+        :type tree_oid: bytes
+        :return: (POSIX path, blob id) of each added or changed file, in no particular order.
+        :rtype: List[Tuple[str, bytes]]
+        :raises ValueError: If a tree cannot be read.
+        """
+        changed = []
+        pending = [(base_oid, tree_oid, "")]
+        while pending:
+            base_oid, tree_oid, prefix = pending.pop()
+            base_entries = ({name: (mode, oid) for mode, name, oid in self.read_tree(base_oid)}
+                            if base_oid is not None else {})
+            for mode, name, oid in self.read_tree(tree_oid):
+                base_entry = base_entries.get(name)
+                if base_entry == (mode, oid):
+                    continue
+                path = prefix + os.fsdecode(name)
+                kind = mode & GIT_MODE_TYPE_MASK
+                if kind == GIT_MODE_TREE:
+                    # A subtree replacing a file is compared against nothing
+                    base_subtree = (base_entry[1] if base_entry is not None
+                                    and base_entry[0] & GIT_MODE_TYPE_MASK == GIT_MODE_TREE else None)
+                    pending.append((base_subtree, oid, path + "/"))
+                elif kind == GIT_MODE_FILE:
+                    changed.append((path, oid))
+        return changed
+
+    def _peel(self, oid: bytes, kind: Optional[str]) -> bytes:
+        """
+        Dereferences tags, and commits when a tree is wanted, down to an object of a type.
+
+        :param oid: The object id.
+        :type oid: bytes
+        :param kind: "commit", "tree", "blob" or "tag", or None for the first object that is not a tag.
+        :type kind: Optional[str]
+        :return: The id of the object of that type.
+        :rtype: bytes
+        :raises ValueError: If the object cannot be peeled to that type.
+        """
+        while True:
+            actual, content = self.read(oid)
+            if actual == kind or (kind is None and actual != "tag"):
+                return oid
+            field = {"tag": b"object ", "commit": b"tree "}.get(actual)
+            if field is None or (actual == "commit" and kind != "tree"):
+                raise ValueError(f"git object {oid.hex()} is a {actual}, not a {kind}")
+            oid = bytes.fromhex(content[len(field):content.index(b"\n")].decode("ascii"))
+
+    def resolve(self, rev: str) -> Tuple[bytes, bytes]:
+        """
+        Resolves a revision: a ref, tag or branch name, or an object id, optionally
+        followed by `~N` and `^N` parent steps and by `^{}` or `^{type}` peeling, as
+        in `git rev-parse`. Other forms, such as `@{...}`, `^{/text}` or `:path`,
+        are rejected.
+
+        :param rev: The revision.
+        :type rev: str
+        :return: The ids of the commit, or of the object the revision names if it is
+                 not a commit, and of its tree.
+        :rtype: Tuple[bytes, bytes]
+        :raises ValueError: If the revision cannot be resolved or uses unsupported syntax.
+        """
+        match = re.fullmatch(r"(.*?)((?:\^\{\w*\}|[~^]\d*)*)", rev)
+        if re.search(r"[~^:{}]", match.group(1)):
+            raise ValueError(f"unsupported revision syntax: {rev} (use names, object ids,"
+                             f" ~N, ^N, ^{{}} and ^{{type}})")
+        oid = self._resolve_name(match.group(1))
+        for kind, step, number in re.findall(r"\^\{(\w*)\}|([~^])(\d*)", match.group(2)):
+            if not step:
+                # "^{}" peels tags, "^{type}" peels down to that type, "^{object}" only names the object
+                if kind not in ("", "object", "commit", "tree", "blob", "tag"):
+                    raise ValueError(f"revision {rev}: unknown object type {kind}")
+                oid = self._peel(oid, kind or None) if kind != "object" else oid
+                continue
+            count = int(number) if number else 1
+            # "~N" follows N first parents, "^N" selects the Nth parent
+            for nth in ([1] * count if step == "~" else [count] if count else []):
+                commit = self.read_typed(self._peel(oid, "commit"), "commit")
+                headers = commit.partition(b"\n\n")[0].split(b"\n")
+                parents = [line[len(b"parent "):] for line in headers if line.startswith(b"parent ")]
+                if len(parents) < nth:
+                    raise ValueError(f"revision {rev} does not exist")
+                oid = bytes.fromhex(parents[nth - 1].decode("ascii"))
+        try:
+            oid = self._peel(oid, "commit")
+        except ValueError:
+            pass
+        return oid, self._peel(oid, "tree")
+
+# --- Archive Input ---
+
+# Compressed tar archives are recognized by the magic bytes of their compression.
+TAR_COMPRESSION_MAGIC: Final[Dict[str, bytes]] = {
+    "gzip": b"\x1f\x8b", "bzip2": b"BZh", "xz": b"\xfd7zXZ\x00", "zstd": b"\x28\xb5\x2f\xfd",
+}
+
+
+class _ArchiveReader:
+    """
+    Reads the members of a zip or tar archive, compressed or not, without
+    extracting them. Tar archives are read as a stream: every pass decompresses
+    the archive once and holds only the current member, so memory does not grow
+    with the archive. Zip archives are listed from their central directory.
+    """
+    def __init__(self, path: Path):
+        """
+        :param path: The archive.
+        :type path: Path
+        :raises ValueError: If the file is neither a zip nor a tar archive, or is a
+                            zstd-compressed tar archive and zstandard is not installed.
+        :raises OSError: If the file cannot be read.
+        """
+        import tarfile
+        import zipfile
+        self.path = path
+        self.kind = "zip"
+        self.compression = None
+        # Raised besides OSError for corrupt or truncated archives, and by zip archives for
+        # encrypted (RuntimeError) or unsupported (NotImplementedError) members
+        self.errors = (EOFError, zlib.error, tarfile.TarError, zipfile.BadZipFile, RuntimeError, NotImplementedError)
+        if zipfile.is_zipfile(path):
+            return
+
+        self.kind = "tar"
+        with path.open("rb") as f:
+            magic = f.read(8)
+        self.compression = next((method for method, prefix in TAR_COMPRESSION_MAGIC.items()
+                                 if magic.startswith(prefix)), None)
+        if self.compression == "xz":
+            import lzma
+            self.errors += (lzma.LZMAError,)
+        elif self.compression == "zstd":
+            zstandard = _optional_import("zstandard")
+            if zstandard is None:
+                raise ValueError(f"{path} is zstd-compressed; please run 'pip install zstandard'.")
+            self.errors += (zstandard.ZstdError,)
+        try:
+            with ExitStack() as stack:
+                self._open_tar(stack)
+        except (OSError,) + self.errors:
+            raise ValueError(f"{path} is neither a directory nor a zip or tar archive.") from None
+
+    def _open_tar(self, stack: ExitStack):
+        """
+        Opens the tar archive as a stream. The decompression is done by the
+        standard file objects of each method, rather than by tarfile's own
+        stream, which slows down on highly compressible members.
+
+        :param stack: Closes the archive and the files beneath it.
+        :type stack: ExitStack
+        :return: The archive.
+        :rtype: tarfile.TarFile
+        """
+        import tarfile
+        stream = stack.enter_context(self.path.open("rb"))
+        if self.compression == "gzip":
+            import gzip
+            stream = stack.enter_context(gzip.GzipFile(fileobj=stream, mode="rb"))
+        elif self.compression == "bzip2":
+            import bz2
+            stream = stack.enter_context(bz2.BZ2File(stream))
+        elif self.compression == "xz":
+            import lzma
+            stream = stack.enter_context(lzma.LZMAFile(stream))
+        elif self.compression == "zstd":
+            stream = stack.enter_context(_optional_import("zstandard").ZstdDecompressor().stream_reader(stream))
+        return stack.enter_context(tarfile.open(fileobj=stream, mode="r|"))
+
+    @staticmethod
+    def _normalize(name: str) -> Optional[str]:
+        """
+        :param name: A member name as stored in the archive.
+        :type name: str
+        :return: The name as a relative POSIX path, or None for names that point
+                 outside the archive root.
+        :rtype: Optional[str]
+        """
+        parts = [part for part in name.replace("\\", "/").split("/") if part and part != "."]
+        if not parts or ".." in parts:
+            return None
+        return "/".join(parts)
+
+    def members(self) -> Iterator[Tuple[str, bool, int, Callable]]:
+        """
+        Yields the directories and regular files of the archive in archive order.
+        Links and special files are skipped.
+
+        :yield: Tuples of (relative POSIX path, whether it is a directory, size, open),
+                where open() returns a binary file object over the member's content.
+                It is only valid until the next member is requested.
+        :rtype: Iterator[Tuple[str, bool, int, Callable]]
+        :raises tarfile.TarError: If the tar archive is corrupt or truncated.
+        :raises zipfile.BadZipFile: If the zip archive is corrupt.
+        """
+        if self.kind == "zip":
+            import zipfile
+            with zipfile.ZipFile(self.path) as archive:
+                for info in archive.infolist():
+                    name = self._normalize(info.filename)
+                    if name is not None:
+                        yield name, info.is_dir(), info.file_size, lambda info=info: archive.open(info)
+            return
+
+        with ExitStack() as stack:
+            archive = self._open_tar(stack)
+            while True:
+                member = archive.next()
+                if member is None:
+                    break
+                # A stream keeps every header it has read; the members already passed are not needed
+                archive.members.clear()
+                name = self._normalize(member.name)
+                if name is not None and (member.isdir() or member.isfile()):
+                    yield name, member.isdir(), member.size, lambda member=member: archive.extractfile(member)
+
+# --- File System Watchers ---
+
+class _InotifyWatcher:
+    """
+    Reports changes in a set of directories through Linux inotify, called via ctypes.
+    """
+    EVENT_HEADER: Final[struct.Struct] = struct.Struct("iIII")
+
+    def __init__(self):
+        """
+        :raises OSError: If inotify is unavailable.
+        """
+        import ctypes
+        self._get_errno = ctypes.get_errno
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._dirs: Dict[int, str] = {}
+
+    def add(self, directory: str) -> None:
+        """
+        Starts watching a directory. Watching an already watched directory is a no-op.
+
+        :param directory: The absolute path of the directory.
+        :type directory: str
+        """
+        wd = self._add_watch(self._fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            errno = self._get_errno()
+            logging.warning(f"Cannot watch directory {directory}: {os.strerror(errno)}")
+        else:
+            self._dirs[wd] = directory
+
+    def read(self, timeout: Optional[float]) -> List[Tuple[Optional[str], int]]:
+        """
+        Waits for events.
+
+        :param timeout: Seconds to wait, or None to wait indefinitely.
+        :type timeout: Optional[float]
+        :return: Tuples of (absolute path, inotify mask). A None path means events
+                 were lost and everything must be rescanned.
+        :rtype: List[Tuple[Optional[str], int]]
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        buffer = os.read(self._fd, 64 * 1024)
+        events: List[Tuple[Optional[str], int]] = []
+        pos = 0
+        while pos < len(buffer):
+            wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(buffer, pos)
+            pos += self.EVENT_HEADER.size
+            name = buffer[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+            elif mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+            elif wd in self._dirs:
+                directory = self._dirs[wd]
+                events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _PollingWatcher:
+    """
+    A portable fallback that asks for a rescan at a fixed interval.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+
+    def add(self, directory: str) -> None:
+        pass
+
+    def read(self, timeout: Optional[float]) -> List[Tuple[Optional[str], int]]:
+        if timeout is not None:
+            return []
+        time.sleep(self.interval)
+        return [(None, 0)]
+
+    def close(self) -> None:
+        pass
+
+# --- Output Sinks ---
+
+def _new_compressor(method: Optional[str], level: int):
+    """
+    Creates an incremental compressor with `compress(data)` and `flush()` methods.
+
+    :param method: One of the keys of COMPRESSION_SUFFIXES, or None for no compression.
+    :type method: Optional[str]
+    :param level: The compression level.
+    :type level: int
+    :return: The compressor object, or None if method is None.
+    :raises ValueError: If the method is unknown or its library is not installed.
+    """
+    if method is None:
+        return None
+    if method == "gzip":
+        # wbits 31 selects the gzip container; its mtime field is zero, keeping output reproducible
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if method == "xz":
+        import lzma
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level)
+    if method == "zstd":
+        zstandard = _optional_import("zstandard")
+        if zstandard is None:
+            raise ValueError("zstd compression requires 'zstandard'. Please run 'pip install zstandard'")
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"Unknown compression method: {method}")
+
+
+class _BackgroundWriter:
+    """
+    A write-only binary sink that optionally compresses and writes into an
+    underlying file on a background thread, so that compression and disk writes
+    overlap with reading the repository. zlib, lzma and zstandard release the
+    GIL while compressing.
+
+    The underlying file is flushed when the writer is finished, and also closed
+    if close_file is set. Errors raised by the thread are re-raised by the next
+    write() or by close(). The thread's time is added to the compress phase of
+    stats, if given.
+    """
+    def __init__(self, f_out, method: Optional[str] = None, level: int = 0, close_file: bool = False,
+                 stats: Optional["RunStats"] = None):
+        self._f_out = f_out
+        self._compressor = _new_compressor(method, level)
+        self._close_file = close_file
+        self._stats = stats
+        self._queue: queue.Queue = queue.Queue(maxsize=WRITER_QUEUE_CHUNKS)
+        self._finished = False
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._drain, name="repomix-writer", daemon=True)
+        self._thread.start()
+
+    def _drain(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if self._error is not None:
+                continue  # Keep consuming so that the producer never blocks
+            started = time.perf_counter_ns()
+            try:
+                if self._compressor is not None:
+                    data = self._compressor.compress(data)
+                if data:
+                    self._f_out.write(data)
+            except BaseException as e:
+                self._error = e
+            if self._stats is not None:
+                self._stats.add("compress", time.perf_counter_ns() - started)
+        try:
+            if self._error is None:
+                if self._compressor is not None:
+                    self._f_out.write(self._compressor.flush())
+                self._f_out.flush()
+        except BaseException as e:
+            self._error = e
+        finally:
+            if self._close_file:
+                self._f_out.close()
+
+    def write(self, data: bytes) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(data)
+
+    def finish(self) -> None:
+        """
+        Signals the end of the data without waiting for the thread to write it.
+        """
+        if not self._finished:
+            self._finished = True
+            self._queue.put(None)
+
+    def close(self) -> None:
+        """
+        Writes the remaining data and waits for the thread to stop.
+        """
+        self.finish()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "_BackgroundWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # Do not mask the original error with one from the writer thread
+        self._error = self._error or exc
+        self.finish()
+        self._thread.join()
+
+# --- Instrumentation ---
+
+class RunStats:
+    """
+    Time and event counters for the phases of a run. Phases are timed with
+    `time.perf_counter_ns` around whole operations (a directory scan, a file
+    read), and every thread updates its own totals without locking, so the
+    overhead is a few dictionary updates per file.
+
+    Phases: walk (listing directories), ignore (loading and matching ignore
+    rules), binary (detecting binary files), read (loading text files, or the
+    ends of sampled ones), decode (normalizing and stripping text), stream
+    (reading and decoding large files while they are written), dedupe (hashing
+    and matching duplicates), write (handing output to the file or to the
+    background writer) and compress (compressing and writing on the
+    background writer thread).
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads: List[Tuple[Dict[str, int], Dict[str, int]]] = []
+
+    def _totals(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        totals = getattr(self._local, "totals", None)
+        if totals is None:
+            totals = self._local.totals = (dict.fromkeys(STATS_PHASES, 0), dict.fromkeys(STATS_COUNTERS, 0))
+            with self._lock:
+                self._threads.append(totals)
+        return totals
+
+    def add(self, phase: str, elapsed_ns: int, counter: Optional[str] = None, value: int = 1) -> None:
+        """
+        Adds time to a phase, and optionally increments a counter.
+
+        :param phase: The phase, one of STATS_PHASES.
+        :type phase: str
+        :param elapsed_ns: Nanoseconds spent in the phase.
+        :type elapsed_ns: int
+        :param counter: A counter of STATS_COUNTERS to increment.
+        :type counter: Optional[str]
+        :param value: The increment.
+        :type value: int
+        """
+        phase_ns, counters = self._totals()
+        phase_ns[phase] += elapsed_ns
+        if counter is not None:
+            counters[counter] += value
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """
+        Increments a counter of STATS_COUNTERS.
+
+        :param counter: The counter.
+        :type counter: str
+        :param value: The increment.
+        :type value: int
+        """
+        self._totals()[1][counter] += value
+
+    def snapshot(self, reset: bool = False) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Returns the phase times and counters summed over threads.
+
+        :param reset: Also reset them, as `take` does.
+        :type reset: bool
+        :return: The phase nanoseconds and the counters.
+        :rtype: Tuple[Dict[str, int], Dict[str, int]]
+        """
+        phase_ns, counters = dict.fromkeys(STATS_PHASES, 0), dict.fromkeys(STATS_COUNTERS, 0)
+        with self._lock:
+            for thread_phase_ns, thread_counters in self._threads:
+                for phase in thread_phase_ns:
+                    phase_ns[phase] += thread_phase_ns[phase]
+                    if reset:
+                        thread_phase_ns[phase] = 0
+                for counter in thread_counters:
+                    counters[counter] += thread_counters[counter]
+                    if reset:
+                        thread_counters[counter] = 0
+        return phase_ns, counters
+
+    def take(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Returns the phase times and counters summed over threads and resets
+        them, for merging into the statistics of another process. Threads must
+        not update the statistics meanwhile.
+
+        :return: The phase nanoseconds and the counters.
+        :rtype: Tuple[Dict[str, int], Dict[str, int]]
+        """
+        return self.snapshot(reset=True)
+
+    def merge(self, taken: Tuple[Dict[str, int], Dict[str, int]]) -> None:
+        """
+        Adds the result of `take` from another process.
+
+        :param taken: The phase nanoseconds and the counters.
+        :type taken: Tuple[Dict[str, int], Dict[str, int]]
+        """
+        phase_ns, counters = self._totals()
+        for phase, elapsed_ns in taken[0].items():
+            phase_ns[phase] += elapsed_ns
+        for counter, value in taken[1].items():
+            counters[counter] += value
+
+    def report(self) -> dict:
+        """
+        Returns the statistics as a JSON-serializable dictionary, without resetting them.
+
+        :return: The phase times in seconds and the counters.
+        :rtype: dict
+        """
+        phase_ns, counters = self.snapshot()
+        return {"version": STATS_VERSION,
+                "phases_seconds": {phase: elapsed_ns / 1e9 for phase, elapsed_ns in phase_ns.items()},
+                "counters": counters}
+
+    def __getstate__(self) -> dict:
+        # Thread-local totals and locks cannot be pickled into worker processes; pickling
+        # must not reset the totals, so workers report their deltas with `take` instead
+        return {"taken": self.snapshot()}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+        self.merge(state["taken"])
+
+
+class _ThreadedProfile:
+    """
+    A cProfile profile of the calling thread and of every thread started while
+    it is enabled, such as the --jobs readers and the background writer. Each
+    thread gets its own cProfile.Profile, and they are merged when saved.
+    Worker processes are not profiled.
+    """
+    def __init__(self):
+        import cProfile
+        self._new_profile = cProfile.Profile
+        self._profiles = [cProfile.Profile()]
+        self._lock = threading.Lock()
+
+    def _start_thread(self, frame, event: str, arg) -> None:
+        """
+        Installed by `threading.setprofile`, so called at the first event of each new
+        thread; it enables a profile of that thread, which replaces this hook.
+        """
+        sys.setprofile(None)
+        profile = self._new_profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler, which already covers every thread
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def enable(self) -> None:
+        threading.setprofile(self._start_thread)
+        self._profiles[0].enable()
+
+    def disable(self) -> None:
+        """
+        Stops profiling the calling thread and hooking new threads. Threads that
+        are still running keep their profiles enabled until they exit.
+        """
+        self._profiles[0].disable()
+        threading.setprofile(None)
+
+    def dump_stats(self, path: str) -> None:
+        """
+        Saves the merged profiles of all threads.
+
+        :param path: The profile file, in the format read by pstats.
+        :type path: str
+        :raises IOError: If the file cannot be written.
+        """
+        import pstats
+        with self._lock:
+            stats = pstats.Stats(*self._profiles)
+        stats.dump_stats(path)
+
+# --- Near-Duplicate Detection ---
+
+_MERSENNE_PRIME: Final[int] = (1 << 61) - 1
+# The (a, b) coefficients of the permutations, drawn by `_minhash_coefficients`.
+_minhash_params: Optional[Tuple[Tuple[int, ...], Tuple[int, ...]]] = None
+
+
+def _minhash_coefficients() -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """
+    Returns the coefficients of the MinHash permutations, drawing them on first use.
+    A fixed seed keeps signatures, and therefore the output, reproducible across runs.
+
+    :return: The a and b coefficients, one of each per permutation.
+    :rtype: Tuple[Tuple[int, ...], Tuple[int, ...]]
+    """
+    global _minhash_params
+    if _minhash_params is None:
+        import random
+        rng = random.Random(0x5EED)
+        a = tuple(rng.randrange(1, 1 << 32) for _ in range(MINHASH_PERMUTATIONS))
+        b = tuple(rng.randrange(0, 1 << 32) for _ in range(MINHASH_PERMUTATIONS))
+        _minhash_params = (a, b)
+    return _minhash_params
+
+
+def _minhash_signature(body: bytes) -> Tuple[int, ...]:
+    """
+    Computes the MinHash signature of the shingles (runs of SHINGLE_TOKENS
+    whitespace-separated tokens) of a text. Each of the permutations is
+    h(x) = (a * x + b) mod p on the 32-bit CRC of a shingle; the products stay
+    below 2**64, so numpy computes the same values as the pure Python fallback.
+
+    :param body: The rendered text of a file.
+    :type body: bytes
+    :return: The minimum hash value per permutation.
+    :rtype: Tuple[int, ...]
+    """
+    tokens = body.split()
+    width = min(SHINGLE_TOKENS, len(tokens))
+    shingles = {zlib.crc32(b" ".join(tokens[i:i + width]))
+                for i in range(len(tokens) - width + 1)}
+    coefficients_a, coefficients_b = _minhash_coefficients()
+    numpy = _optional_import("numpy")
+    if numpy is None:
+        return tuple(min((a * x + b) % _MERSENNE_PRIME for x in shingles)
+                     for a, b in zip(coefficients_a, coefficients_b))
+
+    a = numpy.array(coefficients_a, dtype=numpy.uint64)
+    b = numpy.array(coefficients_b, dtype=numpy.uint64)
+    values = numpy.fromiter(shingles, dtype=numpy.uint64, count=len(shingles))
+    signature = numpy.full(MINHASH_PERMUTATIONS, numpy.iinfo(numpy.uint64).max, dtype=numpy.uint64)
+    for start in range(0, len(values), MINHASH_BLOCK_SHINGLES):
+        block = values[start:start + MINHASH_BLOCK_SHINGLES, None]
+        numpy.minimum(signature, ((block * a + b) % _MERSENNE_PRIME).min(axis=0), out=signature)
+    return tuple(int(v) for v in signature)
+
+
+class _NearDuplicateIndex:
+    """
+    Locality-sensitive hashing over MinHash signatures. Each signature is cut
+    into LSH_BANDS bands; texts sharing any band become candidates, which are
+    then compared by the fraction of equal signature values (an estimate of
+    their Jaccard similarity). Lookups only touch matching buckets, so the cost
+    grows linearly with the number of files rather than with the number of pairs.
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self._rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(LSH_BANDS)]
+        self._keys: List[str] = []
+        self._signatures: List[Tuple[int, ...]] = []
+
+    def _bands(self, signature: Tuple[int, ...]) -> Iterator[Tuple[Dict[Tuple[int, ...], List[int]], Tuple[int, ...]]]:
+        for band, buckets in enumerate(self._buckets):
+            yield buckets, signature[band * self._rows:(band + 1) * self._rows]
+
+    def add(self, key: str, signature: Tuple[int, ...]) -> None:
+        """
+        Registers a representative text.
+
+        :param key: The identifier returned by `find` for this text.
+        :type key: str
+        :param signature: Its MinHash signature.
+        :type signature: Tuple[int, ...]
+        """
+        index = len(self._keys)
+        self._keys.append(key)
+        self._signatures.append(signature)
+        for buckets, band in self._bands(signature):
+            buckets.setdefault(band, []).append(index)
+
+    def find(self, signature: Tuple[int, ...]) -> Optional[Tuple[str, float]]:
+        """
+        Finds the most similar registered text at or above the threshold.
+
+        :param signature: The MinHash signature to look up.
+        :type signature: Tuple[int, ...]
+        :return: The key of the earliest best match and its estimated similarity, or None.
+        :rtype: Optional[Tuple[str, float]]
+        """
+        candidates = set()
+        for buckets, band in self._bands(signature):
+            candidates.update(buckets.get(band, ()))
+        best = None
+        for index in sorted(candidates):
+            other = self._signatures[index]
+            similarity = sum(x == y for x, y in zip(signature, other)) / MINHASH_PERMUTATIONS
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (self._keys[index], similarity)
+        return best
+
+# --- Core Component ---
+
+def _content_digest(data: bytes) -> bytes:
+    """
+    Hashes file contents for deduplication, with xxh3 if available, else blake2b.
+
+    :param data: The contents to hash.
+    :type data: bytes
+    :return: A 128-bit digest.
+    :rtype: bytes
+    """
+    xxhash = _optional_import("xxhash")
+    if xxhash is not None:
+        return xxhash.xxh3_128_digest(data)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class _Segment(NamedTuple):
+    """
+    The rendered output of one file. When `reuse` is set, `data` is None and the
+    segment is copied from the given (offset, length) range of the previous output.
+    When `streamed` is set, `data` is None and the writer renders the large file
+    chunk by chunk.
+    `digest` identifies the rendered contents when deduplication is enabled, and
+    `minhash` summarizes them for near-duplicate detection.
+    """
+    relative_path: str
+    data: Optional[bytes]
+    ok: bool
+    signature: Optional[Tuple[int, int, int]] = None
+    reuse: Optional[Tuple[int, int]] = None
+    digest: Optional[bytes] = None
+    minhash: Optional[Tuple[int, ...]] = None
+    streamed: bool = False
+
+
+class RepoMixer:
+    """
+    A component to traverse a repository, filter files according to rules,
+    and synthesize them into a single text file for AI context.
+    """
+    def __init__(self, root_dir: Path, output_file: Optional[Path], jobs: int = 1, incremental: bool = False,
+                 git_index: bool = False, untracked: bool = False, compress: Optional[str] = None,
+                 compress_level: Optional[int] = None, shard_size: Optional[int] = None,
+                 shards: Optional[int] = None, dedupe: bool = False,
+                 near_dedupe: Optional[float] = None, max_file_size: Optional[int] = None,
+                 oversize: str = "truncate", sample: Optional[List[Tuple[str, int]]] = None,
+                 cache_dir: Optional[Path] = None, partitions: int = 1, rev: Optional[str] = None,
+                 diff_base: Optional[str] = None, context: Optional[List[str]] = None):
+        """
+        Initializes the RepoMixer with specified paths.
+
+        :param root_dir: The absolute path to the repository's root directory, or to a zip
+                         or tar archive (optionally gzip, bzip2 or xz compressed) to mix
+                         without extracting it. A single top-level directory holding
+                         every member is taken as the archive's root.
+        :type root_dir: Path
+        :param output_file: The absolute path to the target output file, or None to
+                            write to standard output.
+        :type output_file: Optional[Path]
+        :param jobs: Number of worker threads reading files ahead of the writer.
+        :type jobs: int
+        :param incremental: Reuse unchanged segments of the previous output, tracked in a manifest.
+        :type incremental: bool
+        :param git_index: Enumerate the files tracked in the git index instead of walking.
+        :type git_index: bool
+        :param untracked: With git_index or diff_base, also include untracked files that are not ignored.
+        :type untracked: bool
+        :param compress: Compress the output with "gzip", "zstd" or "xz" on a background thread.
+        :type compress: Optional[str]
+        :param compress_level: The compression level, or None for the method's default.
+        :type compress_level: Optional[int]
+        :param shard_size: Split the output at file boundaries into parts of at most this many
+                           (uncompressed) bytes, unless a single file is larger.
+        :type shard_size: Optional[int]
+        :param shards: Split the output at file boundaries into at most this many parts of similar size.
+        :type shards: Optional[int]
+        :param dedupe: Emit each distinct text file content once; later copies are replaced
+                       by a stub naming the first file with the same content.
+        :type dedupe: bool
+        :param near_dedupe: A similarity threshold in (0, 1]. Text files at least this similar to
+                            an earlier file are replaced by a unified diff against it. Implies dedupe.
+        :type near_dedupe: Optional[float]
+        :param max_file_size: Text files larger than this many bytes are truncated or skipped.
+        :type max_file_size: Optional[int]
+        :param oversize: "truncate" to keep the start of oversized files followed by a marker,
+                         or "skip" to replace their content with a placeholder.
+        :type oversize: str
+        :param sample: (glob, lines) policies. Text files matching a glob, on the basename if it
+                       has no "/", else on the relative path, are reduced to their first and last
+                       `lines` lines and a summary line. The first matching policy applies.
+        :type sample: Optional[List[Tuple[str, int]]]
+        :param cache_dir: A directory for the binary cache of this root, which lets unchanged
+                          binary files be skipped without opening them, and for compiled
+                          ignore rules. None disables both caches.
+        :type cache_dir: Optional[Path]
+        :param partitions: Walk and render subtrees in this many worker processes. The output
+                           is identical to a serial run.
+        :type partitions: int
+        :param rev: Mix this revision instead of the work tree. Its tree and blobs are read
+                    straight from the object store of the repository at root_dir, which may
+                    be bare, and only the tree's own `.gitignore` files apply. Files are mixed
+                    in git's tree order.
+        :type rev: Optional[str]
+        :param diff_base: Mix only the files added or changed since this revision, in the work
+                          tree or, with rev, in that revision. Like tracked files with git_index,
+                          they are mixed in sorted order and ignore rules do not apply to them.
+        :type diff_base: Optional[str]
+        :param context: With diff_base, POSIX paths relative to the root of files to mix
+                        whether or not they changed, e.g. a README giving an overview.
+        :type context: Optional[List[str]]
+        :raises TypeError: If root_dir or output_file are not Path objects.
+        :raises ValueError: If jobs, shard_size or shards is smaller than 1, if both shard_size and
+                            shards are given, if incremental or sharded output is requested without
+                            an output file, if incremental is combined with compression, sharding
+                            or deduplication, if compress or oversize is unknown, if near_dedupe is out
+                            of range, if max_file_size or a sample line count is smaller than 1, or if
+                            partitions is smaller than 1 or combined with incremental, git_index,
+                            sharding or deduplication, if rev or diff_base is combined with incremental,
+                            git_index or partitions, if context is given without diff_base, or if
+                            root_dir is not a git repository, rev or diff_base cannot be resolved in
+                            it or the changed files cannot be listed, or if root_dir is a file that
+                            is not an archive, or an archive combined with incremental, git_index,
+                            rev, diff_base, partitions or sharding.
+        """
+        if not isinstance(root_dir, Path) or not isinstance(output_file, (Path, type(None))):
+            raise TypeError("root_dir and output_file must be Path objects.")
+        if jobs < 1:
+            raise ValueError("jobs must be at least 1.")
+        if incremental and output_file is None:
+            raise ValueError("incremental mode requires an output file.")
+        if compress is not None and compress not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression method: {compress}")
+        if compress is not None and incremental:
+            raise ValueError("incremental mode cannot write compressed output.")
+        if shard_size is not None and shards is not None:
+            raise ValueError("shard_size and shards are mutually exclusive.")
+        if (shard_size is not None and shard_size < 1) or (shards is not None and shards < 1):
+            raise ValueError("shard_size and shards must be at least 1.")
+        if (shard_size is not None or shards is not None) and (incremental or output_file is None):
+            raise ValueError("sharded output requires an output file and cannot be incremental.")
+        if near_dedupe is not None and not 0 < near_dedupe <= 1:
+            raise ValueError("near_dedupe must be in (0, 1].")
+        dedupe = dedupe or near_dedupe is not None
+        if max_file_size is not None and max_file_size < 1:
+            raise ValueError("max_file_size must be at least 1.")
+        if oversize not in OVERSIZE_ACTIONS:
+            raise ValueError(f"Unknown oversize action: {oversize}")
+        if any(lines < 1 for _, lines in sample or ()):
+            raise ValueError("sample line counts must be at least 1.")
+        if partitions < 1:
+            raise ValueError("partitions must be at least 1.")
+        if partitions > 1 and (incremental or git_index or shard_size is not None or shards is not None or dedupe):
+            raise ValueError("partitions cannot be combined with incremental, git_index, sharding or deduplication.")
+        if dedupe and incremental:
+            raise ValueError("incremental mode cannot deduplicate files.")
+        if (rev is not None or diff_base is not None) and (incremental or git_index or partitions > 1):
+            raise ValueError("rev and diff_base cannot be combined with incremental, git_index or partitions.")
+        if context and diff_base is None:
+            raise ValueError("context requires diff_base.")
+        _check_rule_translator()
+        is_archive = root_dir.is_file()
+        if is_archive and (incremental or git_index or rev is not None or diff_base is not None or partitions > 1
+                           or shard_size is not None or shards is not None):
+            raise ValueError("An archive cannot be mixed with incremental, git_index, rev, diff_base,"
+                             " partitions or sharding.")
+        self.root_dir = root_dir
+        self.output_file = output_file
+        self.jobs = jobs
+        self.incremental = incremental
+        self.git_index = git_index
+        self.untracked = untracked
+        self.compress = compress
+        self.compress_level = (compress_level if compress_level is not None or compress is None
+                               else DEFAULT_COMPRESSION_LEVELS[compress])
+        self.shard_size = shard_size
+        self.shards = shards
+        self.dedupe = dedupe
+        self.near_dedupe = near_dedupe
+        self.max_file_size = max_file_size
+        self.oversize = oversize
+        self._stream_threshold = min(LARGE_FILE_BYTES, max_file_size or LARGE_FILE_BYTES)
+        self.sample = list(sample or ())
+        self.partitions = partitions
+        self.rev = rev
+        self.diff_base = diff_base
+        self.context = list(context or ())
+        self.binary_cache_file = None
+        self.rule_cache_dir = None
+        self._rule_cache_pruned = False
+        if cache_dir is not None:
+            root_key = hashlib.blake2b(os.fsencode(root_dir), digest_size=8).hexdigest()
+            # Blobs and archive members have no inode or mtime to key the binary cache on
+            if rev is None and not is_archive:
+                self.binary_cache_file = cache_dir / f"binary-{root_key}.bin"
+            self.rule_cache_dir = cache_dir / RULE_CACHE_DIRNAME
+        self.stats = RunStats()
+        self.archive = _ArchiveReader(root_dir) if is_archive else None
+        self._archive_root = ""
+        self._archive_rules: Dict[str, IgnoreRules] = {}
+        self._archive_dirs: Dict[str, Optional[IgnoreLayers]] = {}
+        self._archive_member: Optional[Tuple[str, int, Callable]] = None
+        self._archive_stream: Optional[tuple] = None
+        self._archive_bodies: "OrderedDict[str, bytes]" = OrderedDict()
+        self._archive_bodies_bytes = 0
+        self._git_store = None
+        self._rev_commit = self._rev_tree = None
+        self._rev_blobs: Dict[str, bytes] = {}
+        if rev is not None:
+            self._git_store = self._open_object_store()
+            self._rev_commit, self._rev_tree = self._git_store.resolve(rev)
+            logging.info(f"Mixing revision {rev} ({self._rev_commit.hex()}) from {self._git_store.git_dir}")
+        self._diff_base_commit = None
+        self._diff_paths: Optional[List[str]] = None
+        if diff_base is not None:
+            store = self._git_store or self._open_object_store()
+            self._diff_base_commit, base_tree = store.resolve(diff_base)
+            self._diff_paths = self._list_changed_files(store, base_tree)
+        self._binary_cache = self._load_binary_cache()
+        self._binary_seen: set = set()
+        self._binary_partial = False
+        self.manifest_file = (output_file.with_name(output_file.name + MANIFEST_SUFFIX)
+                              if output_file is not None else None)
+        self.shard_manifest_file = (output_file.with_name(output_file.name + SHARD_MANIFEST_SUFFIX)
+                                    if output_file is not None else None)
+        self._shard_part_pattern = self._compile_shard_part_pattern() if output_file is not None else None
+        self.script_file = Path(__file__).resolve()
+        self._ignore_cache: Dict[str, Tuple[Tuple[int, int], IgnoreRules]] = {}
+        if self.archive is not None:
+            self.ignore_layers = self._scan_archive()
+        elif rev is not None:
+            self.ignore_layers = self._load_tree_ignore_rules()
+        else:
+            self.ignore_layers = self._load_ignore_rules()
+        self.file_count = 0
+        self.reused_count = 0
+        self.duplicate_count = 0
+        self.near_duplicate_count = 0
+
+    def _load_ignore_file(self, ignore_path: str) -> Optional[IgnoreRules]:
+        """
+        Compiles an ignore file, reusing the cached rules while the file is unchanged.
+        The file is decoded as UTF-8 to prevent UnicodeDecodeError on systems
+        with different default encodings.
+
+        :param ignore_path: The path of the ignore file.
+        :type ignore_path: str
+        :return: The compiled rules, or None if the file is missing, unreadable or empty.
+        :rtype: Optional[IgnoreRules]
+        """
+        try:
+            st = os.stat(ignore_path)
+            signature = (st.st_mtime_ns, st.st_size)
+            cached = self._ignore_cache.get(ignore_path)
+            if cached is not None and cached[0] == signature:
+                return cached[1] or None
+            with open(ignore_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except IOError as e:
+            logging.error(f"Failed to read or parse ignore file at {ignore_path}: {e}. "
+                          "Proceeding without its rules.")
+            return None
+        rules = self._compile_ignore_rules(data, ignore_path)
+        self._ignore_cache[ignore_path] = (signature, rules)
+        return rules or None
+
+    def _compile_ignore_rules(self, data: bytes, source: str) -> IgnoreRules:
+        """
+        Compiles the content of an ignore file. With a cache directory, the rules
+        are stored under a hash of the content, so an unchanged file anywhere is
+        loaded without gitignore-parser or translating its patterns again. Hits
+        refresh the entry's mtime, and misses prune the cache with `_prune_rule_cache`.
+
+        :param data: The raw content of the ignore file.
+        :type data: bytes
+        :param source: The ignore file's location, used for diagnostics only.
+        :type source: str
+        :return: The compiled rules.
+        :rtype: IgnoreRules
+        """
+        cache_file = None
+        if self.rule_cache_dir is not None:
+            key = hashlib.blake2b(_rule_cache_tag(), digest_size=16)
+            key.update(data)
+            cache_file = self.rule_cache_dir / f"{key.hexdigest()}.bin"
+            try:
+                with open(cache_file, "rb") as f:
+                    rules = IgnoreRules._from_state(marshal.load(f), source)
+                    if time.time() - os.fstat(f.fileno()).st_mtime > RULE_CACHE_TOUCH_SECONDS:
+                        os.utime(f.fileno())
+                return rules
+            except FileNotFoundError:
+                pass
+            except (OSError, EOFError, ValueError, TypeError, IndexError, re.error) as e:
+                logging.debug(f"Ignoring unusable cached rules {cache_file}: {e}")
+
+        # Universal newlines, as when iterating over a file opened in text mode
+        text = data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+        rules = IgnoreRules(text.split("\n"), source=source)
+        if cache_file is not None:
+            # Concurrent runs may compile the same file; each writes its own temporary file
+            temp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+            try:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                with temp_file.open("wb") as f:
+                    marshal.dump(rules.__getstate__(), f)
+                os.replace(temp_file, cache_file)
+            except (IOError, ValueError) as e:
+                logging.warning(f"Failed to write rule cache {cache_file}: {e}")
+            if not self._rule_cache_pruned:
+                self._rule_cache_pruned = True
+                self._prune_rule_cache()
+        return rules
+
+    def _prune_rule_cache(self) -> None:
+        """
+        Evicts the cached rules not used for RULE_CACHE_MAX_AGE_SECONDS, which
+        include those of edited ignore files and of older versions of the code,
+        then the least recently used ones until the cache fits in RULE_CACHE_MAX_BYTES.
+        """
+        entries = []
+        try:
+            with os.scandir(self.rule_cache_dir) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError as e:
+            logging.debug(f"Cannot prune rule cache {self.rule_cache_dir}: {e}")
+            return
+        entries.sort(reverse=True)
+        cutoff = time.time() - RULE_CACHE_MAX_AGE_SECONDS
+        total = 0
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total + size <= RULE_CACHE_MAX_BYTES:
+                total += size
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load_ignore_rules(self) -> IgnoreLayers:
+        """
+        Loads the repository-wide ignore rules: the global excludes file,
+        `.git/info/exclude` and the root `.gitignore`, in increasing precedence.
+        Nested `.gitignore` files are layered on top during the walk.
+
+        :return: The ignore layers that apply to the whole repository.
+        :rtype: IgnoreLayers
+        """
+        started = time.perf_counter_ns()
+        git_dir = _find_git_dir(self.root_dir)
+        sources = [_find_global_excludes(git_dir)]
+        if git_dir is not None:
+            sources.append(git_dir / "info" / "exclude")
+        sources.append(self.root_dir / IGNORE_FILENAME)
+
+        layers = []
+        for source in sources:
+            rules = self._load_ignore_file(str(source))
+            if rules:
+                logging.info(f"Applying ignore rules from: {source}")
+                layers.append((0, rules))
+        if not (self.root_dir / IGNORE_FILENAME).is_file():
+            logging.warning("No .gitignore file found in the root directory.")
+        self.stats.add("ignore", time.perf_counter_ns() - started)
+        return tuple(layers)
+
+    def _scan_archive(self) -> IgnoreLayers:
+        """
+        Makes the first of two passes over the archive: it compiles every `.gitignore`
+        member, since a tar archive may store one after the files it applies to,
+        and finds the single top-level directory to strip, if any. Only the
+        archive's own `.gitignore` files apply.
+
+        :return: The ignore layers of the archive root.
+        :rtype: IgnoreLayers
+        :raises ValueError: If the archive cannot be read.
+        """
+        started = time.perf_counter_ns()
+        ignore_files: Dict[str, bytes] = {}
+        top_names: set = set()
+        try:
+            for name, is_dir, _, open_member in self.archive.members():
+                top, slash, _ = name.partition("/")
+                # None stands for a file at the top level, which rules out a common root directory
+                top_names.add(top if slash or is_dir else None)
+                if not is_dir and name.rpartition("/")[2] == IGNORE_FILENAME:
+                    with open_member() as f:
+                        ignore_files[name] = f.read()
+        except (OSError,) + self.archive.errors as e:
+            raise ValueError(f"Failed to read archive {self.root_dir}: {e}") from e
+        if len(top_names) == 1 and None not in top_names:
+            self._archive_root = top_names.pop() + "/"
+            logging.info(f"Using the archive's top-level directory as the root: {self._archive_root}")
+
+        for name, data in ignore_files.items():
+            if name.startswith(self._archive_root):
+                dir_prefix = name[len(self._archive_root):-len(IGNORE_FILENAME)]
+                rules = self._compile_ignore_rules(data, f"{self.root_dir}:{name}")
+                if rules:
+                    self._archive_rules[dir_prefix] = rules
+        root_rules = self._archive_rules.get("")
+        if root_rules:
+            logging.info(f"Applying ignore rules from: {self.root_dir}:{self._archive_root}{IGNORE_FILENAME}")
+        else:
+            logging.warning("No .gitignore file found in the root of the archive.")
+        self.stats.add("ignore", time.perf_counter_ns() - started)
+        return ((0, root_rules),) if root_rules else ()
+
+    def _archive_layers(self, dir_prefix: str) -> Optional[IgnoreLayers]:
+        """
+        Returns the ignore layers for the children of a directory of the archive,
+        deriving them from its parent's as a walk would. Results are cached, so each
+        directory is checked once however many members it holds.
+
+        :param dir_prefix: The directory's relative POSIX path with a trailing "/", or "" for the root.
+        :type dir_prefix: str
+        :return: The layers, or None if the directory or one of its ancestors is ignored.
+        :rtype: Optional[IgnoreLayers]
+        """
+        if dir_prefix in self._archive_dirs:
+            return self._archive_dirs[dir_prefix]
+        if not dir_prefix:
+            layers = self.ignore_layers
+        else:
+            parent = dir_prefix[:-1].rpartition("/")[0]
+            layers = self._archive_layers(parent + "/" if parent else "")
+            if (layers is None or dir_prefix.startswith(DEFAULT_IGNORE_PATTERNS)
+                    or self._is_ignored(dir_prefix[:-1], True, layers)):
+                layers = None
+            elif dir_prefix in self._archive_rules:
+                layers = layers + ((len(dir_prefix), self._archive_rules[dir_prefix]),)
+        self._archive_dirs[dir_prefix] = layers
+        self.stats.count("directories")
+        return layers
+
+    def _walk_archive(self) -> Iterator[Tuple[Path, str]]:
+        """
+        Makes the second pass over the archive, yielding its eligible files in archive
+        order. Each yielded member stays current, readable by `_read_member`, until
+        the next one is requested.
+
+        :yield: Tuples of (archive path joined with the relative path, POSIX path
+                relative to the archive root).
+        :rtype: Iterator[Tuple[Path, str]]
+        """
+        started = time.perf_counter_ns()
+        try:
+            for name, is_dir, size, open_member in self.archive.members():
+                if is_dir or not name.startswith(self._archive_root):
+                    continue
+                relative_path = name[len(self._archive_root):]
+                if relative_path.startswith(DEFAULT_IGNORE_PATTERNS):
+                    continue
+                ignore_started = time.perf_counter_ns()
+                parent = relative_path.rpartition("/")[0]
+                layers = self._archive_layers(parent + "/" if parent else "")
+                is_ignored = layers is None or self._is_ignored(relative_path, False, layers)
+                ignore_ns = time.perf_counter_ns() - ignore_started
+                self.stats.add("ignore", ignore_ns, "ignored", int(is_ignored))
+                if is_ignored:
+                    continue
+                self._archive_member = (relative_path, size, open_member)
+                self.stats.add("walk", time.perf_counter_ns() - started - ignore_ns)
+                yield self.root_dir / relative_path, relative_path
+                started = time.perf_counter_ns()
+                # A large member whose content was skipped is still open
+                if self._archive_stream is not None:
+                    self._archive_stream[2].close()
+                    self._archive_stream = None
+        except (OSError,) + self.archive.errors as e:
+            logging.error(f"Failed to read archive {self.root_dir}: {e}")
+            self.stats.count("errors")
+        finally:
+            self._archive_member = self._archive_stream = None
+
+    def _read_member(self, relative_path: str, sampled: bool = False) -> Optional[bytes]:
+        """
+        Reads the current archive member. Members up to the streaming threshold and
+        binary ones are returned whole; larger text members are left open for
+        `_stream_text` or `_sample_member`, which continue after the bytes read here.
+
+        :param relative_path: The POSIX path of the member relative to the archive root.
+        :type relative_path: str
+        :param sampled: Whether a sampling policy applies to the member. Members that
+                        fit in the two sample windows are then read whole too.
+        :type sampled: bool
+        :return: The content, or None for a large text member.
+        :rtype: Optional[bytes]
+        :raises ValueError: If the member is not the current one or cannot be decompressed.
+        """
+        if self._archive_member is None or self._archive_member[0] != relative_path:
+            raise ValueError(f"{relative_path} is not the current archive member")
+        _, size, open_member = self._archive_member
+        try:
+            f = open_member()
+            if size <= self._stream_threshold or (sampled and size <= 2 * SAMPLE_WINDOW_BYTES):
+                with f:
+                    return f.read()
+            head = f.read(BINARY_CHECK_BYTES)
+        except self.archive.errors as e:
+            raise ValueError(f"cannot read archive member: {e}") from e
+        if b'\0' in head:
+            f.close()
+            return head
+        self._archive_stream = (relative_path, size, f, head)
+        return None
+
+    def _sample_member(self, lines: int) -> bytes:
+        """
+        Samples the large text member left open by `_read_member`. A stream cannot
+        seek to the tail, so the member is read through once, keeping only the
+        window at each end and counting its lines.
+
+        :param lines: The number of lines to keep from each end.
+        :type lines: int
+        :return: The stripped sample.
+        :rtype: bytes
+        :raises ValueError: If the member cannot be decompressed.
+        """
+        _, size, f, head = self._archive_stream
+        self._archive_stream = None
+        try:
+            with f:
+                head += f.read(max(SAMPLE_WINDOW_BYTES - len(head), 0))
+                tail, breaks = self._read_tail(f, head)
+        except self.archive.errors as e:
+            raise ValueError(f"cannot read archive member: {e}") from e
+        self.stats.count("bytes_read", size)
+        return self._render_sample(head, tail, size, lines, breaks)
+
+    def _open_object_store(self) -> _GitObjectStore:
+        """
+        Opens the object store of the repository at root_dir: the git directory of
+        a work tree, or root_dir itself if it is a bare repository.
+
+        :return: The object store.
+        :rtype: _GitObjectStore
+        :raises ValueError: If root_dir is not a git repository.
+        """
+        git_dir = _find_git_dir(self.root_dir)
+        if git_dir is None and (self.root_dir / "objects").is_dir() and (self.root_dir / "HEAD").is_file():
+            git_dir = self.root_dir
+        if git_dir is None:
+            raise ValueError(f"{self.root_dir} is not a git repository.")
+        return _GitObjectStore(git_dir)
+
+    def _load_tree_ignore_rules(self) -> IgnoreLayers:
+        """
+        Loads the ignore rules of the revision's root `.gitignore`. Nested ones are
+        layered on top during `_walk_tree`; files outside the tree do not apply.
+
+        :return: The ignore layers that apply to the whole tree.
+        :rtype: IgnoreLayers
+        :raises ValueError: If the root tree cannot be read.
+        """
+        started = time.perf_counter_ns()
+        layers = self._extend_tree_ignore_layers((), self._git_store.read_tree(self._rev_tree), "")
+        if layers:
+            logging.info(f"Applying ignore rules from: {self.rev}:{IGNORE_FILENAME}")
+        else:
+            logging.warning("No .gitignore file found in the root tree of the revision.")
+        self.stats.add("ignore", time.perf_counter_ns() - started)
+        return layers
+
+    def _extend_tree_ignore_layers(self, layers: IgnoreLayers, entries: List[Tuple[int, bytes, bytes]],
+                                   prefix: str) -> IgnoreLayers:
+        """
+        Like `_extend_ignore_layers`, for a tree of the revision.
+
+        :param layers: The layers inherited from the parent tree.
+        :type layers: IgnoreLayers
+        :param entries: The tree's entries, as returned by `_GitObjectStore.read_tree`.
+        :type entries: List[Tuple[int, bytes, bytes]]
+        :param prefix: The tree's relative POSIX path, including the trailing slash.
+        :type prefix: str
+        :return: The layers that apply to the tree's children.
+        :rtype: IgnoreLayers
+        """
+        for mode, name, oid in entries:
+            if name == IGNORE_FILENAME.encode():
+                if mode & GIT_MODE_TYPE_MASK == GIT_MODE_FILE:
+                    source = f"{self.rev}:{prefix}{IGNORE_FILENAME}"
+                    try:
+                        rules = self._compile_ignore_rules(self._git_store.read_typed(oid, "blob"), source)
+                    except (OSError, ValueError) as e:
+                        logging.error(f"Failed to read ignore file {source}: {e}. Proceeding without its rules.")
+                        break
+                    if rules:
+                        logging.debug(f"Applying ignore rules from: {source}")
+                        return layers + ((len(prefix), rules),)
+                break
+        return layers
+
+    def _extend_ignore_layers(self, layers: IgnoreLayers, entries: List[os.DirEntry],
+                              prefix: str) -> IgnoreLayers:
+        """
+        Returns the ignore layers for a directory's children, adding the
+        directory's own `.gitignore` on top of the inherited layers.
+
+        :param layers: The layers inherited from the parent directory.
+        :type layers: IgnoreLayers
+        :param entries: The directory's entries.
+        :type entries: List[os.DirEntry]
+        :param prefix: The directory's relative POSIX path, including the trailing slash.
+        :type prefix: str
+        :return: The layers that apply to the directory's children.
+        :rtype: IgnoreLayers
+        """
+        for entry in entries:
+            if entry.name == IGNORE_FILENAME:
+                if entry.is_file():
+                    rules = self._load_ignore_file(entry.path)
+                    if rules:
+                        logging.debug(f"Applying ignore rules from: {entry.path}")
+                        return layers + ((len(prefix), rules),)
+                break
+        return layers
+
+    @staticmethod
+    def _is_ignored(relative_path: str, is_dir: bool, layers: IgnoreLayers) -> bool:
+        """
+        Decides whether a path is ignored. Deeper ignore files take precedence,
+        so the layers are consulted from the innermost outwards and the first
+        one with a matching rule decides.
+
+        :param relative_path: The POSIX path relative to the repository root.
+        :type relative_path: str
+        :param is_dir: Whether the path is a directory.
+        :type is_dir: bool
+        :param layers: The ignore layers that apply to the path.
+        :type layers: IgnoreLayers
+        :return: True if the path is ignored.
+        :rtype: bool
+        """
+        for offset, rules in reversed(layers):
+            verdict = rules.match(relative_path[offset:], is_dir)
+            if verdict is not None:
+                return verdict
+        return False
+
+    @staticmethod
+    def _is_binary(filepath: Path) -> bool:
+        """
+        Checks if a file is likely binary by searching for null bytes within its
+        initial segment. Returns False if the file is unreadable.
+
+        :param filepath: The path to the file to check.
+        :type filepath: Path
+        :return: True if the file is likely binary, False otherwise.
+        :rtype: bool
+        """
+        try:
+            with filepath.open("rb") as f:
+                return b'\0' in f.read(BINARY_CHECK_BYTES)
+        except IOError:
+            logging.warning(f"Could not read file to check for binary content: {filepath}")
+            return False
+
+    @staticmethod
+    def _read_file(filepath: Path, max_bytes: Optional[int] = None) -> Tuple[bool, Optional[bytes]]:
+        """
+        Reads a file with a single open. The first block is checked for null
+        bytes like `_is_binary` does; for text files it is reused as the start
+        of the content and the rest is read from the same descriptor.
+
+        :param filepath: The path to the file to read.
+        :type filepath: Path
+        :param max_bytes: Text files larger than this are not loaded.
+        :type max_bytes: Optional[int]
+        :return: Whether the file is likely binary, and the content of text files,
+                 or None if the file is larger than max_bytes.
+        :rtype: Tuple[bool, Optional[bytes]]
+        :raises IOError: If the file cannot be read.
+        """
+        # Unbuffered, so each read is a single system call without an extra copy
+        with filepath.open("rb", buffering=0) as f:
+            head = RepoMixer._read_block(f, BINARY_CHECK_BYTES)
+            if b'\0' in head:
+                return True, b""
+            if len(head) < BINARY_CHECK_BYTES:
+                # The whole file is read, so its length is its size
+                return False, head if max_bytes is None or len(head) <= max_bytes else None
+            if max_bytes is not None and os.fstat(f.fileno()).st_size > max_bytes:
+                return False, None
+            return False, head + f.readall()
+
+    @staticmethod
+    def _read_block(f, size: int) -> bytes:
+        """
+        Reads size bytes from an unbuffered file. A single system call may return
+        fewer bytes before the end of the file, e.g. on network file systems or
+        when interrupted by a signal, so reads are repeated until the block is
+        full or a read returns nothing.
+
+        :param f: An unbuffered binary file object.
+        :param size: The number of bytes to read.
+        :type size: int
+        :return: The block, shorter than size only at the end of the file.
+        :rtype: bytes
+        """
+        block = f.read(size)
+        while 0 < len(block) < size:
+            more = f.read(size - len(block))
+            if not more:
+                break
+            block += more
+        return block
+
+    @staticmethod
+    def _iter_stripped_text(f, limit: Optional[int] = None, head: bytes = b"") -> Iterator[str]:
+        """
+        Decodes a file in chunks and yields its text exactly as `_decode_text`
+        followed by `str.strip` would produce it. Line endings split across
+        chunks are carried over, and trailing whitespace is held back until more
+        text follows it, so memory is bounded by the chunk size plus the longest
+        run of whitespace.
+
+        :param f: A binary file object positioned at the start of the content, or after head.
+        :param limit: Read at most this many bytes.
+        :type limit: Optional[int]
+        :param head: The start of the content, already read from f.
+        :type head: bytes
+        :yield: Consecutive pieces of the stripped text.
+        :rtype: Iterator[str]
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        remaining = limit
+        started = False
+        pending = ""
+        carry_cr = False
+        while True:
+            size = STREAM_CHUNK_BYTES if remaining is None else min(STREAM_CHUNK_BYTES, remaining)
+            if head:
+                raw, head = head[:size], head[size:]
+            else:
+                raw = f.read(size) if size else b""
+            final = not raw
+            if remaining is not None:
+                remaining -= len(raw)
+            text = decoder.decode(raw, final=final)
+            if carry_cr:
+                text = "\r" + text
+            carry_cr = not final and text.endswith("\r")
+            if carry_cr:
+                text = text[:-1]
+            if "\r" in text:
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+            if not started:
+                text = text.lstrip()
+                started = bool(text)
+            body = text.rstrip()
+            if body:
+                yield pending + body
+                pending = text[len(body):]
+            else:
+                pending += text
+            if final:
+                return
+
+    def _stream_text(self, file_path: Path, relative_path: str, data: Optional[bytes] = None
+                     ) -> Iterator[bytes]:
+        """
+        Renders the segment of a large text file in bounded memory. Files above
+        max_file_size are cut there and followed by a truncation marker.
+
+        :param file_path: The path to the file to render.
+        :type file_path: Path
+        :param relative_path: The POSIX path of the file relative to the root.
+        :type relative_path: str
+        :param data: The content, if it is already in memory, e.g. a blob of the revision.
+                     For archives, the member left open by `_read_member` is read instead.
+        :type data: Optional[bytes]
+        :yield: Consecutive chunks of the segment.
+        :rtype: Iterator[bytes]
+        """
+        logging.debug(f"Streaming: {relative_path}")
+        yield (f"--- {relative_path} ---\n".encode("utf-8", errors="ignore")
+               + f"```{self._get_lang(file_path)}\n".encode("utf-8"))
+        marker = b""
+        # Only the time spent producing chunks is counted, not the time the consumer holds them
+        started = time.perf_counter_ns()
+        try:
+            head = b""
+            if data is not None:
+                f, size = io.BytesIO(data), len(data)
+            elif self.archive is not None:
+                stream, self._archive_stream = self._archive_stream, None
+                if stream is None or stream[0] != relative_path:
+                    raise ValueError(f"{relative_path} is not the current archive member")
+                _, size, f, head = stream
+            else:
+                f, size = file_path.open("rb", buffering=0), None
+            with f:
+                if size is None:
+                    size = os.fstat(f.fileno()).st_size
+                limit = None
+                if self.max_file_size is not None and size > self.max_file_size:
+                    limit = self.max_file_size
+                    marker = f"\n[... truncated: showing the first {limit} of {size} bytes]".encode("utf-8")
+                self.stats.count("streamed")
+                if limit is not None:
+                    self.stats.count("truncated")
+                self.stats.count("bytes_read", min(size, limit or size))
+                for text in self._iter_stripped_text(f, limit, head):
+                    chunk = text.encode("utf-8")
+                    self.stats.add("stream", time.perf_counter_ns() - started)
+                    yield chunk
+                    started = time.perf_counter_ns()
+        except (IOError, ValueError) + (self.archive.errors if self.archive is not None else ()) as e:
+            logging.error(f"Failed to process file {relative_path}: {e}")
+            marker = f"\n[Error reading file: {e}]".encode("utf-8", errors="ignore")
+            self.stats.count("errors")
+        self.stats.add("stream", time.perf_counter_ns() - started)
+        yield marker + b"\n```\n\n"
+
+    def _sample_lines(self, relative_path: str) -> Optional[int]:
+        """
+        Returns the number of lines to keep from each end of a file, if a
+        sampling policy matches it.
+
+        :param relative_path: The POSIX path of the file relative to the root.
+        :type relative_path: str
+        :return: The line count of the first matching policy, or None.
+        :rtype: Optional[int]
+        """
+        basename = relative_path.rpartition("/")[2]
+        for pattern, lines in self.sample:
+            if fnmatch.fnmatchcase(relative_path if "/" in pattern else basename, pattern):
+                return lines
+        return None
+
+    @staticmethod
+    def _sample_text(file_path: Path, lines: int, data: Optional[bytes] = None
+                     ) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """
+        Renders the first and last lines of a text file with a summary line in
+        between. The middle of a file larger than the two windows is never kept:
+        up to SAMPLE_COUNT_MAX_BYTES it is read through to count the lines
+        exactly, and beyond that the tail is reached with a seek and the summary
+        gives only the size.
+
+        :param file_path: The path to the file to sample.
+        :type file_path: Path
+        :param lines: The number of lines to keep from each end.
+        :type lines: int
+        :param data: The content, if it is already in memory, e.g. a blob of the revision.
+        :type data: Optional[bytes]
+        :return: The stripped sample, or None if the file is binary or short enough
+                 to be rendered in full. In that case also what was read from the
+                 file, so that it is not opened again: the whole content, or the
+                 first window of a binary file; otherwise None.
+        :rtype: Tuple[Optional[bytes], Optional[bytes]]
+        :raises IOError: If the file cannot be read.
+        """
+        if data is not None:
+            size = len(data)
+            if b'\0' in data[:BINARY_CHECK_BYTES]:
+                return None, None
+            if size > 2 * SAMPLE_WINDOW_BYTES:
+                head, tail = data[:SAMPLE_WINDOW_BYTES], data[size - SAMPLE_WINDOW_BYTES:]
+                breaks = RepoMixer._count_line_breaks(data)
+            else:
+                head, tail, breaks = data, None, None
+            return RepoMixer._render_sample(head, tail, size, lines, breaks), None
+
+        with file_path.open("rb", buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            head = RepoMixer._read_block(f, SAMPLE_WINDOW_BYTES)
+            if b'\0' in head[:BINARY_CHECK_BYTES]:
+                return None, head
+            if size <= 2 * SAMPLE_WINDOW_BYTES:
+                head += f.readall()
+                tail = breaks = None
+            elif size <= SAMPLE_COUNT_MAX_BYTES:
+                tail, breaks = RepoMixer._read_tail(f, head)
+            else:
+                f.seek(size - SAMPLE_WINDOW_BYTES)
+                tail, breaks = RepoMixer._read_block(f, SAMPLE_WINDOW_BYTES), None
+        sampled = RepoMixer._render_sample(head, tail, size, lines, breaks)
+        return sampled, head if sampled is None else None
+
+    @staticmethod
+    def _read_tail(f, head: bytes) -> Tuple[bytes, int]:
+        """
+        Reads a file through to its end, keeping only the last window, and counts
+        the line breaks of the whole content.
+
+        :param f: A binary file object positioned after head.
+        :param head: The start of the content, already read from f.
+        :type head: bytes
+        :return: The last SAMPLE_WINDOW_BYTES read after head, and the line breaks of head and the rest.
+        :rtype: Tuple[bytes, int]
+        """
+        breaks = RepoMixer._count_line_breaks(head)
+        tail = previous = b""
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_BYTES), b""):
+            breaks += RepoMixer._count_line_breaks(chunk, (previous or head).endswith(b"\r"))
+            tail = (tail + chunk)[-SAMPLE_WINDOW_BYTES:]
+            previous = chunk
+        return tail, breaks
+
+    @staticmethod
+    def _count_line_breaks(data: bytes, after_cr: bool = False) -> int:
+        """
+        Counts the line breaks of data as `_decode_text` normalizes them: CRLF, CR and LF.
+
+        :param data: The bytes to count in.
+        :type data: bytes
+        :param after_cr: Whether data follows a CR, so that a leading LF ends a CRLF already counted.
+        :type after_cr: bool
+        :return: The number of line breaks.
+        :rtype: int
+        """
+        breaks = data.count(b"\n")
+        if b"\r" in data:
+            breaks += data.count(b"\r") - data.count(b"\r\n")
+        if after_cr and data.startswith(b"\n"):
+            breaks -= 1
+        return breaks
+
+    @staticmethod
+    def _render_sample(head: bytes, tail: Optional[bytes], size: int, lines: int,
+                       breaks: Optional[int] = None) -> Optional[bytes]:
+        """
+        Renders a sample from the windows read by `_sample_text` or `_sample_member`.
+
+        :param head: The first window, or the whole content if tail is None.
+        :type head: bytes
+        :param tail: The last window, or None.
+        :type tail: Optional[bytes]
+        :param size: The size of the whole content.
+        :type size: int
+        :param lines: The number of lines to keep from each end.
+        :type lines: int
+        :param breaks: The line breaks of the whole content, if they were counted; only used with tail.
+        :type breaks: Optional[int]
+        :return: The stripped sample, or None if the content is short enough to be rendered in full.
+        :rtype: Optional[bytes]
+        """
+        if tail is None:
+            # Small enough to have been read whole; sample only if it has more lines than kept
+            head_lines = tail_lines = RepoMixer._decode_text(head).strip().split("\n")
+            if len(head_lines) <= 2 * lines:
+                return None
+            total = f"{len(head_lines)} lines ({size} bytes)"
+        else:
+            # The window ends may cut lines; never show the partial ones
+            head_text, tail_text = RepoMixer._decode_text(head), RepoMixer._decode_text(tail)
+            head_lines = head_text.lstrip().split("\n")[:-1]
+            tail_lines = tail_text.rstrip().split("\n")[1:]
+            if breaks is None:
+                total = f"{size} bytes"
+            else:
+                # The rendering is stripped, so line breaks in the whitespace at either end are not lines
+                breaks -= head_text[:len(head_text) - len(head_text.lstrip())].count("\n")
+                breaks -= tail_text[len(tail_text.rstrip()):].count("\n")
+                total = f"{breaks + 1} lines ({size} bytes)"
+        kept_head, kept_tail = head_lines[:lines], tail_lines[-lines:]
+        summary = f"[... sampled: first {len(kept_head)} and last {len(kept_tail)} of {total} ...]"
+        return "\n".join(kept_head + [summary] + kept_tail).encode("utf-8")
+
+    def _segment_chunks(self, segment: _Segment, data: Optional[bytes]) -> Iterable[bytes]:
+        """
+        Returns the chunks to write for a segment: data, or the streamed file.
+
+        :param segment: The segment.
+        :type segment: _Segment
+        :param data: The bytes to write for the segment, or None if it is streamed.
+        :type data: Optional[bytes]
+        :return: The chunks to write.
+        :rtype: Iterable[bytes]
+        """
+        if data is not None:
+            return (data,)
+        return self._stream_text(self.root_dir / segment.relative_path, segment.relative_path)
+
+    @staticmethod
+    def _decode_text(data: bytes) -> str:
+        """
+        Decodes file content the way `Path.read_text` does in universal newlines
+        mode, ignoring invalid UTF-8 sequences.
+
+        :param data: The raw content.
+        :type data: bytes
+        :return: The decoded text with line endings normalized to "\\n".
+        :rtype: str
+        """
+        text = data.decode("utf-8", errors="ignore")
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    @staticmethod
+    def _is_utf8(data: bytes) -> bool:
+        """
+        Checks whether data is valid UTF-8 without keeping a decoded copy.
+
+        :param data: The raw content.
+        :type data: bytes
+        :return: True if data is valid UTF-8.
+        :rtype: bool
+        """
+        if data.isascii():
+            return True
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        view = memoryview(data)
+        try:
+            for start in range(0, len(view), UTF8_VALIDATE_CHUNK_BYTES):
+                decoder.decode(view[start:start + UTF8_VALIDATE_CHUNK_BYTES])
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return False
+        return True
+
+    @staticmethod
+    def _strip_utf8(data: bytes) -> bytes:
+        """
+        Strips valid UTF-8 bytes exactly like `str.strip` strips the decoded text.
+        ASCII whitespace is handled by `bytes.strip`; only edge characters that
+        may be Unicode whitespace are decoded individually.
+
+        :param data: Valid UTF-8 content.
+        :type data: bytes
+        :return: The stripped content.
+        :rtype: bytes
+        """
+        data = data.strip()
+        while data:
+            lead = data[0]
+            if lead >= 0x80:
+                width = 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+                if not data[:width].decode("utf-8").isspace():
+                    break
+                data = data[width:].strip()
+            elif data[:1] in EXTRA_ASCII_WHITESPACE:
+                data = data[1:].strip()
+            else:
+                break
+        while data:
+            if data[-1] >= 0x80:
+                start = len(data) - 1
+                while data[start] & 0xC0 == 0x80:
+                    start -= 1
+                if not data[start:].decode("utf-8").isspace():
+                    break
+                data = data[:start].strip()
+            elif data[-1:] in EXTRA_ASCII_WHITESPACE:
+                data = data[:-1].strip()
+            else:
+                break
+        return data
+
+    @staticmethod
+    def _get_lang(filename: Path) -> str:
+        """
+        Determines the Markdown language identifier from a filename's extension.
+
+        :param filename: The path to the file.
+        :type filename: Path
+        :return: The language identifier string (e.g., "python", "javascript"), or an empty string if unknown.
+        :rtype: str
+        """
+        name = filename.name.lower()
+        if "dockerfile" in name:
+            return "dockerfile"
+        return EXTENSION_TO_LANG.get(filename.suffix.lower(), "")
+
+    def _uncompressed_output_name(self) -> str:
+        """
+        Returns the name of the output file without the suffix of its compression
+        method, e.g. repomix.txt for repomix.txt.gz.
+
+        :return: The file name.
+        :rtype: str
+        """
+        name = self.output_file.name
+        suffix = COMPRESSION_SUFFIXES.get(self.compress)
+        if suffix and name.endswith(suffix):
+            name = name[:-len(suffix)]
+        return name
+
+    def _shard_manifest_files(self) -> List[Path]:
+        """
+        Returns the paths of the shard manifests of this output name for every
+        compression method, e.g. repomix.txt.shards.json and repomix.txt.gz.shards.json.
+
+        :return: The paths, the uncompressed one first.
+        :rtype: List[Path]
+        """
+        name = self._uncompressed_output_name()
+        return [self.output_file.with_name(name + suffix + SHARD_MANIFEST_SUFFIX)
+                for suffix in ("", *COMPRESSION_SUFFIXES.values())]
+
+    def _compile_shard_part_pattern(self) -> re.Pattern:
+        """
+        Compiles a pattern matching the absolute path of every part `_shard_path`
+        can produce for this output name, with or without a compression suffix.
+
+        :return: The compiled pattern, to be used with `fullmatch`.
+        :rtype: re.Pattern
+        """
+        stem, dot, suffixes = self._uncompressed_output_name().partition(".")
+        compression = "|".join(re.escape(suffix) for suffix in COMPRESSION_SUFFIXES.values())
+        return re.compile(re.escape(str(self.output_file.with_name(stem))) + r"\.part\d{3,}"
+                          + re.escape(dot + suffixes) + f"(?:{compression})?")
+
+    def _excluded_paths(self) -> set:
+        """
+        Returns the absolute paths that are never mixed: the script itself and
+        the files this tool writes, including the shard manifests of every
+        compression method and the parts they list. Parts are further matched
+        by `_is_excluded`.
+
+        :return: The excluded paths as strings.
+        :rtype: set
+        """
+        excluded_paths = {str(self.script_file)}
+        if self.output_file is not None:
+            excluded_paths.update((str(self.output_file), str(self.manifest_file),
+                                   str(self._temp_path(self.output_file)),
+                                   str(self._temp_path(self.manifest_file))))
+            for manifest_file in self._shard_manifest_files():
+                excluded_paths.update((str(manifest_file), str(self._temp_path(manifest_file))))
+                excluded_paths.update(str(path) for path in self._read_shard_manifest_parts(manifest_file))
+        return excluded_paths
+
+    def _is_excluded(self, path: str, excluded_paths: set) -> bool:
+        """
+        Checks whether an absolute path is one of `_excluded_paths` or a part of
+        sharded output.
+
+        :param path: The absolute path.
+        :type path: str
+        :param excluded_paths: The paths of `_excluded_paths`.
+        :type excluded_paths: set
+        :return: True if the path must not be mixed.
+        :rtype: bool
+        """
+        return path in excluded_paths or (self._shard_part_pattern is not None and
+                                          self._shard_part_pattern.fullmatch(path) is not None)
+
+    def _scan_directory(self, current_dir: str, prefix: str, layers: IgnoreLayers, excluded_paths: set
+                        ) -> Tuple[IgnoreLayers, List[Tuple[Path, str]], List[Tuple[str, str]]]:
+        """
+        Lists one directory and filters its entries with the ignore rules.
+
+        :param current_dir: The absolute path of the directory.
+        :type current_dir: str
+        :param prefix: Its POSIX path relative to the root, with a trailing "/", or "" for the root.
+        :type prefix: str
+        :param layers: The ignore layers inherited from its parent.
+        :type layers: IgnoreLayers
+        :param excluded_paths: The paths of `_excluded_paths`.
+        :type excluded_paths: set
+        :return: The ignore layers of the directory, its eligible files as (absolute path,
+                 relative path), and its subdirectories to traverse as (absolute path,
+                 relative prefix), both in `os.scandir` order.
+        :rtype: Tuple[IgnoreLayers, List[Tuple[Path, str]], List[Tuple[str, str]]]
+        :raises OSError: If the directory cannot be accessed.
+        """
+        started = time.perf_counter_ns()
+        with os.scandir(current_dir) as it:
+            entries = list(it)
+        ignore_started = time.perf_counter_ns()
+        if prefix:
+            layers = self._extend_ignore_layers(layers, entries, prefix)
+        ignore_ns = time.perf_counter_ns() - ignore_started
+
+        files = []
+        subdirs = []
+        ignored = 0
+        for entry in entries:
+            # --- Primary Exclusion Checks (applies to both files and dirs) ---
+            if self._is_excluded(entry.path, excluded_paths):
+                continue
+
+            # Relative paths are always POSIX for consistent matching against ignore patterns
+            relative_path = prefix + entry.name
+            if relative_path.startswith(DEFAULT_IGNORE_PATTERNS):
+                continue
+
+            is_dir = entry.is_dir()
+            dir_prefix = relative_path + "/"
+            # Prune default-ignored directories themselves, not just their children
+            if is_dir and dir_prefix.startswith(DEFAULT_IGNORE_PATTERNS):
+                continue
+
+            ignore_started = time.perf_counter_ns()
+            is_ignored = self._is_ignored(relative_path, is_dir, layers)
+            ignore_ns += time.perf_counter_ns() - ignore_started
+            if is_ignored:
+                ignored += 1
+                continue
+
+            # --- Item Processing ---
+            if is_dir:
+                subdirs.append((entry.path, dir_prefix))
+            elif entry.is_file():
+                files.append((Path(entry.path), relative_path))
+        self.stats.add("ignore", ignore_ns, "ignored", ignored)
+        self.stats.add("walk", time.perf_counter_ns() - started - ignore_ns, "directories")
+        return layers, files, subdirs
+
+    def _walk_repo(self, on_directory: Optional[Callable[[str, str, IgnoreLayers], None]] = None,
+                   start: Optional[Tuple[str, str, IgnoreLayers]] = None) -> Iterator[Tuple[Path, str]]:
+        """
+        Walks the repository, yielding eligible files while respecting layered
+        ignore rules to prune directory traversal efficiently. This is a non-recursive
+        implementation to prevent stack depth issues.
+
+        The walk is built on `os.scandir` so that the file type cached in each
+        `DirEntry` is reused instead of issuing extra stat calls, and relative
+        paths are built by carrying the parent prefix down the stack. Each
+        directory inherits its parent's ignore layers, extended by its own
+        `.gitignore`, so a rule is only evaluated for paths it can apply to.
+
+        A directory's files come first, followed by the complete subtrees of its
+        subdirectories in reverse `os.scandir` order.
+
+        :param on_directory: Called with (absolute path, relative prefix, ignore layers)
+                             for every directory that is traversed.
+        :type on_directory: Optional[Callable[[str, str, IgnoreLayers], None]]
+        :param start: Walk only the subtree of this (absolute path, relative prefix,
+                      inherited ignore layers) instead of the whole repository.
+        :type start: Optional[Tuple[str, str, IgnoreLayers]]
+        :yield: Tuples of (absolute path, POSIX path relative to the root) for eligible files.
+        :rtype: Iterator[Tuple[Path, str]]
+        """
+        excluded_paths = self._excluded_paths()
+        dirs_to_visit = [start or (str(self.root_dir), "", self.ignore_layers)]
+
+        while dirs_to_visit:
+            current_dir, prefix, layers = dirs_to_visit.pop()
+            try:
+                layers, files, subdirs = self._scan_directory(current_dir, prefix, layers, excluded_paths)
+            except OSError as e:
+                logging.warning(f"Cannot access directory {current_dir}: {e}")
+                self.stats.count("errors")
+                continue
+            if on_directory is not None:
+                on_directory(current_dir, prefix, layers)
+            dirs_to_visit.extend((path, dir_prefix, layers) for path, dir_prefix in subdirs)
+            yield from files
+
+    def _expand_partition(self, unit: tuple, excluded_paths: set) -> List[tuple]:
+        """
+        Splits a subtree unit into the units that produce the same files in walk order:
+        the directory's own files, then each subdirectory's subtree in reverse order.
+
+        :param unit: A ("tree", absolute path, relative prefix, inherited ignore layers) unit.
+        :type unit: tuple
+        :param excluded_paths: The paths of `_excluded_paths`.
+        :type excluded_paths: set
+        :return: ("files", [(absolute path, relative path), ...]) and "tree" units.
+        :rtype: List[tuple]
+        """
+        _, current_dir, prefix, layers = unit
+        try:
+            layers, files, subdirs = self._scan_directory(current_dir, prefix, layers, excluded_paths)
+        except OSError as e:
+            logging.warning(f"Cannot access directory {current_dir}: {e}")
+            return []
+        units = [("files", [(str(path), relative_path) for path, relative_path in files])] if files else []
+        units.extend(("tree", path, dir_prefix, layers) for path, dir_prefix in reversed(subdirs))
+        return units
+
+    def _plan_partitions(self) -> List[tuple]:
+        """
+        Splits the walk into units for the worker processes, expanding the
+        top directory levels until there are enough subtrees to balance the load.
+        Concatenating the outputs of the units in order gives the serial output.
+
+        :return: The units, in output order.
+        :rtype: List[tuple]
+        """
+        excluded_paths = self._excluded_paths()
+        units = self._expand_partition(("tree", str(self.root_dir), "", self.ignore_layers), excluded_paths)
+        target = self.partitions * PARTITION_UNITS_PER_WORKER
+        for _ in range(PARTITION_MAX_DEPTH - 1):
+            trees = sum(1 for unit in units if unit[0] == "tree")
+            if trees == 0 or trees >= target:
+                break
+            units = [expanded for unit in units
+                     for expanded in (self._expand_partition(unit, excluded_paths) if unit[0] == "tree" else [unit])]
+        return units
+
+    def _render_partition(self, unit: tuple, spool_path: str) -> Tuple[int, list, tuple]:
+        """
+        Renders the files of one unit into a spool file. Runs in a worker process.
+
+        :param unit: A unit of `_plan_partitions`.
+        :type unit: tuple
+        :param spool_path: The file to write the rendered segments to.
+        :type spool_path: str
+        :return: The number of files read successfully, the binary cache keys seen,
+                 and the statistics of the unit from `RunStats.take`.
+        :rtype: Tuple[int, list, tuple]
+        """
+        if unit[0] == "files":
+            files = [(Path(path), relative_path) for path, relative_path in unit[1]]
+        else:
+            files = self._walk_repo(start=unit[1:])
+        file_count = 0
+        with open(spool_path, "wb") as f_spool:
+            for segment in self._iter_segments(files=files, save_cache=False):
+                for chunk in self._segment_chunks(segment, segment.data):
+                    f_spool.write(chunk)
+                file_count += segment.ok
+        binary_keys = list(self._binary_seen)
+        self._binary_seen.clear()
+        return file_count, binary_keys, self.stats.take()
+
+    def _iter_partitioned_output(self) -> Iterator[bytes]:
+        """
+        Yields the output of a partitioned run: the units of `_plan_partitions`
+        are rendered by worker processes into spool files, which are yielded
+        in order as soon as each one and its predecessors are complete.
+
+        :yield: Output bytes.
+        :rtype: Iterator[bytes]
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        import tempfile
+        started_ns = time.time_ns()
+        self.file_count = 0
+        self._start_binary_pass()
+        yield self._header()
+        units = self._plan_partitions()
+        logging.info(f"Walking {len(units)} partitions with {self.partitions} processes.")
+
+        log_level = logging.DEBUG if logging.getLogger().getEffectiveLevel() <= logging.DEBUG else logging.WARNING
+        with tempfile.TemporaryDirectory(prefix="repomix-spool-") as spool_dir, \
+                ProcessPoolExecutor(max_workers=self.partitions, initializer=_init_partition_worker,
+                                    initargs=(self, log_level)) as pool:
+            spools = [os.path.join(spool_dir, f"{position}.spool") for position in range(len(units))]
+            futures = [pool.submit(_partition_worker, unit, spool) for unit, spool in zip(units, spools)]
+            for future, spool in zip(futures, spools):
+                file_count, binary_keys, stats = future.result()
+                self.file_count += file_count
+                self._binary_seen.update(binary_keys)
+                self.stats.merge(stats)
+                with open(spool, "rb") as f_spool:
+                    while chunk := f_spool.read(STREAM_CHUNK_BYTES):
+                        yield chunk
+                os.remove(spool)
+        self._save_binary_cache(started_ns)
+
+    def _run_git(self, *args: str) -> List[str]:
+        """
+        Runs a git command in the root directory and returns its NUL-separated output.
+
+        :param args: The git arguments.
+        :type args: str
+        :return: The output records.
+        :rtype: List[str]
+        :raises OSError: If git cannot be run.
+        :raises subprocess.CalledProcessError: If git fails.
+        """
+        import subprocess
+        result = subprocess.run(["git", "-C", str(self.root_dir), *args],
+                                check=True, capture_output=True)
+        return [os.fsdecode(record) for record in result.stdout.split(b"\0") if record]
+
+    def _list_git_files(self) -> Optional[List[str]]:
+        """
+        Lists the tracked files of the work tree rooted at root_dir, plus the
+        untracked files not excluded by git's ignore rules when requested. The
+        index is parsed directly; `git ls-files` is the fallback for index
+        formats the parser does not support.
+
+        :return: Sorted relative POSIX paths, or None if root_dir is not a work tree root.
+        :rtype: Optional[List[str]]
+        """
+        import subprocess
+        git_dir = _find_git_dir(self.root_dir)
+        if git_dir is None:
+            logging.warning("The root directory is not a git work tree root; walking the file system instead.")
+            return None
+        try:
+            paths = _read_git_index(git_dir / "index", _git_hash_size(git_dir))
+            logging.info(f"Enumerating {len(paths)} tracked files from {git_dir / 'index'}")
+        except FileNotFoundError:
+            paths = []
+        except (OSError, ValueError, struct.error, IndexError) as e:
+            logging.info(f"Cannot parse the git index directly ({e}); using 'git ls-files'.")
+            try:
+                paths = self._run_git("ls-files", "-z", "--cached")
+            except (OSError, subprocess.CalledProcessError) as git_error:
+                logging.warning(f"Failed to list tracked files: {git_error}. Walking the file system instead.")
+                return None
+        if self.untracked:
+            try:
+                paths = sorted(set(paths).union(self._run_git("ls-files", "-z", "--others", "--exclude-standard")))
+            except (OSError, subprocess.CalledProcessError) as e:
+                logging.warning(f"Failed to list untracked files: {e}")
+        return paths
+
+    def _scan_tree(self, tree_oid: bytes, prefix: str, layers: IgnoreLayers, excluded_paths: set
+                   ) -> Tuple[IgnoreLayers, List[Tuple[bytes, str, bool]]]:
+        """
+        Like `_scan_directory`, for a tree of the revision. Symbolic links and
+        submodules are skipped; they have no content in the tree.
+
+        :param tree_oid: The tree id.
+        :type tree_oid: bytes
+        :param prefix: Its POSIX path relative to the root, with a trailing "/", or "" for the root.
+        :type prefix: str
+        :param layers: The ignore layers inherited from its parent.
+        :type layers: IgnoreLayers
+        :param excluded_paths: The paths of `_excluded_paths`.
+        :type excluded_paths: set
+        :return: The ignore layers of the tree, and its eligible entries as (object id,
+                 relative path, or prefix for subtrees, whether it is a subtree) in tree order.
+        :rtype: Tuple[IgnoreLayers, List[Tuple[bytes, str, bool]]]
+        :raises ValueError: If the tree cannot be read.
+        """
+        started = time.perf_counter_ns()
+        entries = self._git_store.read_tree(tree_oid)
+        ignore_started = time.perf_counter_ns()
+        if prefix:
+            layers = self._extend_tree_ignore_layers(layers, entries, prefix)
+        ignore_ns = time.perf_counter_ns() - ignore_started
+
+        items = []
+        ignored = 0
+        for mode, name, oid in entries:
+            kind = mode & GIT_MODE_TYPE_MASK
+            is_dir = kind == GIT_MODE_TREE
+            if not is_dir and kind != GIT_MODE_FILE:
+                continue
+            relative_path = prefix + os.fsdecode(name)
+            if relative_path.startswith(DEFAULT_IGNORE_PATTERNS) or self._is_excluded(
+                    str(self.root_dir / relative_path), excluded_paths):
+                continue
+            dir_prefix = relative_path + "/"
+            if is_dir and dir_prefix.startswith(DEFAULT_IGNORE_PATTERNS):
+                continue
+
+            ignore_started = time.perf_counter_ns()
+            is_ignored = self._is_ignored(relative_path, is_dir, layers)
+            ignore_ns += time.perf_counter_ns() - ignore_started
+            if is_ignored:
+                ignored += 1
+                continue
+            items.append((oid, dir_prefix if is_dir else relative_path, is_dir))
+        self.stats.add("ignore", ignore_ns, "ignored", ignored)
+        self.stats.add("walk", time.perf_counter_ns() - started - ignore_ns, "directories")
+        return layers, items
+
+    def _walk_tree(self) -> Iterator[Tuple[Path, str]]:
+        """
+        Walks the tree of the revision depth-first in tree order, which is the order
+        of `git ls-tree -r` and of the git index, and records the blob of each file
+        for `_render_file`. No work-tree file is accessed.
+
+        :yield: Tuples of (absolute path in a checkout, POSIX path relative to the root).
+        :rtype: Iterator[Tuple[Path, str]]
+        """
+        excluded_paths = self._excluded_paths()
+        stack = [iter([(self._rev_tree, "", True)])]
+        layers_stack = [self.ignore_layers]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                layers_stack.pop()
+                continue
+            oid, relative_path, is_dir = item
+            if not is_dir:
+                self._rev_blobs[relative_path] = oid
+                yield self.root_dir / relative_path, relative_path
+                continue
+            try:
+                layers, items = self._scan_tree(oid, relative_path, layers_stack[-1], excluded_paths)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Cannot read tree {self.rev}:{relative_path}: {e}")
+                self.stats.count("errors")
+                continue
+            stack.append(iter(items))
+            layers_stack.append(layers)
+
+    def _read_blob(self, relative_path: str) -> bytes:
+        """
+        :param relative_path: The POSIX path of a file yielded by `_walk_tree`.
+        :type relative_path: str
+        :return: The file's content in the revision.
+        :rtype: bytes
+        :raises ValueError: If the blob is missing or corrupt.
+        :raises OSError: If the object database cannot be read.
+        """
+        return self._git_store.read_typed(self._rev_blobs[relative_path], "blob")
+
+    def _list_changed_files(self, store: _GitObjectStore, base_tree: bytes) -> List[str]:
+        """
+        Lists the files added or changed since the diff base, plus the context files.
+        With a revision, its tree is compared with the base tree in the object
+        store; otherwise `git diff` compares the work tree with the base. Deleted
+        files are left out, as there is nothing to mix for them.
+
+        :param store: The repository's object store.
+        :type store: _GitObjectStore
+        :param base_tree: The tree id of the diff base.
+        :type base_tree: bytes
+        :return: Sorted relative POSIX paths.
+        :rtype: List[str]
+        :raises ValueError: If the trees cannot be read or git fails.
+        """
+        started = time.perf_counter_ns()
+        if self.rev is not None:
+            changed = store.diff_trees(base_tree, self._rev_tree)
+            for relative_path in self.context:
+                oid = store.lookup(self._rev_tree, relative_path)
+                if oid is None:
+                    logging.warning(f"Context file not found in {self.rev}: {relative_path}")
+                else:
+                    changed.append((relative_path, oid))
+            self._rev_blobs.update(changed)
+            paths = [relative_path for relative_path, _ in changed]
+        else:
+            import subprocess
+            try:
+                paths = self._run_git("diff", "--no-ext-diff", "--no-renames", "--name-only", "-z",
+                                      "--diff-filter=d", self._diff_base_commit.hex(), "--")
+                if self.untracked:
+                    paths += self._run_git("ls-files", "-z", "--others", "--exclude-standard")
+            except (OSError, subprocess.CalledProcessError) as e:
+                raise ValueError(f"Failed to list the files changed since {self.diff_base}: {e}") from e
+            for relative_path in self.context:
+                if (self.root_dir / relative_path).is_file():
+                    paths.append(relative_path)
+                else:
+                    logging.warning(f"Context file not found: {relative_path}")
+        paths = sorted(set(paths))
+        logging.info(f"Mixing {len(paths)} files changed since {self.diff_base}")
+        self.stats.add("walk", time.perf_counter_ns() - started)
+        return paths
+
+    def _iter_files(self, on_directory: Optional[Callable[[str, str, IgnoreLayers], None]] = None
+                    ) -> Iterator[Tuple[Path, str]]:
+        """
+        Yields the files to mix: the members of an archive root, the changed files with a
+        diff base, else the revision's tree when one is given, the git index when
+        requested, or `_walk_repo`.
+
+        :param on_directory: Passed through to `_walk_repo`.
+        :type on_directory: Optional[Callable[[str, str, IgnoreLayers], None]]
+        :yield: Tuples of (absolute path, POSIX path relative to the root).
+        :rtype: Iterator[Tuple[Path, str]]
+        """
+        if self.archive is not None:
+            yield from self._walk_archive()
+            return
+        if self._diff_paths is not None:
+            paths = self._diff_paths
+        elif self.rev is not None:
+            yield from self._walk_tree()
+            return
+        else:
+            paths = self._list_git_files() if self.git_index else None
+            if paths is None:
+                yield from self._walk_repo(on_directory)
+                return
+
+        excluded_paths = self._excluded_paths()
+        for relative_path in paths:
+            if relative_path.startswith(DEFAULT_IGNORE_PATTERNS):
+                continue
+            file_path = self.root_dir / relative_path
+            # Tracked files may be deleted or replaced in the work tree; blobs of a revision are not
+            if self._is_excluded(str(file_path), excluded_paths) or (self.rev is None and not file_path.is_file()):
+                continue
+            yield file_path, relative_path
+
+    @staticmethod
+    def _temp_path(path: Path) -> Path:
+        """
+        Returns the sibling path used to write a file before atomically replacing it.
+
+        :param path: The final path.
+        :type path: Path
+        :return: The temporary path.
+        :rtype: Path
+        """
+        return path.with_name(path.name + ".tmp")
+
+    def _render_file(self, file_path: Path, relative_path: str
+                     ) -> Tuple[Optional[bytes], bool, Optional[bytes], Optional[Tuple[int, ...]]]:
+        """
+        Reads a single file and renders its complete output segment. With more
+        than one job it runs on worker threads: statistics are kept per thread,
+        and the only shared state it updates is `_binary_seen`, with single set
+        additions. Archive members must be rendered one at a time, in archive
+        order, as the member being read is tracked in `_archive_member` and a large
+        one is left open in `_archive_stream` for `_stream_text`.
+
+        :param file_path: The path to the file to render.
+        :type file_path: Path
+        :param relative_path: The POSIX path of the file relative to the root.
+        :type relative_path: str
+        :return: The UTF-8 encoded segment, or None for large text files, which are left
+                 to `_stream_text`; whether the file was read successfully; the digest of
+                 the rendered text when deduplication applies to it; and its MinHash
+                 signature when near-duplicate detection applies to it.
+        :rtype: Tuple[Optional[bytes], bool, Optional[bytes], Optional[Tuple[int, ...]]]
+        """
+        logging.debug(f"Processing: {relative_path}")
+
+        # Use errors="ignore" in case of any unexpected encoding issues, such as undecodable file names
+        parts = [f"--- {relative_path} ---\n".encode("utf-8", errors="ignore")]
+        ok = True
+        digest = minhash = None
+        started = time.perf_counter_ns()
+        try:
+            # Blobs of the revision and archive members are read into memory, not from the work tree
+            sample_lines = self._sample_lines(relative_path) if self.sample else None
+            blob = None
+            if self.rev is not None:
+                blob = self._read_blob(relative_path)
+            elif self.archive is not None:
+                blob = self._read_member(relative_path, bool(sample_lines))
+            if not sample_lines:
+                sampled = None
+            elif blob is None and self.archive is not None:
+                sampled = self._sample_member(sample_lines)
+            else:
+                sampled, read = self._sample_text(file_path, sample_lines, blob)
+                if read is not None:
+                    # Read whole while sampling, or found binary; rendered from memory like a blob
+                    blob = read
+            if sampled is not None:
+                parts += [f"```{self._get_lang(file_path)}\n".encode("utf-8"), sampled, b"\n```\n\n"]
+                self.stats.add("read", time.perf_counter_ns() - started, "sampled")
+                return b"".join(parts), ok, digest, minhash
+            binary_key = None
+            if self.binary_cache_file is not None:
+                st = os.stat(file_path)
+                binary_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+            cached = binary_key in self._binary_cache
+            if cached:
+                is_binary, data = True, b""
+            elif blob is not None:
+                is_binary = b'\0' in blob[:BINARY_CHECK_BYTES]
+                data = b"" if is_binary else blob
+                if not is_binary and self.max_file_size is not None and len(blob) > self.max_file_size:
+                    data = None
+            elif self.archive is not None:
+                # A large text member, left open for `_stream_text`
+                is_binary, data = False, None
+            else:
+                is_binary, data = self._read_file(file_path, self._stream_threshold)
+            read_ns = time.perf_counter_ns()
+            if is_binary:
+                if binary_key is not None:
+                    self._binary_seen.add(binary_key)
+                parts.append(b"[Binary file, content not included]\n\n")
+                self.stats.add("binary", read_ns - started, "binary")
+                if cached:
+                    self.stats.count("binary_cached")
+            elif data is None:
+                if blob is not None:
+                    size = len(blob)
+                elif self.archive is not None:
+                    size = self._archive_stream[1]
+                else:
+                    size = os.stat(file_path).st_size
+                self.stats.add("read", time.perf_counter_ns() - started)
+                if self.oversize != "skip" or self.max_file_size is None or size <= self.max_file_size:
+                    if blob is not None:
+                        # Already in memory, so it is truncated here rather than streamed by the writer
+                        return b"".join(self._stream_text(file_path, relative_path, blob)), True, None, None
+                    return None, True, None, None
+                logging.info(f"Skipping content of {relative_path}: {size} bytes")
+                parts.append(f"[File too large, content not included: {size} bytes]\n\n".encode("utf-8"))
+                self.stats.count("skipped")
+            else:
+                self.stats.add("read", read_ns - started, "bytes_read", len(data))
+                self.stats.count("text")
+                lang = self._get_lang(file_path)
+                parts.append(f"```{lang}\n".encode("utf-8"))
+                if self._is_utf8(data):
+                    # Valid UTF-8 is normalized and stripped as bytes and never decoded
+                    if b"\r" in data:
+                        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+                    parts.append(self._strip_utf8(data))
+                else:
+                    # Use errors="ignore" for robust reading of source files
+                    parts.append(self._decode_text(data).strip().encode("utf-8"))
+                decoded_ns = time.perf_counter_ns()
+                self.stats.add("decode", decoded_ns - read_ns)
+                if self.dedupe and len(parts[-1]) >= DEDUPE_MIN_BYTES:
+                    digest = _content_digest(parts[-1])
+                    if self.near_dedupe is not None and len(parts[-1]) <= NEAR_DEDUPE_MAX_BYTES:
+                        minhash = _minhash_signature(parts[-1])
+                    self.stats.add("dedupe", time.perf_counter_ns() - decoded_ns)
+                parts.append(b"\n```\n\n")
+        except (IOError, UnicodeDecodeError, ValueError) as e:
+            logging.error(f"Failed to process file {relative_path}: {e}")
+            self.stats.count("errors")
+            # Unreadable files are rendered as text files whose content failed to load
+            parts[1:] = [f"```{self._get_lang(file_path)}\n".encode("utf-8"),
+                         f"[Error reading file: {e}]\n\n".encode("utf-8", errors="ignore")]
+            ok = False
+            digest = minhash = None
+        return b"".join(parts), ok, digest, minhash
+
+    def _render_entry(self, file_path: Path, relative_path: str,
+                      previous: Optional[Dict[str, list]],
+                      cache: Optional[Dict[str, _Segment]] = None) -> _Segment:
+        """
+        Renders a file, or reuses an earlier segment when the file's mtime, size
+        and inode match either the in-memory cache or the manifest of the previous run.
+
+        :param file_path: The path to the file to render.
+        :type file_path: Path
+        :param relative_path: The POSIX path of the file relative to the root.
+        :type relative_path: str
+        :param previous: The file entries of the previous manifest, if any.
+        :type previous: Optional[Dict[str, list]]
+        :param cache: Segments rendered earlier in this process, keyed by relative path.
+        :type cache: Optional[Dict[str, _Segment]]
+        :return: The segment for the file.
+        :rtype: _Segment
+        """
+        signature = None
+        if self.incremental or cache is not None:
+            try:
+                st = os.stat(file_path)
+                signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+            except OSError:
+                pass
+            cached = cache.get(relative_path) if cache else None
+            if signature is not None and cached is not None and cached.signature == signature:
+                self._binary_partial = True
+                return cached
+            entry = previous.get(relative_path) if previous else None
+            if signature is not None and entry and tuple(entry[:3]) == signature:
+                # Reused files are not classified again, so the binary cache cannot be pruned
+                self._binary_partial = True
+                return _Segment(relative_path, None, bool(entry[5]), signature, (entry[3], entry[4]))
+        data, ok, digest, minhash = self._render_file(file_path, relative_path)
+        return _Segment(relative_path, data, ok, signature, digest=digest, minhash=minhash,
+                        streamed=data is None)
+
+    def _iter_segments(self, previous: Optional[Dict[str, list]] = None,
+                       cache: Optional[Dict[str, _Segment]] = None,
+                       on_directory: Optional[Callable[[str, str, IgnoreLayers], None]] = None,
+                       files: Optional[Iterable[Tuple[Path, str]]] = None,
+                       save_cache: bool = True) -> Iterator[_Segment]:
+        """
+        Yields rendered segments in the exact order produced by `_iter_files`, or of `files`.
+
+        With more than one job, a thread pool reads and renders files ahead of
+        the consumer. The read-ahead window is bounded so that memory use does
+        not grow with repository size.
+
+        :param previous: The file entries of the previous manifest, for incremental runs.
+        :type previous: Optional[Dict[str, list]]
+        :param cache: Segments rendered earlier in this process, reused while unchanged.
+        :type cache: Optional[Dict[str, _Segment]]
+        :param on_directory: Passed through to `_iter_files`.
+        :type on_directory: Optional[Callable[[str, str, IgnoreLayers], None]]
+        :param files: Tuples of (absolute path, relative path) to render instead of `_iter_files`.
+        :type files: Optional[Iterable[Tuple[Path, str]]]
+        :param save_cache: Replace the binary cache with the binary files seen, once all
+                           segments are consumed. Otherwise they accumulate in `_binary_seen`.
+        :type save_cache: bool
+        :yield: Segments in walk order.
+        :rtype: Iterator[_Segment]
+        """
+        started_ns = time.time_ns()
+        if save_cache:
+            self._start_binary_pass()
+        if files is None:
+            files = self._iter_files(on_directory)
+        # Archive members are read in archive order, one at a time
+        if self.jobs == 1 or self.archive is not None:
+            for file_path, relative_path in files:
+                yield self._render_entry(file_path, relative_path, previous, cache)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            window = self.jobs * READ_AHEAD_PER_JOB
+            with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="repomix") as pool:
+                pending = deque()
+                for file_path, relative_path in files:
+                    pending.append(pool.submit(self._render_entry, file_path, relative_path,
+                                               previous, cache))
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        if save_cache:
+            self._save_binary_cache(started_ns)
+
+    def _load_binary_cache(self) -> frozenset:
+        """
+        Loads the keys of the files found to be binary by previous runs.
+
+        :return: The (device, inode, size, mtime_ns) keys; empty if there is no usable cache.
+        :rtype: frozenset
+        """
+        if self.binary_cache_file is None:
+            return frozenset()
+        try:
+            with self.binary_cache_file.open("rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return frozenset()
+        except IOError as e:
+            logging.warning(f"Could not read binary cache {self.binary_cache_file}: {e}")
+            return frozenset()
+        body = memoryview(data)[len(BINARY_CACHE_MAGIC):]
+        if not data.startswith(BINARY_CACHE_MAGIC) or len(body) % BINARY_CACHE_ENTRY.size:
+            logging.warning(f"Ignoring corrupt binary cache {self.binary_cache_file}")
+            return frozenset()
+        return frozenset(BINARY_CACHE_ENTRY.iter_unpack(body))
+
+    def _start_binary_pass(self) -> None:
+        """
+        Resets the binary files seen before a pass over the files. The pass is
+        partial, and the cache is merged rather than replaced when it is saved,
+        unless every file of the work tree is read and classified.
+        """
+        self._binary_seen = set()
+        self._binary_partial = (self._diff_paths is not None or bool(self.sample)
+                                or (self.git_index and not self.untracked))
+
+    def _save_binary_cache(self, started_ns: int) -> None:
+        """
+        Atomically writes the binary files seen in this run to the binary cache.
+        After a complete pass they replace it, which also drops entries for deleted
+        and changed files; after a partial pass they are added to its entries.
+
+        :param started_ns: When the run started; files modified since then are
+                           not cached, as they may change within the mtime resolution.
+        :type started_ns: int
+        """
+        if self.binary_cache_file is None:
+            return
+        keys = {key for key in self._binary_seen if key[3] < started_ns}
+        if self._binary_partial:
+            keys |= self._binary_cache
+        keys = sorted(keys)
+        if frozenset(keys) == self._binary_cache:
+            return
+        temp_file = self._temp_path(self.binary_cache_file)
+        try:
+            self.binary_cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with temp_file.open("wb") as f:
+                f.write(BINARY_CACHE_MAGIC + b"".join(BINARY_CACHE_ENTRY.pack(*key) for key in keys))
+            os.replace(temp_file, self.binary_cache_file)
+            self._binary_cache = frozenset(keys)
+        except IOError as e:
+            logging.warning(f"Failed to write binary cache {self.binary_cache_file}: {e}")
+
+    def _render_options(self) -> list:
+        """
+        Returns the options that change how a file is rendered, in the form they
+        take in the manifest, so that segments are only reused under the same options.
+
+        :return: The sample rules, the maximum file size and the oversize policy.
+        :rtype: list
+        """
+        return [[[pattern, lines] for pattern, lines in self.sample], self.max_file_size, self.oversize]
+
+    def _load_manifest(self) -> Optional[Dict[str, list]]:
+        """
+        Loads the manifest of the previous incremental run. The manifest is only
+        trusted if it matches this root and rendering options and the output file
+        is exactly as it was left, otherwise a full rebuild is done.
+
+        :return: The file entries keyed by relative path, or None if unusable.
+        :rtype: Optional[Dict[str, list]]
+        """
+        import json
+        try:
+            with self.manifest_file.open("r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            st = self.output_file.stat()
+            if (manifest["version"] != MANIFEST_VERSION or manifest["root"] != str(self.root_dir)
+                    or manifest["options"] != self._render_options()
+                    or manifest["output"] != [st.st_mtime_ns, st.st_size]):
+                logging.info("Manifest is stale; performing a full rebuild.")
+                return None
+            files = manifest["files"]
+            if not isinstance(files, dict):
+                raise ValueError("file entries are not a mapping")
+            return files
+        except FileNotFoundError:
+            logging.info("No previous manifest or output found; performing a full rebuild.")
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring corrupt manifest {self.manifest_file}: {e}")
+        return None
+
+    def _save_manifest(self, files: Dict[str, list], started_ns: int) -> None:
+        """
+        Atomically writes the manifest describing the output just written.
+
+        :param files: The file entries keyed by relative path.
+        :type files: Dict[str, list]
+        :param started_ns: When the run started; files modified since then are
+                           not trusted on the next run, as their content may
+                           have changed within the mtime resolution.
+        :type started_ns: int
+        """
+        for entry in files.values():
+            if entry[0] >= started_ns:
+                entry[0] = -1
+        st = self.output_file.stat()
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "root": str(self.root_dir),
+            "options": self._render_options(),
+            "output": [st.st_mtime_ns, st.st_size],
+            "files": files,
+        }
+        import json
+        temp_file = self._temp_path(self.manifest_file)
+        try:
+            with temp_file.open("w", encoding="utf-8") as f:
+                json.dump(manifest, f, separators=(",", ":"))
+            os.replace(temp_file, self.manifest_file)
+        except IOError as e:
+            logging.warning(f"Failed to write manifest {self.manifest_file}: {e}")
+
+    def _header(self, part: Optional[int] = None) -> bytes:
+        """
+        Returns the header that starts every output file.
+
+        :param part: The number of the part, for sharded output.
+        :type part: Optional[int]
+        :return: The UTF-8 encoded header.
+        :rtype: bytes
+        """
+        header = (f"# Repository Mix Context\n"
+                  + (f"# Part {part}\n" if part is not None else "")
+                  + f"# Root Directory (Absolute Path): {self.root_dir}\n"
+                  + (f"# Revision: {self.rev} ({self._rev_commit.hex()})\n" if self.rev is not None else "")
+                  + (f"# Changes since: {self.diff_base} ({self._diff_base_commit.hex()})\n"
+                     if self.diff_base is not None else "")
+                  + "# All subsequent file paths are relative to this root.\n\n")
+        return header.encode("utf-8", errors="ignore")
+
+    @staticmethod
+    def _segment_body(data: bytes) -> bytes:
+        """
+        Extracts the text between the code fences of a rendered text segment.
+
+        :param data: The rendered segment.
+        :type data: bytes
+        :return: The rendered file contents.
+        :rtype: bytes
+        """
+        start = data.index(b"\n", data.index(b"\n") + 1) + 1
+        return data[start:-len(b"\n```\n\n")]
+
+    def _near_duplicate_stub(self, segment: _Segment, original: str, similarity: float) -> Optional[bytes]:
+        """
+        Renders a near-duplicate as a unified diff against the earlier file. The
+        earlier file is read again rather than kept in memory, except for archive
+        members, which are kept compressed by `_keep_archive_body` while they fit.
+
+        :param segment: The rendered near-duplicate.
+        :type segment: _Segment
+        :param original: The relative path of the earlier file.
+        :type original: str
+        :param similarity: Their estimated similarity.
+        :type similarity: float
+        :return: The stub, or None if it would not be shorter than the segment
+                 or the earlier archive member is no longer kept.
+        :rtype: Optional[bytes]
+        """
+        if self.archive is not None:
+            body = self._archive_bodies.get(original)
+            if body is None:
+                return None
+            self._archive_bodies.move_to_end(original)
+            data, ok = zlib.decompress(body), True
+        else:
+            data, ok, _, _ = self._render_file(self.root_dir / original, original)
+        if data is None or not ok:
+            return None
+        import difflib
+        before = self._segment_body(data).decode("utf-8").splitlines()
+        after = self._segment_body(segment.data).decode("utf-8").splitlines()
+        diff = "\n".join(difflib.unified_diff(before, after, original, segment.relative_path,
+                                              n=NEAR_DEDUPE_CONTEXT_LINES, lineterm=""))
+        stub = (f"--- {segment.relative_path} --- [similar to: {original} ({similarity:.0%})]\n"
+                f"```diff\n{diff}\n```\n\n").encode("utf-8", errors="ignore")
+        return stub if len(stub) < len(segment.data) else None
+
+    def _dedupe_segment(self, segment: _Segment, seen: Dict[bytes, str],
+                        near: Optional[_NearDuplicateIndex] = None) -> bytes:
+        """
+        Returns the bytes to emit for a segment: its data, a one-line stub if an
+        earlier file had the same contents, or a diff against an earlier file
+        that is similar enough.
+
+        :param segment: The rendered segment.
+        :type segment: _Segment
+        :param seen: The first relative path emitted for each digest, updated in place.
+        :type seen: Dict[bytes, str]
+        :param near: The index of files emitted in full, updated in place, for near-duplicates.
+        :type near: Optional[_NearDuplicateIndex]
+        :return: The bytes to emit.
+        :rtype: bytes
+        """
+        if segment.digest is None:
+            return segment.data
+        started = time.perf_counter_ns()
+        try:
+            original = seen.setdefault(segment.digest, segment.relative_path)
+            if original != segment.relative_path:
+                self.duplicate_count += 1
+                logging.debug(f"Deduplicated: {segment.relative_path} (identical to {original})")
+                return (f"--- {segment.relative_path} --- [identical to: {original}]\n\n"
+                        .encode("utf-8", errors="ignore"))
+            if near is None or segment.minhash is None:
+                return segment.data
+
+            match = near.find(segment.minhash)
+            stub = self._near_duplicate_stub(segment, *match) if match else None
+            if stub is None:
+                near.add(segment.relative_path, segment.minhash)
+                if self.archive is not None:
+                    self._keep_archive_body(segment)
+                return segment.data
+            self.near_duplicate_count += 1
+            logging.debug(f"Near-deduplicated: {segment.relative_path} (similar to {match[0]})")
+            return stub
+        finally:
+            self.stats.add("dedupe", time.perf_counter_ns() - started)
+
+    def _keep_archive_body(self, segment: _Segment) -> None:
+        """
+        Keeps the compressed segment of an archive member added to the near-duplicate
+        index as a diff base, evicting the least recently used ones beyond
+        ARCHIVE_DIFF_BASES_BYTES.
+
+        :param segment: The rendered segment.
+        :type segment: _Segment
+        """
+        body = zlib.compress(segment.data, 1)
+        previous = self._archive_bodies.pop(segment.relative_path, None)
+        if previous is not None:
+            self._archive_bodies_bytes -= len(previous)
+        self._archive_bodies[segment.relative_path] = body
+        self._archive_bodies_bytes += len(body)
+        while self._archive_bodies_bytes > ARCHIVE_DIFF_BASES_BYTES:
+            _, evicted = self._archive_bodies.popitem(last=False)
+            self._archive_bodies_bytes -= len(evicted)
+
+    def _new_near_index(self) -> Optional[_NearDuplicateIndex]:
+        """
+        Returns an empty near-duplicate index if near-duplicate detection is enabled.
+
+        :return: The index, or None.
+        :rtype: Optional[_NearDuplicateIndex]
+        """
+        return _NearDuplicateIndex(self.near_dedupe) if self.near_dedupe is not None else None
+
+    def _iter_output(self, previous: Optional[Dict[str, list]] = None, f_prev=None,
+                     files: Optional[Dict[str, list]] = None) -> Iterator[bytes]:
+        """
+        Yields the output as it is produced: the header, then one chunk per file.
+
+        :param previous: The file entries of the previous manifest, for incremental runs.
+        :type previous: Optional[Dict[str, list]]
+        :param f_prev: The previous output opened for reading, required with previous.
+        :param files: Filled with the manifest entries of the new output, if given.
+        :type files: Optional[Dict[str, list]]
+        :yield: Output bytes.
+        :rtype: Iterator[bytes]
+        """
+        if self.partitions > 1:
+            yield from self._iter_partitioned_output()
+            return
+        self.file_count = 0
+        self.reused_count = 0
+        self.duplicate_count = 0
+        self.near_duplicate_count = 0
+        seen: Dict[bytes, str] = {}
+        near = self._new_near_index()
+        header = self._header()
+        yield header
+        offset = len(header)
+
+        for segment in self._iter_segments(previous):
+            chunks = None
+            if segment.reuse is not None:
+                chunks = self._reused_chunks(f_prev, segment)
+                if chunks is not None:
+                    self.reused_count += 1
+                else:
+                    logging.warning(f"Previous segment of {segment.relative_path} is invalid; re-reading.")
+                    segment = self._render_entry(self.root_dir / segment.relative_path,
+                                                 segment.relative_path, None)
+            if chunks is None:
+                data = self._dedupe_segment(segment, seen, near) if self.dedupe else segment.data
+                chunks = self._segment_chunks(segment, data)
+            length = 0
+            for chunk in chunks:
+                length += len(chunk)
+                yield chunk
+            if segment.ok:
+                self.file_count += 1
+            if files is not None and segment.signature is not None:
+                files[segment.relative_path] = [*segment.signature, offset, length, segment.ok]
+            offset += length
+
+    @staticmethod
+    def _reused_chunks(f_prev, segment: _Segment) -> Optional[Iterator[bytes]]:
+        """
+        Checks that a segment of the previous output is intact and returns its
+        bytes as chunks of at most STREAM_CHUNK_BYTES.
+
+        :param f_prev: The previous output opened for reading.
+        :param segment: A segment with `reuse` set.
+        :type segment: _Segment
+        :return: The chunks, or None if the previous output does not hold the segment.
+        :rtype: Optional[Iterator[bytes]]
+        """
+        offset, length = segment.reuse
+        expected = f"--- {segment.relative_path} ---\n".encode("utf-8", errors="ignore")
+        f_prev.seek(offset)
+        head = f_prev.read(min(length, STREAM_CHUNK_BYTES))
+        if offset + length > os.fstat(f_prev.fileno()).st_size or not head.startswith(expected):
+            return None
+
+        def copy() -> Iterator[bytes]:
+            yield head
+            remaining = length - len(head)
+            f_prev.seek(offset + len(head))
+            while remaining > 0:
+                chunk = f_prev.read(min(remaining, STREAM_CHUNK_BYTES))
+                remaining -= len(chunk)
+                yield chunk
+        return copy()
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """
+        Generates the repository mix as a stream of UTF-8 encoded chunks, without
+        writing any file. Files are read lazily as the generator is consumed, so
+        memory use stays constant regardless of the repository size.
+
+        :yield: Consecutive chunks of the output.
+        :rtype: Iterator[bytes]
+        """
+        return self._iter_output()
+
+    def stats_report(self) -> dict:
+        """
+        Returns the statistics of the runs so far: the phase times and event
+        counters of `RunStats`, with the file, reuse and duplicate counts.
+
+        :return: A JSON-serializable report.
+        :rtype: dict
+        """
+        report = self.stats.report()
+        report["counters"].update(files=self.file_count, reused=self.reused_count,
+                                  duplicates=self.duplicate_count, near_duplicates=self.near_duplicate_count)
+        return report
+
+    def run(self) -> None:
+        """
+        Executes the main logic to generate the repository mix file.
+
+        This method traverses the repository, filters files, reads their content
+        with robust encoding handling, and writes them to the specified output file,
+        or to standard output if no output file is set, compressing them in the
+        same pass if requested. The output is identical regardless of the number of jobs.
+
+        In incremental mode, unchanged files are not read at all: their segments
+        are copied from the previous output, which is then atomically replaced.
+
+        :raises IOError: If the output file cannot be written to.
+        """
+        logging.info("Starting repository processing...")
+        logging.info(f"Project Root (Base for all paths): {self.root_dir}")
+
+        if self.output_file is None:
+            self._run_to_stdout()
+            return
+        if self.shard_size is not None or self.shards is not None:
+            self._run_sharded()
+            return
+
+        started_ns = time.time_ns()
+        previous = self._load_manifest() if self.incremental else None
+        target_file = self._temp_path(self.output_file) if self.incremental else self.output_file
+        files: Dict[str, list] = {}
+
+        try:
+            with ExitStack() as stack:
+                f_out = self._open_sink(stack, stack.enter_context(target_file.open("wb")))
+                f_prev = stack.enter_context(self.output_file.open("rb")) if previous else None
+                for chunk in self._iter_output(previous, f_prev, files if self.incremental else None):
+                    self._write(f_out, chunk)
+
+            if self.incremental:
+                os.replace(target_file, self.output_file)
+                self._save_manifest(files, started_ns)
+                logging.info(f"Reused {self.reused_count} unchanged segments from the previous output.")
+
+            logging.info(f"Successfully processed {self.file_count} files.")
+            if self.dedupe:
+                logging.info(f"Replaced {self.duplicate_count} duplicate files with references"
+                             f" and {self.near_duplicate_count} similar files with diffs.")
+            print(f"\n[SUCCESS] Repository mix created: {self.output_file}")
+
+        except IOError as e:
+            logging.critical(f"Failed to write to output file {self.output_file}: {e}")
+            sys.exit(1)
+
+    def _shard_path(self, part: int) -> Path:
+        """
+        Returns the path of a part of sharded output, numbered before the
+        suffixes of the output name, e.g. repomix.part001.txt.gz.
+
+        :param part: The 1-based number of the part.
+        :type part: int
+        :return: The path of the part.
+        :rtype: Path
+        """
+        stem, dot, suffixes = self.output_file.name.partition(".")
+        return self.output_file.with_name(f"{stem}.part{part:03d}{dot}{suffixes}")
+
+    def _plan_shards(self, files: List[Tuple[Path, str]]) -> List[int]:
+        """
+        Assigns consecutive files to at most `shards` parts of similar estimated
+        size, based on the file sizes.
+
+        :param files: The files to mix, in output order.
+        :type files: List[Tuple[Path, str]]
+        :return: The 0-based part index of each file, non-decreasing.
+        :rtype: List[int]
+        """
+        sizes = []
+        for file_path, relative_path in files:
+            try:
+                if self.rev is not None:
+                    size = self._git_store.size(self._rev_blobs[relative_path])
+                else:
+                    size = os.stat(file_path).st_size
+            except (OSError, ValueError):
+                size = 0
+            if self.max_file_size is not None:
+                size = min(size, self.max_file_size)
+            sizes.append(size + len(relative_path) + SEGMENT_OVERHEAD_BYTES)
+        total = sum(sizes) or 1
+        plan = []
+        cumulative = 0
+        for size in sizes:
+            # Each file goes to the part containing its midpoint
+            plan.append(min(self.shards - 1, (2 * cumulative + size) * self.shards // (2 * total)))
+            cumulative += size
+        return plan
 
-# --- System Constants ---
-LOG_FORMAT: Final[str] = "[%(levelname)s] %(message)s"
-DEFAULT_OUTPUT_FILENAME: Final[str] = "repomix.txt"
-DEFAULT_IGNORE_PATTERNS: Final[tuple[str, ...]] = (".git/",)
-BINARY_CHECK_BYTES: Final[int] = 1024
+    def _estimate_length(self, segment: _Segment, data: Optional[bytes]) -> int:
+        """
+        Returns the length of a rendered segment, or an estimate for streamed ones.
 
-EXTENSION_TO_LANG: Final[Dict[str, str]] = {
-    ".py": "python", ".js": "javascript", ".ts": "typescript", ".java": "java",
-    ".c": "c", ".cpp": "cpp", ".cs": "csharp", ".go": "go", ".rs": "rust",
-    ".rb": "ruby", ".php": "php", ".kt": "kotlin", ".swift": "swift", ".html": "html",
-    ".css": "css", ".scss": "scss", ".json": "json", ".xml": "xml", ".yaml": "yaml",
-    ".yml": "yaml", ".md": "markdown", ".sh": "shell", ".bash": "bash",
-    "dockerfile": "dockerfile", ".sql": "sql", ".r": "r", ".pl": "perl",
-}
+        :param segment: The segment.
+        :type segment: _Segment
+        :param data: The bytes to write for the segment, or None if it is streamed.
+        :type data: Optional[bytes]
+        :return: The length in bytes.
+        :rtype: int
+        """
+        if data is not None:
+            return len(data)
+        try:
+            size = os.stat(self.root_dir / segment.relative_path).st_size
+        except OSError:
+            return 0
+        return min(size, self.max_file_size or size)
 
-# --- Core Component ---
+    def _read_shard_manifest_parts(self, manifest_file: Path) -> List[Path]:
+        """
+        Reads the paths of the parts listed in the manifest of a previous
+        sharded run.
 
-class RepoMixer:
-    """
-    A component to traverse a repository, filter files according to rules,
-    and synthesize them into a single text file for AI context.
-    """
-    def __init__(self, root_dir: Path, output_file: Path):
+        :param manifest_file: The path of the shard manifest.
+        :type manifest_file: Path
+        :return: The paths of the parts, or an empty list if there is no valid manifest.
+        :rtype: List[Path]
         """
-        Initializes the RepoMixer with specified paths.
+        import json
+        try:
+            with manifest_file.open("r", encoding="utf-8") as f:
+                names = [shard["path"] for shard in json.load(f)["shards"]]
+        except FileNotFoundError:
+            return []
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring corrupt shard manifest {manifest_file}: {e}")
+            return []
+        return [self.output_file.parent / Path(name).name for name in names]
 
-        :param root_dir: The absolute path to the repository's root directory.
-        :type root_dir: Path
-        :param output_file: The absolute path to the target output file.
-        :type output_file: Path
-        :raises TypeError: If root_dir or output_file are not Path objects.
+    def _remove_stale_shards(self) -> None:
         """
-        if not isinstance(root_dir, Path) or not isinstance(output_file, Path):
-            raise TypeError("root_dir and output_file must be Path objects.")
-        self.root_dir = root_dir
-        self.output_file = output_file
-        self.script_file = Path(__file__).resolve()
-        self.ignore_matcher = self._load_ignore_rules()
+        Deletes the parts of previous sharded runs of this output name, with or
+        without a compression suffix, so that they are neither mixed into the
+        new output nor left behind by a run that writes fewer parts or uses
+        another compression method. The manifests of the other methods, which
+        list only deleted parts, are deleted too.
+        """
+        stale = [path for path in self.output_file.parent.iterdir()
+                 if self._shard_part_pattern.fullmatch(str(path))]
+        stale.extend(manifest_file for manifest_file in self._shard_manifest_files()
+                     if manifest_file != self.shard_manifest_file)
+        for path in stale:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _save_shard_manifest(self, shards: List[dict], files: Dict[str, list]) -> None:
+        """
+        Atomically writes the manifest mapping each file to its part.
+
+        :param shards: Per part: its file name, number of files and uncompressed size.
+        :type shards: List[dict]
+        :param files: Per relative path: [part index, offset, length], in uncompressed bytes.
+        :type files: Dict[str, list]
+        """
+        manifest = {
+            "version": SHARD_MANIFEST_VERSION,
+            "root": str(self.root_dir),
+            "compress": self.compress,
+            "shards": shards,
+            "files": files,
+        }
+        import json
+        temp_file = self._temp_path(self.shard_manifest_file)
+        with temp_file.open("w", encoding="utf-8") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(temp_file, self.shard_manifest_file)
+
+    def _run_sharded(self) -> None:
+        """
+        Writes the output as numbered parts split at file boundaries, each with
+        its own header, and a manifest mapping every file to its part and offset.
+
+        Every part is written by its own background thread, which compresses,
+        writes and closes it while the following parts are being filled.
+        """
+        self._remove_stale_shards()
+        # Enumerate before any part exists, so that new parts are never mixed in
+        files = list(self._iter_files())
+        plan = self._plan_shards(files) if self.shards is not None else None
+        shards: List[dict] = []
+        entries: Dict[str, list] = {}
+        seen: Dict[bytes, str] = {}
+        near = self._new_near_index()
         self.file_count = 0
+        self.duplicate_count = 0
+        self.near_duplicate_count = 0
 
-    # --- FIX START: This entire method is replaced ---
-    def _load_ignore_rules(self) -> Callable[[Path], bool]:
+        try:
+            with ExitStack() as stack:
+                writer = None
+                offset = 0
+
+                def start_part() -> None:
+                    nonlocal writer, offset
+                    if writer is not None:
+                        writer.finish()
+                    part_path = self._shard_path(len(shards) + 1)
+                    writer = stack.enter_context(_BackgroundWriter(
+                        part_path.open("wb"), self.compress, self.compress_level, close_file=True,
+                        stats=self.stats))
+                    header = self._header(len(shards) + 1)
+                    self._write(writer, header)
+                    offset = len(header)
+                    shards.append({"path": part_path.name, "files": 0, "bytes": offset})
+
+                for position, segment in enumerate(self._iter_segments(files=files)):
+                    data = self._dedupe_segment(segment, seen, near) if self.dedupe else segment.data
+                    if plan is not None:
+                        if writer is None or plan[position] != plan[position - 1]:
+                            start_part()
+                    elif writer is None or (shards[-1]["files"] and
+                                            offset + self._estimate_length(segment, data) > self.shard_size):
+                        start_part()
+                    length = 0
+                    for chunk in self._segment_chunks(segment, data):
+                        self._write(writer, chunk)
+                        length += len(chunk)
+                    entries[segment.relative_path] = [len(shards) - 1, offset, length]
+                    offset += length
+                    shards[-1]["files"] += 1
+                    shards[-1]["bytes"] = offset
+                    if segment.ok:
+                        self.file_count += 1
+                if writer is None:
+                    start_part()
+
+            self._save_shard_manifest(shards, entries)
+            logging.info(f"Successfully processed {self.file_count} files into {len(shards)} parts.")
+            if self.dedupe:
+                logging.info(f"Replaced {self.duplicate_count} duplicate files with references"
+                             f" and {self.near_duplicate_count} similar files with diffs.")
+            print(f"\n[SUCCESS] Repository mix created: {len(shards)} parts, "
+                  f"described in {self.shard_manifest_file}")
+
+        except IOError as e:
+            logging.critical(f"Failed to write sharded output for {self.output_file}: {e}")
+            sys.exit(1)
+
+    def _open_sink(self, stack: ExitStack, f_out):
         """
-        Loads .gitignore rules and returns a matching function.
-        This version manually opens the .gitignore file with UTF-8 encoding
-        to prevent UnicodeDecodeError on systems with different default encodings.
+        Wraps an output file in a compressing writer if compression is enabled.
+
+        :param stack: The stack that closes the writer, before f_out is closed.
+        :type stack: ExitStack
+        :param f_out: The binary file to write the output to.
+        :return: An object with a write(bytes) method.
         """
-        gitignore_path = self.root_dir / ".gitignore"
-        if gitignore_path.is_file():
-            try:
-                logging.info(f"Applying .gitignore rules from: {gitignore_path}")
-                # Manually open the file with UTF-8 encoding
-                with gitignore_path.open("r", encoding="utf-8", errors="ignore") as f:
-                    # Pass the file handle to the internal parser function
-                    return _parse_gitignore_lines(f, gitignore_path, base_dir=self.root_dir)
-            except (IOError, UnicodeDecodeError) as e:
-                logging.error(f"Failed to read or parse .gitignore file at {gitignore_path}: {e}. "
-                              "Proceeding without .gitignore rules.")
-                return lambda p: False
-        logging.warning("No .gitignore file found. Using default ignore rules only.")
-        return lambda p: False
-    # --- FIX END ---
+        if self.compress is None:
+            return f_out
+        return stack.enter_context(_BackgroundWriter(f_out, self.compress, self.compress_level, stats=self.stats))
 
-    @staticmethod
-    def _is_binary(filepath: Path) -> bool:
+    def _write(self, sink, data: bytes) -> None:
         """
-        Checks if a file is likely binary by searching for null bytes within its
-        initial segment. Returns False if the file is unreadable.
+        Writes output bytes to a sink, adding the time to the write phase.
 
-        :param filepath: The path to the file to check.
-        :type filepath: Path
-        :return: True if the file is likely binary, False otherwise.
-        :rtype: bool
+        :param sink: An object with a write(bytes) method.
+        :param data: The bytes to write.
+        :type data: bytes
+        """
+        started = time.perf_counter_ns()
+        sink.write(data)
+        self.stats.add("write", time.perf_counter_ns() - started, "bytes_written", len(data))
+
+    def _run_to_stdout(self) -> None:
+        """
+        Streams the output to standard output. Status messages go to the log
+        only, so that the stream can be piped into another process.
         """
+        stdout = sys.stdout.buffer
         try:
-            with filepath.open("rb") as f:
-                return b'\0' in f.read(BINARY_CHECK_BYTES)
-        except IOError:
-            logging.warning(f"Could not read file to check for binary content: {filepath}")
-            return False
+            with ExitStack() as stack:
+                sink = self._open_sink(stack, stdout)
+                for chunk in self.iter_chunks():
+                    self._write(sink, chunk)
+            stdout.flush()
+        except BrokenPipeError:
+            # The reader went away; silence the flush at interpreter exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+            logging.warning("Output pipe closed before the mix was complete.")
+            sys.exit(1)
+        except IOError as e:
+            logging.critical(f"Failed to write to standard output: {e}")
+            sys.exit(1)
+        logging.info(f"Successfully processed {self.file_count} files.")
+        if self.dedupe:
+            logging.info(f"Replaced {self.duplicate_count} duplicate files with references"
+                         f" and {self.near_duplicate_count} similar files with diffs.")
 
-    @staticmethod
-    def _get_lang(filename: Path) -> str:
+    def _write_segments(self, segments: Dict[str, _Segment]) -> None:
         """
-        Determines the Markdown language identifier from a filename's extension.
+        Atomically replaces the output file with the given segments.
 
-        :param filename: The path to the file.
-        :type filename: Path
-        :return: The language identifier string (e.g., "python", "javascript"), or an empty string if unknown.
-        :rtype: str
+        :param segments: The segments in output order.
+        :type segments: Dict[str, _Segment]
+        :raises IOError: If the output file cannot be written to.
         """
-        name = filename.name.lower()
-        if "dockerfile" in name:
-            return "dockerfile"
-        return EXTENSION_TO_LANG.get(filename.suffix.lower(), "")
+        temp_file = self._temp_path(self.output_file)
+        with temp_file.open("wb") as f_out:
+            self._write(f_out, self._header())
+            for segment in segments.values():
+                for chunk in self._segment_chunks(segment, segment.data):
+                    self._write(f_out, chunk)
+        os.replace(temp_file, self.output_file)
+        self.file_count = sum(1 for segment in segments.values() if segment.ok)
 
-    def _walk_repo(self) -> Iterator[Path]:
+    def _rescan(self, segments: Dict[str, _Segment], watcher,
+                dir_layers: Dict[str, Tuple[str, IgnoreLayers]]) -> Dict[str, _Segment]:
         """
-        Walks the repository, yielding eligible files while respecting ignore
-        rules to prune directory traversal efficiently. This is a non-recursive
-        implementation to prevent stack depth issues.
+        Walks the repository again, re-rendering only files whose stat signature
+        changed, and makes sure every traversed directory is watched.
 
-        :yield: Path objects for eligible files.
-        :rtype: Iterator[Path]
-        :raises OSError: If a directory cannot be accessed during traversal.
+        :param segments: The current segments, used as a cache.
+        :type segments: Dict[str, _Segment]
+        :param watcher: The watcher to register directories with.
+        :param dir_layers: Filled with the relative prefix and ignore layers of
+                           every traversed directory.
+        :type dir_layers: Dict[str, Tuple[str, IgnoreLayers]]
+        :return: The new segments in walk order.
+        :rtype: Dict[str, _Segment]
         """
-        dirs_to_visit = [self.root_dir]
+        dir_layers.clear()
 
-        while dirs_to_visit:
-            current_dir = dirs_to_visit.pop()
-            try:
-                for item_path in current_dir.iterdir():
-                    # --- Primary Exclusion Checks (applies to both files and dirs) ---
-                    if item_path == self.output_file or item_path == self.script_file:
-                        continue
+        def on_directory(directory: str, prefix: str, layers: IgnoreLayers) -> None:
+            dir_layers[directory] = (prefix, layers)
+            watcher.add(directory)
 
-                    # Convert to POSIX path for consistent matching against ignore patterns
-                    relative_path_str = str(item_path.relative_to(self.root_dir)).replace('\\', '/')
-                    if relative_path_str.startswith(DEFAULT_IGNORE_PATTERNS):
-                        continue
+        return {segment.relative_path: segment
+                for segment in self._iter_segments(cache=segments, on_directory=on_directory)}
 
-                    if self.ignore_matcher(item_path):
-                        continue
+    def _apply_events(self, events: List[Tuple[Optional[str], int]], segments: Dict[str, _Segment],
+                      watcher, dir_layers: Dict[str, Tuple[str, IgnoreLayers]]
+                      ) -> Tuple[Dict[str, _Segment], bool]:
+        """
+        Updates the segments for a batch of file system events. Modified and
+        deleted files are handled in place; anything that can change the set or
+        order of files, such as new files or edited ignore files, triggers a rescan.
 
-                    # --- Item Processing ---
-                    if item_path.is_dir():
-                        dirs_to_visit.append(item_path)
-                    elif item_path.is_file():
-                        yield item_path
+        :param events: Tuples of (absolute path, inotify mask).
+        :type events: List[Tuple[Optional[str], int]]
+        :param segments: The current segments in output order.
+        :type segments: Dict[str, _Segment]
+        :param watcher: The active watcher.
+        :param dir_layers: The relative prefix and ignore layers of every traversed directory.
+        :type dir_layers: Dict[str, Tuple[str, IgnoreLayers]]
+        :return: The updated segments and whether they changed.
+        :rtype: Tuple[Dict[str, _Segment], bool]
+        """
+        excluded_paths = self._excluded_paths()
+        structural = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+        rescan = reload_ignore_rules = False
+        updated = dict(segments)
+        for path, mask in events:
+            if path is None:
+                rescan = True
+                continue
+            if self._is_excluded(path, excluded_paths):
+                continue
+            parent, name = os.path.split(path)
+            prefix, layers = dir_layers.get(parent, (None, ()))
+            if prefix is None:
+                continue
+            relative_path = prefix + name
+            if name == IGNORE_FILENAME:
+                rescan = True
+                reload_ignore_rules = reload_ignore_rules or not prefix
+            elif mask & structural:
+                is_dir = bool(mask & IN_ISDIR)
+                if not (relative_path.startswith(DEFAULT_IGNORE_PATTERNS)
+                        or self._is_ignored(relative_path, is_dir, layers)):
+                    rescan = True
+            elif relative_path in updated:
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    del updated[relative_path]
+                else:
+                    updated[relative_path] = self._render_entry(Path(path), relative_path,
+                                                                None, cache=segments)
 
-            except OSError as e:
-                logging.warning(f"Cannot access directory {current_dir}: {e}")
+        if reload_ignore_rules:
+            self.ignore_layers = self._load_ignore_rules()
+        if rescan:
+            updated = self._rescan(updated, watcher, dir_layers)
+        changed = (list(updated) != list(segments) or
+                   any(updated[key] is not segments[key] for key in updated))
+        return updated, changed
 
-    def run(self) -> None:
+    def watch(self, debounce: float = WATCH_DEBOUNCE_SECONDS) -> None:
         """
-        Executes the main logic to generate the repository mix file.
+        Keeps the output file up to date until interrupted. Ignore rules and
+        rendered segments stay in memory, so an edit only costs re-reading the
+        changed files and atomically rewriting the output.
 
-        This method traverses the repository, filters files, reads their content
-        with robust encoding handling, and writes them to the specified output file.
+        Changes are reported by inotify on Linux; other platforms fall back to
+        periodic rescans.
 
+        :param debounce: Seconds without further events before regenerating.
+        :type debounce: float
         :raises IOError: If the output file cannot be written to.
         """
-        logging.info("Starting repository processing...")
-        logging.info(f"Project Root (Base for all paths): {self.root_dir}")
-
         try:
-            # Use errors="ignore" for the output file in case of any unexpected encoding issues
-            with self.output_file.open("w", encoding="utf-8", errors="ignore") as f_out:
-                f_out.write(f"# Repository Mix Context\n")
-                f_out.write(f"# Root Directory (Absolute Path): {self.root_dir}\n")
-                f_out.write("# All subsequent file paths are relative to this root.\n\n")
-
-                for file_path in self._walk_repo():
-                    relative_path = file_path.relative_to(self.root_dir).as_posix()
-                    logging.debug(f"Processing: {relative_path}")
-
-                    try:
-                        f_out.write(f"--- {relative_path} ---\n")
-                        if self._is_binary(file_path):
-                            f_out.write("[Binary file, content not included]\n\n")
-                        else:
-                            lang = self._get_lang(file_path)
-                            f_out.write(f"```{lang}\n")
-                            # Use errors="ignore" for robust reading of source files
-                            content = file_path.read_text(encoding="utf-8", errors="ignore")
-                            f_out.write(content.strip() + "\n")
-                            f_out.write("```\n\n")
-                        self.file_count += 1
-                    except (IOError, UnicodeDecodeError) as e:
-                        logging.error(f"Failed to process file {relative_path}: {e}")
-                        f_out.write(f"[Error reading file: {e}]\n\n")
+            watcher = _InotifyWatcher() if sys.platform.startswith("linux") else None
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify is unavailable ({e}).")
+            watcher = None
+        if watcher is None:
+            logging.info(f"Polling for changes every {WATCH_POLL_INTERVAL_SECONDS} seconds.")
+            watcher = _PollingWatcher(WATCH_POLL_INTERVAL_SECONDS)
 
-            logging.info(f"Successfully processed {self.file_count} files.")
+        dir_layers: Dict[str, Tuple[str, IgnoreLayers]] = {}
+        try:
+            segments = self._rescan({}, watcher, dir_layers)
+            self._write_segments(segments)
             print(f"\n[SUCCESS] Repository mix created: {self.output_file}")
-
+            logging.info(f"Watching {self.root_dir} for changes. Press Ctrl+C to stop.")
+            while True:
+                events = watcher.read(None)
+                while True:
+                    more = watcher.read(debounce)
+                    if not more:
+                        break
+                    events.extend(more)
+                started = time.perf_counter()
+                segments, changed = self._apply_events(events, segments, watcher, dir_layers)
+                if changed:
+                    self._write_segments(segments)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    logging.info(f"Updated {self.output_file} ({self.file_count} files) in {elapsed_ms:.1f} ms.")
+        except KeyboardInterrupt:
+            logging.info("Stopped watching.")
         except IOError as e:
             logging.critical(f"Failed to write to output file {self.output_file}: {e}")
             sys.exit(1)
+        finally:
+            watcher.close()
+
+    @staticmethod
+    def batch(root_dirs: Iterable[Path], output_dir: Optional[Path] = None,
+              processes: Optional[int] = None, **options) -> List["BatchResult"]:
+        """
+        Mixes many repositories in parallel, one worker process per repository
+        at a time, so that the total wall time scales with the number of cores.
+        A failure in one repository does not affect the others.
+
+        :param root_dirs: The repository roots.
+        :type root_dirs: Iterable[Path]
+        :param output_dir: The directory for the outputs, named after each repository
+                           (with a numeric suffix if names repeat). By default, each
+                           output is written to <root>/repomix.txt, or to <archive>.txt
+                           for an archive.
+        :type output_dir: Optional[Path]
+        :param processes: The number of worker processes; defaults to the number of CPUs.
+        :type processes: Optional[int]
+        :param options: Further keyword arguments for RepoMixer, applied to every repository.
+        :return: The outcome per repository, in the order of root_dirs.
+        :rtype: List[BatchResult]
+        """
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        root_dirs = list(root_dirs)
+        output_files: List[Optional[Path]] = [None] * len(root_dirs)
+        if output_dir is not None:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            used_names: set = set()
+            for position, root_dir in enumerate(root_dirs):
+                name = Path(root_dir).resolve().name or "root"
+                unique_name, counter = name, 1
+                while unique_name in used_names:
+                    counter += 1
+                    unique_name = f"{name}-{counter}"
+                used_names.add(unique_name)
+                output_files[position] = _with_compression_suffix(
+                    output_dir / f"{unique_name}{Path(DEFAULT_OUTPUT_FILENAME).suffix}", options.get("compress"))
+
+        verbose = logging.getLogger().getEffectiveLevel() <= logging.DEBUG
+        results: List[Optional[BatchResult]] = [None] * len(root_dirs)
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_batch_worker,
+                                 initargs=(logging.DEBUG if verbose else logging.WARNING,)) as pool:
+            futures = {pool.submit(_batch_worker, Path(root_dir), output_file, options): position
+                       for position, (root_dir, output_file) in enumerate(zip(root_dirs, output_files))}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                status = "Mixed" if result.ok else "Failed to mix"
+                logging.info(f"{status} {result.root_dir} ({sum(r is not None for r in results)}/{len(results)})")
+        return results
+
+# --- Worker Processes ---
+
+# The mixer of a partition worker process, set by `_init_partition_worker`.
+_partition_mixer: Optional[RepoMixer] = None
+
+
+def _init_partition_worker(mixer: RepoMixer, log_level: int) -> None:
+    """
+    Keeps the mixer for the tasks of a partition worker process.
+
+    :param mixer: The mixer of the parent process.
+    :type mixer: RepoMixer
+    :param log_level: The log level of the worker.
+    :type log_level: int
+    """
+    global _partition_mixer
+    logging.getLogger().setLevel(log_level)
+    # Statistics already counted by the parent must not be reported again by the units
+    mixer.stats = RunStats()
+    _partition_mixer = mixer
+
+
+def _partition_worker(unit: tuple, spool_path: str) -> Tuple[int, list, tuple]:
+    """
+    Renders one unit of a partitioned run; see `RepoMixer._render_partition`.
+    """
+    return _partition_mixer._render_partition(unit, spool_path)
+
+# --- Batch Mode ---
+
+class BatchResult(NamedTuple):
+    """
+    The outcome of mixing one repository of a batch.
+    """
+    root_dir: Path
+    output_file: Optional[Path]
+    ok: bool
+    file_count: int = 0
+    seconds: float = 0.0
+    error: str = ""
+
+
+def _with_compression_suffix(path: Path, compress: Optional[str]) -> Path:
+    """
+    Appends the suffix of the compression method to an output path, unless present.
+
+    :param path: The output path.
+    :type path: Path
+    :param compress: The compression method, if any.
+    :type compress: Optional[str]
+    :return: The output path with the suffix.
+    :rtype: Path
+    """
+    suffix = COMPRESSION_SUFFIXES.get(compress)
+    if suffix and path.suffix != suffix:
+        return path.with_name(path.name + suffix)
+    return path
+
+
+def _init_batch_worker(log_level: int) -> None:
+    """
+    Lowers the log verbosity of a batch worker process, whose progress messages
+    would otherwise interleave with those of the other workers.
+    """
+    logging.getLogger().setLevel(log_level)
+
+
+def _batch_worker(root_dir: Path, output_file: Optional[Path], options: dict) -> BatchResult:
+    """
+    Mixes one repository of a batch in a worker process.
+
+    :param root_dir: The repository root.
+    :type root_dir: Path
+    :param output_file: The output path, or None for <root>/repomix.txt.
+    :type output_file: Optional[Path]
+    :param options: Further keyword arguments for RepoMixer.
+    :type options: dict
+    :return: The outcome.
+    :rtype: BatchResult
+    """
+    started = time.perf_counter()
+    try:
+        root_dir = root_dir.resolve(strict=True)
+        if output_file is None:
+            # Archives cannot hold their output; it is written next to them instead
+            output_file = (root_dir.with_name(root_dir.name + Path(DEFAULT_OUTPUT_FILENAME).suffix)
+                           if root_dir.is_file() else root_dir / DEFAULT_OUTPUT_FILENAME)
+            output_file = _with_compression_suffix(output_file, options.get("compress"))
+        mixer = RepoMixer(root_dir=root_dir, output_file=output_file, **options)
+        # The per-repository success message is replaced by the batch summary
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            mixer.run()
+    except SystemExit:
+        return BatchResult(root_dir, output_file, False, error="the output could not be written")
+    except Exception as e:
+        return BatchResult(root_dir, output_file, False, error=f"{type(e).__name__}: {e}")
+    return BatchResult(root_dir, output_file, True, mixer.file_count, time.perf_counter() - started)
 
 # --- Execution Entrypoint ---
 
+def _parse_size(value: str) -> int:
+    """
+    Parses a positive byte count with an optional K, M or G suffix.
+
+    :param value: The command-line value, e.g. "500K" or "8M".
+    :type value: str
+    :return: The number of bytes.
+    :rtype: int
+    :raises argparse.ArgumentTypeError: If the value is not a positive size.
+    """
+    match = re.fullmatch(r"(\d+)([KMG]?)B?", value.strip().upper())
+    if not match or int(match.group(1)) < 1:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def _parse_sample(value: str) -> Tuple[str, int]:
+    """
+    Parses a sampling policy of the form GLOB or GLOB:LINES.
+
+    :param value: The command-line value, e.g. "*.csv:50".
+    :type value: str
+    :return: The glob and the number of lines to keep from each end.
+    :rtype: Tuple[str, int]
+    :raises argparse.ArgumentTypeError: If the line count is not a positive integer.
+    """
+    pattern, colon, lines = value.rpartition(":")
+    if not colon or not lines.isdigit():
+        return value, DEFAULT_SAMPLE_LINES
+    if not pattern or int(lines) < 1:
+        raise argparse.ArgumentTypeError(f"invalid sampling policy: {value!r}")
+    return pattern, int(lines)
+
+
+def _add_mixer_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options shared by single-repository and batch runs.
+
+    :param parser: The parser to extend.
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="Number of threads reading files ahead of the writer (default: 1).\n"
+             "Output is identical to the serial mode."
+    )
+    parser.add_argument(
+        "-i", "--incremental", action="store_true",
+        help=f"Only re-read files changed since the previous incremental run, reusing\n"
+             f"the other segments of the existing output (tracked in <output>{MANIFEST_SUFFIX})."
+    )
+    parser.add_argument(
+        "-p", "--partitions", type=int, default=1,
+        help="Number of processes walking and reading subtrees in parallel (default: 1).\n"
+             "Output is identical to the serial mode."
+    )
+    parser.add_argument(
+        "--git-index", action="store_true",
+        help="Mix the files tracked in the git index instead of walking the file system.\n"
+             "Files are emitted in index (sorted) order; ignore rules do not apply to tracked files."
+    )
+    parser.add_argument(
+        "--untracked", action="store_true",
+        help="With --git-index or --diff-base, also mix untracked files that git does not ignore."
+    )
+    parser.add_argument(
+        "--rev", metavar="REVISION",
+        help="Mix a commit, tag or branch (e.g. v1.2, main~3 or an object id) read straight from\n"
+             "the git object store instead of the work tree, which may be absent (bare repositories\n"
+             "work too). Only the revision's own .gitignore files apply; files are in tree order.\n"
+             "A name or id may be followed by ~N, ^N, ^{} and ^{type} (e.g. v1.2^{tree}) as in\n"
+             "git rev-parse; other forms, such as @{...} or :path, are rejected."
+    )
+    parser.add_argument(
+        "--diff-base", metavar="REVISION",
+        help="Mix only the files added or changed since REVISION, in the work tree or in --rev,\n"
+             "e.g. for review prompts. Files are in sorted order; ignore rules do not apply.\n"
+             "REVISION takes the same forms as for --rev."
+    )
+    parser.add_argument(
+        "--context", action="append", metavar="PATH",
+        help="With --diff-base, also mix the file at PATH (relative to the root) whether or\n"
+             "not it changed. May be repeated."
+    )
+    parser.add_argument(
+        "--compress", choices=sorted(COMPRESSION_SUFFIXES),
+        help="Compress the output in the same pass, on a background thread. The matching\n"
+             "suffix (.gz, .zst, .xz) is appended to the output name. zstd requires 'zstandard'."
+    )
+    parser.add_argument(
+        "--compress-level", type=int,
+        help="Compression level (default: " + ", ".join(
+            f"{method} {level}" for method, level in sorted(DEFAULT_COMPRESSION_LEVELS.items())) + ")."
+    )
+    shard_group = parser.add_mutually_exclusive_group()
+    shard_group.add_argument(
+        "--shard-size", type=_parse_size, metavar="BYTES",
+        help="Split the output at file boundaries into numbered parts of at most BYTES\n"
+             "(suffixes K, M and G are accepted), plus a manifest in <output>" + SHARD_MANIFEST_SUFFIX + "."
+    )
+    shard_group.add_argument(
+        "--shards", type=int, metavar="N",
+        help="Split the output at file boundaries into at most N parts of similar size."
+    )
+    parser.add_argument(
+        "--dedupe", action="store_true",
+        help="Emit each distinct text file content once; later identical files are\n"
+             "replaced by a '--- path --- [identical to: other/path]' line."
+    )
+    parser.add_argument(
+        "--near-dedupe", type=float, nargs="?", const=DEFAULT_NEAR_DEDUPE_THRESHOLD, metavar="SIMILARITY",
+        help=f"Also replace text files at least SIMILARITY (0-1, default: {DEFAULT_NEAR_DEDUPE_THRESHOLD})\n"
+             "similar to an earlier file by a unified diff against it. Implies --dedupe.\n"
+             "Similarity is estimated with MinHash and LSH; numpy speeds it up if installed."
+    )
+    parser.add_argument(
+        "--max-file-size", type=_parse_size, metavar="BYTES",
+        help="Limit the content of each text file to BYTES (suffixes K, M and G are accepted).\n"
+             f"Text files above {LARGE_FILE_BYTES >> 20} MB are always read in chunks to bound memory."
+    )
+    parser.add_argument(
+        "--oversize", choices=OVERSIZE_ACTIONS, default="truncate",
+        help="For files above --max-file-size: keep their start followed by a marker\n"
+             "(truncate), or replace their content with a placeholder (skip). Default: truncate."
+    )
+    parser.add_argument(
+        "--sample", action="append", type=_parse_sample, metavar="GLOB[:LINES]",
+        help="Reduce text files matching GLOB (on the file name, or on the relative path if\n"
+             f"it contains '/') to their first and last LINES lines (default: {DEFAULT_SAMPLE_LINES})\n"
+             "and a summary line with the line count and size. The middle of the file is not\n"
+             f"kept; it is only read to count the lines of files up to {SAMPLE_COUNT_MAX_BYTES >> 20} MiB.\n"
+             "May be repeated."
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help=f"Do not use the caches in {_default_cache_dir()}: the cache of binary files,\n"
+             "which lets unchanged binary files be skipped without reading them, and the\n"
+             "cache of compiled ignore rules, which lets unchanged .gitignore files be\n"
+             "loaded without parsing them again."
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true",
+        help="Enable verbose logging for debugging."
+    )
+
+
+def _check_mixer_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """
+    Rejects invalid combinations of the options added by `_add_mixer_arguments`,
+    exiting through `parser.error`.
+
+    :param parser: The parser that produced args.
+    :type parser: argparse.ArgumentParser
+    :param args: The parsed arguments; they must also define `output` and `watch`.
+    :type args: argparse.Namespace
+    """
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+    if args.partitions < 1:
+        parser.error("--partitions must be at least 1.")
+    if args.partitions > 1 and (args.incremental or args.watch or args.git_index or args.dedupe
+                                or args.near_dedupe is not None or args.shards or args.shard_size):
+        parser.error("--partitions cannot be combined with --incremental, --watch, --git-index,\n"
+                     "--dedupe, --near-dedupe, --shards or --shard-size.")
+    if args.untracked and (not (args.git_index or args.diff_base is not None) or args.rev is not None):
+        parser.error("--untracked requires --git-index or --diff-base, and cannot be combined with --rev.")
+    if args.watch and args.git_index:
+        parser.error("--watch cannot be combined with --git-index.")
+    if ((args.rev is not None or args.diff_base is not None)
+            and (args.incremental or args.watch or args.git_index or args.partitions > 1)):
+        parser.error("--rev and --diff-base cannot be combined with --incremental, --watch, --git-index\n"
+                     "or --partitions.")
+    if args.context and args.diff_base is None:
+        parser.error("--context requires --diff-base.")
+    if args.output == "-" and (args.incremental or args.watch):
+        parser.error("--incremental and --watch require an output file.")
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be at least 1.")
+    if args.shard_size is not None or args.shards is not None:
+        if args.output == "-" or args.incremental or args.watch:
+            parser.error("--shard-size and --shards cannot be combined with '-o -', --incremental or --watch.")
+    if args.near_dedupe is not None and not 0 < args.near_dedupe <= 1:
+        parser.error("--near-dedupe must be in (0, 1].")
+    args.dedupe = args.dedupe or args.near_dedupe is not None
+    if args.dedupe and (args.incremental or args.watch):
+        parser.error("--dedupe and --near-dedupe cannot be combined with --incremental or --watch.")
+    if args.compress_level is not None and not args.compress:
+        parser.error("--compress-level requires --compress.")
+    if args.compress:
+        if args.incremental or args.watch:
+            parser.error("--compress cannot be combined with --incremental or --watch.")
+        if args.compress == "zstd" and _optional_import("zstandard") is None:
+            parser.error("--compress zstd requires 'zstandard'. Please run 'pip install zstandard'.")
+        low, high = COMPRESSION_LEVEL_RANGES[args.compress]
+        if args.compress_level is not None and not low <= args.compress_level <= high:
+            parser.error(f"--compress-level for {args.compress} must be between {low} and {high}.")
+
+
+def _mixer_options(args: argparse.Namespace) -> dict:
+    """
+    Returns the RepoMixer keyword arguments for the options added by `_add_mixer_arguments`.
+
+    :param args: The parsed and checked arguments.
+    :type args: argparse.Namespace
+    :return: Keyword arguments for RepoMixer, other than root_dir and output_file.
+    :rtype: dict
+    """
+    return dict(jobs=args.jobs, incremental=args.incremental, git_index=args.git_index,
+                untracked=args.untracked, compress=args.compress, compress_level=args.compress_level,
+                shard_size=args.shard_size, shards=args.shards, dedupe=args.dedupe,
+                near_dedupe=args.near_dedupe, max_file_size=args.max_file_size, oversize=args.oversize,
+                sample=args.sample, cache_dir=None if args.no_cache else _default_cache_dir(),
+                partitions=args.partitions, rev=args.rev, diff_base=args.diff_base, context=args.context)
+
+
+def _write_report(write: Callable[[str], None], path: str, kind: str) -> None:
+    """
+    Writes a --stats or --profile report, logging instead of raising on failure
+    so that the outcome of the run is not masked.
+
+    :param write: Writes the report to the path it is given.
+    :type write: Callable[[str], None]
+    :param path: The report path.
+    :type path: str
+    :param kind: The report name for log messages.
+    :type kind: str
+    """
+    try:
+        write(path)
+        logging.info(f"Saved the {kind} to {path}")
+    except (IOError, TypeError, ValueError) as e:
+        logging.error(f"Failed to save the {kind} to {path}: {e}")
+
+
+def _read_repo_list(list_file: str) -> List[Path]:
+    """
+    Reads the repository roots of a batch, one per line. Blank lines and lines
+    starting with "#" are skipped; relative paths are relative to the list file.
+
+    :param list_file: The path of the list, or "-" for standard input.
+    :type list_file: str
+    :return: The repository roots, in order.
+    :rtype: List[Path]
+    :raises IOError: If the list cannot be read.
+    """
+    if list_file == "-":
+        lines, base_dir = sys.stdin.read().splitlines(), Path.cwd()
+    else:
+        lines = Path(list_file).read_text(encoding="utf-8").splitlines()
+        base_dir = Path(list_file).resolve().parent
+    return [base_dir / line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _batch_main(argv: List[str]) -> None:
+    """
+    Parses the arguments of the batch subcommand and mixes every listed repository.
+
+    :param argv: The arguments following "batch".
+    :type argv: List[str]
+    """
+    parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} batch",
+        description="Mixes many repositories in parallel, one process per repository.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "repos_file",
+        help="File listing one repository root per line, or '-' for standard input.\n"
+             "Blank lines and lines starting with '#' are skipped."
+    )
+    parser.add_argument(
+        "-d", "--output-dir",
+        help="Directory for the outputs, each named after its repository\n"
+             f"(default: <repository>/{DEFAULT_OUTPUT_FILENAME})."
+    )
+    parser.add_argument(
+        "-P", "--processes", type=int,
+        help="Number of repositories mixed at the same time (default: number of CPUs)."
+    )
+    _add_mixer_arguments(parser)
+    parser.set_defaults(output=None, watch=False)
+    args = parser.parse_args(argv)
+    _check_mixer_arguments(parser, args)
+    if args.processes is not None and args.processes < 1:
+        parser.error("--processes must be at least 1.")
+
+    log_level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(level=log_level, format=LOG_FORMAT, stream=sys.stderr)
+
+    try:
+        root_dirs = _read_repo_list(args.repos_file)
+    except (IOError, UnicodeDecodeError) as e:
+        logging.critical(f"Failed to read the repository list {args.repos_file}: {e}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    output_dir = Path(args.output_dir).resolve() if args.output_dir else None
+    results = RepoMixer.batch(root_dirs, output_dir=output_dir, processes=args.processes,
+                              **_mixer_options(args))
+    failed = [result for result in results if not result.ok]
+    print()
+    for result in results:
+        if result.ok:
+            print(f"[OK]     {result.root_dir} -> {result.output_file} "
+                  f"({result.file_count} files, {result.seconds:.2f}s)")
+        else:
+            print(f"[FAILED] {result.root_dir}: {result.error}")
+    elapsed = time.perf_counter() - started
+    if failed:
+        print(f"\n[FAILED] {len(failed)} of {len(results)} repositories failed ({elapsed:.2f}s).")
+        sys.exit(1)
+    print(f"\n[SUCCESS] Mixed {len(results)} repositories ({elapsed:.2f}s).")
+
+
 def main() -> None:
     """
     Parses command-line arguments and initiates the RepoMixer.
 
     This function sets up logging, validates input paths, and handles
-    the overall execution flow of the RepoMixer.
+    the overall execution flow of the RepoMixer. `repomix.py batch ...`
+    is dispatched to `_batch_main`.
     """
+    if sys.argv[1:2] == ["batch"]:
+        _batch_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
-        description="Synthesizes a code repository into a single text file for AI context, respecting .gitignore.",
+        description="Synthesizes a code repository into a single text file for AI context, respecting .gitignore.\n"
+                    "Run 'batch --help' for mixing many repositories in parallel.",
         formatter_class=argparse.RawTextHelpFormatter
     )
     parser.add_argument(
         "root_dir", nargs="?", default=".",
-        help="Path to the repository root directory (default: current directory)."
+        help="Path to the repository root directory (default: current directory), or to a\n"
+             "zip or tar archive (.tar.gz, .tar.bz2 and .tar.xz too) to mix without extracting it."
     )
     parser.add_argument(
         "-o", "--output", default=DEFAULT_OUTPUT_FILENAME,
-        help=f"Name of the output text file (default: {DEFAULT_OUTPUT_FILENAME})."
+        help=f"Name of the output text file, or '-' for standard output (default: {DEFAULT_OUTPUT_FILENAME}).\n"
+             "Relative names are relative to the root directory, or to the directory of an archive."
     )
     parser.add_argument(
-        "-v", "--verbose", action="store_true",
-        help="Enable verbose logging for debugging."
+        "-w", "--watch", action="store_true",
+        help="Keep running and update the output whenever files change."
     )
+    parser.add_argument(
+        "--stats", metavar="FILE.json",
+        help="Write the time spent per phase (walk, ignore, binary, read, decode, stream,\n"
+             "dedupe, write, compress) and counts of files, bytes, skips and errors to FILE.json."
+    )
+    parser.add_argument(
+        "--profile", metavar="FILE.prof",
+        help="Run under cProfile and save the profile to FILE.prof, for use with pstats\n"
+             "or snakeviz. The main thread and the threads it starts (--jobs readers, the\n"
+             "compression writer) are profiled; the worker processes of --partitions are not."
+    )
+    _add_mixer_arguments(parser)
     args = parser.parse_args()
+    _check_mixer_arguments(parser, args)
 
     log_level = logging.DEBUG if args.verbose else logging.INFO
     logging.basicConfig(level=log_level, format=LOG_FORMAT, stream=sys.stderr)
@@ -241,13 +5113,47 @@ def main() -> None:
         logging.critical(f"The specified root directory does not exist: {args.root_dir}")
         sys.exit(1)
 
-    output_path = Path(args.output)
-    if not output_path.is_absolute():
-        output_path = root_path / output_path
-    # No need to resolve() output_path again, as root_path is already absolute.
+    output_path = None
+    if args.output != "-":
+        output_path = _with_compression_suffix(Path(args.output), args.compress)
+        if not output_path.is_absolute():
+            output_path = (root_path.parent if root_path.is_file() else root_path) / output_path
+        # No need to resolve() output_path again, as root_path is already absolute.
 
-    mixer = RepoMixer(root_dir=root_path, output_file=output_path)
-    mixer.run()
+    if args.watch and root_path.is_file():
+        parser.error("--watch cannot be used with an archive.")
+
+    # Constructing the mixer scans archives, resolves --rev and --diff-base and loads
+    # the ignore rules, so it is timed and profiled as part of the run
+    profiler = _ThreadedProfile() if args.profile else None
+    started = time.perf_counter()
+    mixer = None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            mixer = RepoMixer(root_dir=root_path, output_file=output_path, **_mixer_options(args))
+        except ValueError as e:
+            # Only options that depend on the root, e.g. --rev or an archive, are left to RepoMixer
+            logging.critical(str(e))
+            sys.exit(1)
+        if args.watch:
+            mixer.watch()
+        else:
+            mixer.run()
+    finally:
+        # Also report runs that failed, which are often the ones worth a look
+        if profiler is not None:
+            profiler.disable()
+            _write_report(profiler.dump_stats, args.profile, "profile")
+        if args.stats and mixer is not None:
+            import json
+            report = mixer.stats_report()
+            report["wall_seconds"] = time.perf_counter() - started
+            report["root_dir"] = str(root_path)
+            report["options"] = _mixer_options(args)
+            _write_report(lambda path: Path(path).write_text(
+                json.dumps(report, indent=2, default=str) + "\n", encoding="utf-8"), args.stats, "statistics")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,476 @@
+"""
+RepoMixer Benchmarks
+
+Benchmarks for the performance-sensitive parts of repomix.py. The ignore
+benchmark compares the compiled IgnoreRules engine against the per-rule matcher
+returned by gitignore_parser on a large synthetic rule set, after checking that
+the engine returns the same verdicts as a straightforward per-rule evaluation.
+The repository benchmark generates a synthetic repository and times the walk,
+ignore matching against its layered .gitignore files, binary detection and a
+full run separately. The startup benchmark times
+importing repomix under `python -X importtime`, and compiling ignore rules
+against loading them from the rule cache; test_repomix.py checks that the
+import defers the modules only some options need. Results can be written as
+JSON so that runs can be compared over time.
+"""
+# Dependencies: gitignore-parser (through repomix)
+
+import argparse
+import json
+import logging
+import marshal
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Callable, Dict, Final, List, Optional, Tuple
+
+import repomix
+from gitignore_parser import _parse_gitignore_lines, rule_from_pattern
+
+DEFAULT_RULE_COUNT: Final[int] = 2000
+DEFAULT_PATH_COUNT: Final[int] = 20000
+# gitignore_parser normalises the path once per rule, so it is timed on a sample.
+LEGACY_SAMPLE_SIZE: Final[int] = 200
+DEFAULT_REPEAT: Final[int] = 3
+NEGATION_RATIO: Final[float] = 0.1
+# Synthetic repository defaults: 2,066 files, 20 of them nested .gitignore files, in 341 directories.
+DEFAULT_DEPTH: Final[int] = 4
+DEFAULT_FANOUT: Final[int] = 4
+DEFAULT_FILES_PER_DIR: Final[int] = 6
+DEFAULT_FILE_SIZE: Final[int] = 4096
+DEFAULT_BINARY_RATIO: Final[float] = 0.1
+DEFAULT_REPO_RULES: Final[int] = 200
+DEFAULT_NESTED_RULES: Final[int] = 20
+# Directories this many levels below the root and above get a nested .gitignore.
+NESTED_IGNORE_DEPTH: Final[int] = 2
+RESULTS_VERSION: Final[int] = 1
+
+# --- Synthetic Data ---
+
+def generate_ignore_lines(rng: random.Random, count: int,
+                          negation_ratio: float = NEGATION_RATIO) -> List[str]:
+    """
+    Generates a mix of rule shapes found in large real-world ignore files:
+    plain names, directories, extensions, anchored paths and globs, with
+    a fraction of them negated.
+
+    :param rng: The random generator to draw from.
+    :type rng: random.Random
+    :param count: The number of rules to generate.
+    :type count: int
+    :param negation_ratio: The fraction of negated rules.
+    :type negation_ratio: float
+    :return: The ignore file lines.
+    :rtype: List[str]
+    """
+    shapes = (
+        lambda i: f"name{i}",
+        lambda i: f"dir{i}/",
+        lambda i: f"*.ext{i}",
+        lambda i: f"/src/mod{i}/*.py",
+        lambda i: f"test_*{i}.py",
+        lambda i: f"**/gen{i}/",
+        lambda i: f"build{i}/**/*.o",
+        lambda i: f"file{i}.[ch]",
+    )
+    lines = ["# synthetic ignore file"]
+    for i in range(count):
+        pattern = rng.choice(shapes)(rng.randrange(count))
+        if rng.random() < negation_ratio:
+            pattern = "!" + pattern
+        lines.append(pattern)
+    return lines
+
+
+def generate_paths(rng: random.Random, count: int, rule_count: int) -> List[Tuple[str, bool]]:
+    """
+    Generates relative POSIX paths whose components often collide with the
+    generated rules, so that both hits and misses are exercised.
+
+    :param rng: The random generator to draw from.
+    :type rng: random.Random
+    :param count: The number of paths to generate.
+    :type count: int
+    :param rule_count: The number of generated rules, bounding the numeric suffixes.
+    :type rule_count: int
+    :return: Tuples of (relative path, is_dir).
+    :rtype: List[Tuple[str, bool]]
+    """
+    dir_names = ("src", "lib", "dir{}", "gen{}", "build{}", "mod{}", "pkg")
+    file_names = ("name{}", "file{}.c", "test_a{}.py", "main.py", "x.ext{}", "README.md")
+    paths = []
+    for _ in range(count):
+        parts = [rng.choice(dir_names).format(rng.randrange(rule_count))
+                 for _ in range(rng.randint(0, 5))]
+        is_dir = rng.random() < 0.2
+        leaf = rng.choice(dir_names if is_dir else file_names)
+        parts.append(leaf.format(rng.randrange(rule_count)))
+        paths.append(("/".join(parts), is_dir))
+    return paths
+
+def generate_repo(root: Path, rng: random.Random, depth: int, fanout: int, files_per_dir: int,
+                  file_size: int, binary_ratio: float, rule_count: int, negation_ratio: float,
+                  nested_rule_count: int = DEFAULT_NESTED_RULES) -> int:
+    """
+    Writes a synthetic repository: a directory tree of the given depth and
+    fan-out, text and binary files named like the paths of `generate_paths`,
+    a root .gitignore from `generate_ignore_lines`, and a smaller .gitignore
+    in every directory of the first NESTED_IGNORE_DEPTH levels below the root.
+
+    :param root: The empty directory to fill.
+    :type root: Path
+    :param rng: The random generator to draw from.
+    :type rng: random.Random
+    :param depth: The number of directory levels below the root.
+    :type depth: int
+    :param fanout: The number of subdirectories per directory.
+    :type fanout: int
+    :param files_per_dir: The number of files per directory.
+    :type files_per_dir: int
+    :param file_size: The mean file size in bytes; sizes vary from half to 1.5 times this.
+    :type file_size: int
+    :param binary_ratio: The fraction of binary files.
+    :type binary_ratio: float
+    :param rule_count: The number of .gitignore rules.
+    :type rule_count: int
+    :param negation_ratio: The fraction of negated rules.
+    :type negation_ratio: float
+    :param nested_rule_count: The number of rules of each nested .gitignore; 0 writes none.
+    :type nested_rule_count: int
+    :return: The number of files written.
+    :rtype: int
+    """
+    dir_names = ("src", "lib", "dir{}", "gen{}", "build{}", "mod{}", "pkg")
+    file_names = ("name{}", "file{}.c", "test_a{}.py", "main{}.py", "x.ext{}", "README{}.md")
+    bound = max(rule_count, 1)
+    (root / ".gitignore").write_text("\n".join(generate_ignore_lines(rng, rule_count, negation_ratio)) + "\n")
+    line = b"    value = compute(value, 42)  # synthetic source line\n"
+
+    file_count = 0
+    level = [root]
+    for current_depth in range(depth + 1):
+        next_level = []
+        for directory in level:
+            if nested_rule_count > 0 and 1 <= current_depth <= NESTED_IGNORE_DEPTH:
+                # Drawn from their own generator, so the rest of the tree does not depend on them
+                nested_rng = random.Random(directory.relative_to(root).as_posix())
+                (directory / ".gitignore").write_text(
+                    "\n".join(generate_ignore_lines(nested_rng, nested_rule_count, negation_ratio)) + "\n")
+                file_count += 1
+            for index in range(files_per_dir):
+                name = rng.choice(file_names).format(rng.randrange(bound))
+                size = rng.randint(file_size // 2, file_size * 3 // 2)
+                if rng.random() < binary_ratio:
+                    data = b"\0" + rng.randbytes(max(size - 1, 0))
+                else:
+                    data = (line * (size // len(line) + 1))[:size]
+                (directory / f"{index}_{name}").write_bytes(data)
+                file_count += 1
+            if current_depth < depth:
+                for index in range(fanout):
+                    subdirectory = directory / f"{index}_{rng.choice(dir_names).format(rng.randrange(bound))}"
+                    subdirectory.mkdir()
+                    next_level.append(subdirectory)
+        level = next_level
+    return file_count
+
+# --- Matchers ---
+
+def per_rule_matcher(lines: List[str]) -> Callable[[str, bool], Optional[bool]]:
+    """
+    Builds a reference matcher with the same semantics as IgnoreRules that
+    searches every rule's regex in turn.
+
+    :param lines: The ignore file lines.
+    :type lines: List[str]
+    :return: A function mapping (relative path, is_dir) to a verdict.
+    :rtype: Callable[[str, bool], Optional[bool]]
+    """
+    rules = []
+    for line in lines:
+        rule = rule_from_pattern(line)
+        if rule:
+            regex = rule.regex
+            if rule.directory_only and regex.endswith("/$"):
+                regex = regex[:-2] + "($|\\/)"
+            rules.append((re.compile(regex), rule.negation, rule.directory_only))
+
+    def match(relative_path: str, is_dir: bool) -> Optional[bool]:
+        for pattern, negation, directory_only in reversed(rules):
+            if directory_only and not is_dir:
+                continue
+            if pattern.search(relative_path):
+                return not negation
+        return None
+    return match
+
+
+def time_calls(func: Callable[[], object], repeat: int) -> float:
+    """
+    Returns the best wall time of several runs of func.
+
+    :param func: The function to time.
+    :type func: Callable[[], object]
+    :param repeat: The number of runs.
+    :type repeat: int
+    :return: The best time in seconds.
+    :rtype: float
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# --- Benchmarks ---
+
+def bench_ignore(rule_count: int, path_count: int, repeat: int, seed: int) -> Optional[Dict[str, float]]:
+    """
+    Compares the ignore matchers on a synthetic rule set and prints the results.
+
+    :param rule_count: The number of synthetic rules.
+    :type rule_count: int
+    :param path_count: The number of synthetic paths.
+    :type path_count: int
+    :param repeat: Runs per matcher.
+    :type repeat: int
+    :param seed: The random seed.
+    :type seed: int
+    :return: Microseconds per path for each matcher, or None if the compiled
+             engine disagreed with the reference on any path.
+    :rtype: Optional[Dict[str, float]]
+    """
+    rng = random.Random(seed)
+    lines = generate_ignore_lines(rng, rule_count)
+    paths = generate_paths(rng, path_count, rule_count)
+
+    compiled = repomix.IgnoreRules(lines, source="<synthetic>")
+    reference = per_rule_matcher(lines)
+    mismatches = [(p, d) for p, d in paths if compiled.match(p, d) != reference(p, d)]
+    if mismatches:
+        print(f"[FAIL] {len(mismatches)} verdicts differ, e.g. {mismatches[:3]}", file=sys.stderr)
+        return None
+
+    base_dir = Path.cwd()
+    legacy = _parse_gitignore_lines(lines, "<synthetic>", base_dir=base_dir)
+    legacy_paths = [base_dir / p for p, _ in paths[:LEGACY_SAMPLE_SIZE]]
+
+    # Microseconds per path for each matcher
+    results = {
+        "gitignore_parser": time_calls(lambda: [legacy(p) for p in legacy_paths], repeat)
+                            / len(legacy_paths) * 1e6,
+        "per-rule regex": time_calls(lambda: [reference(p, d) for p, d in paths], repeat)
+                          / len(paths) * 1e6,
+        "compiled": time_calls(lambda: [compiled.match(p, d) for p, d in paths], repeat)
+                    / len(paths) * 1e6,
+    }
+    print(f"Ignore matching: {rule_count} rules, {path_count} paths (best of {repeat})")
+    for name, per_path in results.items():
+        speedup = results["gitignore_parser"] / per_path
+        print(f"  {name:<18} {per_path:10.2f} us/path  {speedup:8.1f}x")
+    return results
+
+
+def bench_repo(root: Path, repeat: int, jobs: int) -> Dict[str, float]:
+    """
+    Times the stages of RepoMixer on a repository and prints the results.
+    Every stage runs on a warm page cache, as the first repetition warms it.
+    The ignore stage matches every entry of the traversed directories, ignored
+    ones included, against the layered rules of its directory, as the walk does.
+
+    :param root: The repository root.
+    :type root: Path
+    :param repeat: Runs per stage.
+    :type repeat: int
+    :param jobs: The number of reader threads for the full run.
+    :type jobs: int
+    :return: Seconds per stage, and the file and matched path counts.
+    :rtype: Dict[str, float]
+    """
+    with tempfile.TemporaryDirectory(prefix="repomix-bench-") as temp_dir:
+        output_file = Path(temp_dir) / "repomix.txt"
+        mixer = repomix.RepoMixer(root_dir=root, output_file=output_file, jobs=jobs)
+        candidates: List[Tuple[str, bool, repomix.IgnoreLayers]] = []
+
+        def on_directory(current_dir: str, prefix: str, layers: repomix.IgnoreLayers) -> None:
+            with os.scandir(current_dir) as it:
+                for entry in it:
+                    relative_path = prefix + entry.name
+                    is_dir = entry.is_dir()
+                    if not (relative_path + "/" if is_dir else relative_path).startswith(
+                            repomix.DEFAULT_IGNORE_PATTERNS):
+                        candidates.append((relative_path, is_dir, layers))
+
+        files = [file_path for file_path, _ in mixer._walk_repo(on_directory)]
+
+        def match_all() -> int:
+            return sum(mixer._is_ignored(relative_path, is_dir, layers)
+                       for relative_path, is_dir, layers in candidates)
+
+        def full_run() -> None:
+            # The output is not part of the results; keep the report readable
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                repomix.RepoMixer(root_dir=root, output_file=output_file, jobs=jobs).run()
+
+        results = {
+            "files": float(len(files)),
+            "ignore_paths": float(len(candidates)),
+            "walk_s": time_calls(lambda: sum(1 for _ in mixer._walk_repo()), repeat),
+            "ignore_s": time_calls(match_all, repeat),
+            "is_binary_s": time_calls(lambda: [mixer._is_binary(path) for path in files], repeat),
+            "run_s": time_calls(full_run, repeat),
+            "output_bytes": float(output_file.stat().st_size),
+        }
+    print(f"Repository {root}: {len(files)} files after ignore rules (best of {repeat}, jobs {jobs})")
+    for name in ("walk_s", "is_binary_s", "run_s"):
+        print(f"  {name[:-2]:<18} {results[name] * 1e3:10.1f} ms  {results[name] / max(len(files), 1) * 1e6:8.2f} us/file")
+    print(f"  {'ignore':<18} {results['ignore_s'] * 1e3:10.1f} ms  "
+          f"{results['ignore_s'] / max(len(candidates), 1) * 1e6:8.2f} us/path ({len(candidates)} paths)")
+    return results
+
+
+def bench_startup(repeat: int, rule_count: int, seed: int) -> Dict[str, float]:
+    """
+    Measures the import time of repomix in fresh interpreters with `-X importtime`,
+    then times compiling ignore rules against restoring them as the rule cache
+    does. Prints the results.
+
+    :param repeat: Imports to time; the best is reported.
+    :type repeat: int
+    :param rule_count: The number of synthetic ignore rules to compile.
+    :type rule_count: int
+    :param seed: The random seed of the rules.
+    :type seed: int
+    :return: The import time and rule compile and load times in milliseconds.
+    :rtype: Dict[str, float]
+    """
+    module_dir = str(Path(repomix.__file__).resolve().parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (module_dir, os.environ.get("PYTHONPATH")))))
+    command = [sys.executable, "-X", "importtime", "-c", "import repomix"]
+    best_us = None
+    # The first import may compile and cache the bytecode, and is not counted
+    for run in range(repeat + 1):
+        result = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            name = fields[2].strip()
+            if name == "repomix" and run > 0:
+                best_us = min(best_us or float("inf"), int(fields[1]))
+
+    rng = random.Random(seed)
+    lines = generate_ignore_lines(rng, rule_count)
+    compiled = repomix.IgnoreRules(lines)
+    state = marshal.dumps(compiled.__getstate__())
+    results = {
+        "import_ms": best_us / 1e3,
+        "rules_compile_ms": time_calls(lambda: repomix.IgnoreRules(lines), repeat) * 1e3,
+        "rules_cached_ms": time_calls(lambda: repomix.IgnoreRules._from_state(marshal.loads(state), ""),
+                                      repeat) * 1e3,
+    }
+    print(f"Startup (best of {repeat}):")
+    print(f"  {'import repomix':<18} {results['import_ms']:10.1f} ms")
+    print(f"  {f'compile {rule_count} rules':<18} {results['rules_compile_ms']:10.1f} ms")
+    print(f"  {'load cached rules':<18} {results['rules_cached_ms']:10.1f} ms")
+    return results
+
+
+def write_results(path: Path, params: Dict[str, object], results: Dict[str, Dict[str, float]]) -> None:
+    """
+    Writes benchmark results with the parameters and environment that produced them.
+
+    :param path: The JSON file to write.
+    :type path: Path
+    :param params: The benchmark parameters.
+    :type params: Dict[str, object]
+    :param results: The results per benchmark.
+    :type results: Dict[str, Dict[str, float]]
+    """
+    report = {
+        "version": RESULTS_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+    path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"Results written to {path}")
+
+
+def main() -> None:
+    """
+    Parses command-line arguments and runs the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks for repomix.py.")
+    parser.add_argument("--rules", type=int, default=DEFAULT_RULE_COUNT,
+                        help=f"Number of synthetic ignore rules (default: {DEFAULT_RULE_COUNT}).")
+    parser.add_argument("--paths", type=int, default=DEFAULT_PATH_COUNT,
+                        help=f"Number of synthetic paths to match (default: {DEFAULT_PATH_COUNT}).")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Runs per matcher; the best time is reported (default: {DEFAULT_REPEAT}).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    parser.add_argument("--only", choices=("ignore", "repo", "startup"),
+                        help="Run only the ignore matcher, the repository or the startup benchmark.")
+    parser.add_argument("--repo", type=Path,
+                        help="Benchmark this repository instead of generating a synthetic one.")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH,
+                        help=f"Directory levels of the synthetic repository (default: {DEFAULT_DEPTH}).")
+    parser.add_argument("--fanout", type=int, default=DEFAULT_FANOUT,
+                        help=f"Subdirectories per directory (default: {DEFAULT_FANOUT}).")
+    parser.add_argument("--files-per-dir", type=int, default=DEFAULT_FILES_PER_DIR,
+                        help=f"Files per directory (default: {DEFAULT_FILES_PER_DIR}).")
+    parser.add_argument("--file-size", type=int, default=DEFAULT_FILE_SIZE,
+                        help=f"Mean file size in bytes (default: {DEFAULT_FILE_SIZE}).")
+    parser.add_argument("--binary-ratio", type=float, default=DEFAULT_BINARY_RATIO,
+                        help=f"Fraction of binary files (default: {DEFAULT_BINARY_RATIO}).")
+    parser.add_argument("--repo-rules", type=int, default=DEFAULT_REPO_RULES,
+                        help=f"Rules in the synthetic .gitignore (default: {DEFAULT_REPO_RULES}).")
+    parser.add_argument("--nested-rules", type=int, default=DEFAULT_NESTED_RULES,
+                        help=f"Rules in each nested synthetic .gitignore (default: {DEFAULT_NESTED_RULES}).")
+    parser.add_argument("--negation-ratio", type=float, default=NEGATION_RATIO,
+                        help=f"Fraction of negated ignore rules (default: {NEGATION_RATIO}).")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Reader threads for the full run (default: 1).")
+    parser.add_argument("--json", type=Path, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format=repomix.LOG_FORMAT)
+
+    results: Dict[str, Dict[str, float]] = {}
+    if args.only in (None, "startup"):
+        results["startup"] = bench_startup(args.repeat, args.rules, args.seed)
+
+    if args.only in (None, "ignore"):
+        ignore_results = bench_ignore(args.rules, args.paths, args.repeat, args.seed)
+        if ignore_results is None:
+            sys.exit(1)
+        results["ignore_us_per_path"] = ignore_results
+
+    if args.only in (None, "repo"):
+        if args.repo is not None:
+            results["repo"] = bench_repo(args.repo.resolve(), args.repeat, args.jobs)
+        else:
+            with tempfile.TemporaryDirectory(prefix="repomix-synthetic-") as temp_dir:
+                root = Path(temp_dir)
+                file_count = generate_repo(root, random.Random(args.seed), args.depth, args.fanout,
+                                           args.files_per_dir, args.file_size, args.binary_ratio,
+                                           args.repo_rules, args.negation_ratio, args.nested_rules)
+                print(f"Generated {file_count} files in {root}")
+                results["repo"] = bench_repo(root, args.repeat, args.jobs)
+
+    if args.json is not None:
+        write_results(args.json, {key: str(value) if isinstance(value, Path) else value
+                                  for key, value in vars(args).items()}, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1712 @@
+"""
+RepoMixer Tests
+
+Tests for repomix.py. Each test builds its fixtures (small work trees, git
+repositories and archives) in a temporary directory and, where the output
+must not depend on how it was produced, compares complete mixes byte for
+byte. Run with `python -m unittest test_repomix` or pytest.
+"""
+
+import collections
+import gzip
+import importlib.util
+import io
+import json
+import logging
+import lzma
+import marshal
+import os
+import pickle
+import pstats
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Final, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from unittest import mock
+
+import repomix
+import repomix_bench
+
+
+# A small work tree covering the shapes the mixer distinguishes: nested directories,
+# CRLF and surrounding whitespace, non-UTF-8 bytes, an empty and a binary file.
+SAMPLE_TREE: Dict[str, Union[str, bytes]] = {
+    "README.md": "# Sample\n\nA small tree.\n",
+    "main.py": "import sys\r\n\r\nprint(sys.argv)\r\n",
+    "Dockerfile": "FROM scratch\n",
+    "src/app.js": "  \n\nconsole.log('hi');\n\n  \n",
+    "src/lib/util.go": "package lib\n",
+    "src/lib/unicode.txt": "héllo wörld\n",
+    "src/lib/latin1.txt": b"caf\xe9\n",
+    "docs/empty.txt": "",
+    "assets/logo.bin": b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR",
+    **{f"many/file{i:03d}.txt": f"line {i}\n" * (i % 7 + 1) for i in range(60)},
+}
+
+_environment_patch = None
+
+
+def setUpModule() -> None:
+    """
+    Isolates the tests from the user's git configuration, global excludes
+    and caches, and silences the progress logging of the mixer.
+    """
+    global _environment_patch
+    home = tempfile.mkdtemp(prefix="repomix-test-home-")
+    _environment_patch = mock.patch.dict(os.environ, {
+        "HOME": home, "XDG_CONFIG_HOME": os.path.join(home, ".config"),
+        "XDG_CACHE_HOME": os.path.join(home, ".cache"), "GIT_CONFIG_NOSYSTEM": "1",
+    })
+    _environment_patch.start()
+    logging.disable(logging.CRITICAL)
+
+
+def tearDownModule() -> None:
+    import shutil
+    home = os.environ["HOME"]
+    _environment_patch.stop()
+    shutil.rmtree(home, ignore_errors=True)
+    logging.disable(logging.NOTSET)
+
+
+def write_tree(root: Path, files: Dict[str, Union[str, bytes]]) -> None:
+    """
+    Writes files below root, creating their directories.
+
+    :param root: The directory to write into.
+    :type root: Path
+    :param files: The contents keyed by POSIX path relative to root; str is written as UTF-8.
+    :type files: Dict[str, Union[str, bytes]]
+    """
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content.encode("utf-8") if isinstance(content, str) else content)
+
+
+def split_segments(output: bytes) -> Dict[str, bytes]:
+    """
+    Splits a mix into its segments, without the header.
+
+    :param output: The complete mix.
+    :type output: bytes
+    :return: The bytes following each `--- path ---` marker, keyed by path.
+    :rtype: Dict[str, bytes]
+    """
+    parts = re.split(rb"(?m)^--- (\S+) ---", output)
+    return {parts[i].decode("utf-8"): parts[i + 1] for i in range(1, len(parts), 2)}
+
+
+class MixerTestCase(unittest.TestCase):
+    """
+    Provides an empty work tree in `root` and a separate directory for outputs in `out`.
+    """
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory(prefix="repomix-test-")
+        self.addCleanup(temp_dir.cleanup)
+        self.base = Path(temp_dir.name).resolve()
+        self.root = self.base / "repo"
+        self.root.mkdir()
+        self.out = self.base / "out"
+        self.out.mkdir()
+
+    def mix(self, name: str = "repomix.txt", root: Optional[Path] = None, **options) -> bytes:
+        """
+        Runs a mixer over root (the work tree by default) into `out` and returns the output.
+        """
+        output_file = self.out / name
+        with redirect_stdout(io.StringIO()):
+            repomix.RepoMixer(root_dir=root or self.root, output_file=output_file, **options).run()
+        return output_file.read_bytes()
+
+
+def random_rules_and_paths(seed: int, rule_count: int, path_count: int
+                           ) -> Tuple[List[str], List[Tuple[str, bool]]]:
+    """
+    Draws ignore rules of every shape the engine indexes differently, and paths
+    whose components often collide with them.
+    """
+    rng = random.Random(seed)
+    shapes = ("name{}", "dir{}/", "*.ext{}", "/src/mod{}/*.py", "test_*{}.py", "**/gen{}/", "build{}/**/*.o",
+              "file{}.[ch]", "a?{}", "/top{}", "doc{}/*.md", "**/cache{}", "lib{}/**", "*{}~", "\\#hash{}")
+    bound = max(rule_count // 4, 1)
+    lines = []
+    for _ in range(rule_count):
+        pattern = rng.choice(shapes).format(rng.randrange(bound))
+        lines.append("!" + pattern if rng.random() < 0.15 else pattern)
+    dir_names = ("src", "lib{}", "dir{}", "gen{}", "build{}", "mod{}", "doc{}", "cache{}", "top{}")
+    file_names = ("name{}", "file{}.c", "file{}.h", "test_a{}.py", "x.ext{}", "a{}.md", "ab{}", "z{}~",
+                  "#hash{}", "top{}", "cache{}", "x{}.o")
+    paths = []
+    for _ in range(path_count):
+        parts = [rng.choice(dir_names).format(rng.randrange(bound)) for _ in range(rng.randint(0, 4))]
+        is_dir = rng.random() < 0.25
+        parts.append(rng.choice(dir_names if is_dir else file_names).format(rng.randrange(bound)))
+        paths.append(("/".join(parts), is_dir))
+    return lines, paths
+
+
+def age_tree(root: Path, seconds: int = 60) -> None:
+    """
+    Moves the mtime of every file below root into the past, so that an
+    incremental run does not distrust them as modified while it ran.
+    """
+    then = time.time() - seconds
+    for path in root.rglob("*"):
+        if path.is_file():
+            os.utime(path, (then, then))
+
+
+class ScriptedWatcher:
+    """
+    Stands in for the watchers of RepoMixer.watch(). Every blocking read
+    records the output written so far, then applies the next step of the
+    script and reports its events; the watch stops when the script is done.
+    """
+    def __init__(self, output_file: Path, steps: List[Callable[[], List[Tuple[Optional[str], int]]]]):
+        self.output_file = output_file
+        self.steps = list(steps)
+        self.directories: List[str] = []
+        self.outputs: List[bytes] = []
+        self.closed = False
+
+    def __call__(self, *args) -> "ScriptedWatcher":
+        return self
+
+    def add(self, directory: str) -> None:
+        self.directories.append(directory)
+
+    def read(self, timeout: Optional[float]) -> List[Tuple[Optional[str], int]]:
+        if timeout is not None:
+            return []
+        self.outputs.append(self.output_file.read_bytes())
+        if not self.steps:
+            raise KeyboardInterrupt
+        return self.steps.pop(0)()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+GIT_ENV: Dict[str, str] = {
+    "GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_AUTHOR_DATE": "2020-01-01T00:00:00Z", "GIT_COMMITTER_DATE": "2020-01-01T00:00:00Z",
+}
+
+
+def run_git(cwd: Path, *args: str) -> str:
+    """
+    Runs git in cwd with a fixed identity and returns its standard output.
+    """
+    return subprocess.run(["git", *args], cwd=cwd, env={**os.environ, **GIT_ENV}, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def init_repo(root: Path, files: Dict[str, Union[str, bytes]]) -> None:
+    """
+    Writes files into a new git repository at root and stages them.
+    """
+    write_tree(root, files)
+    run_git(root, "init", "-q", "-b", "main")
+    run_git(root, "add", "-A")
+
+
+requires_git = unittest.skipUnless(shutil.which("git"), "git is not installed")
+
+
+@contextmanager
+def counting_opens() -> Iterator[collections.Counter]:
+    """
+    Counts the calls of Path.open per path while active.
+    """
+    opened = collections.Counter()
+    real_open = Path.open
+
+    def counting_open(path, *args, **kwargs):
+        opened[path] += 1
+        return real_open(path, *args, **kwargs)
+
+    with mock.patch.object(Path, "open", counting_open):
+        yield opened
+
+
+# Whitespace to str.strip(), including the ASCII separators that bytes.strip() keeps
+# and multi-byte characters, and non-whitespace of every UTF-8 width.
+STRIP_ALPHABET: str = " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2028\u3000" + "aZ~\xe9\xff\u4e2d\U0001f600"
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(STRIP_ALPHABET) for _ in range(length))
+
+
+def run_script(*args: str, **kwargs) -> subprocess.CompletedProcess:
+    """
+    Runs repomix.py as a script with the test environment and captures its output.
+    """
+    return subprocess.run([sys.executable, repomix.__file__, *args], capture_output=True, **kwargs)
+
+
+DUPLICATE_BODY: str = "def shared():\n" + "    return 'the same body in several places'\n" * 4
+
+
+def numbered_lines(count: int, changed: Optional[int] = None) -> str:
+    """
+    Returns distinct source lines, one of them changed if requested.
+    """
+    return "".join(f"value_{i} = compute({i}, 'item {i}')  # {'changed' if i == changed else 'original'}\n"
+                   for i in range(count))
+
+
+def random_content(rng: random.Random, length: int) -> bytes:
+    """
+    Draws file content rich in what chunked decoding must carry across chunk
+    boundaries: CR/LF pairs, whitespace runs and multi-byte or invalid UTF-8.
+    """
+    pieces = (b"a", b"Z", b" ", b"\t", b"\r", b"\n", b"\r\n", b"\xc3\xa9", b"\xe4\xb8\xad", b"\xff",
+              b"\xe2\x80\xa8", b"\x1c", b"\xc2\xa0")
+    return b"".join(rng.choice(pieces) for _ in range(length))
+
+
+def nested_tree() -> Dict[str, Union[str, bytes]]:
+    """
+    Returns a tree three levels deep with files at every level, nested ignore
+    files and binary files, so that partitions split it at several depths.
+    """
+    files: Dict[str, Union[str, bytes]] = {**SAMPLE_TREE, ".gitignore": "*.tmp\n"}
+    for top in range(4):
+        files[f"pkg{top}/.gitignore"] = "skip*/\n!keep.tmp\n"
+        for middle in range(3):
+            for leaf in range(3):
+                directory = f"pkg{top}/mod{middle}/sub{leaf}"
+                files[f"{directory}/code.py"] = f"# {directory}\n" * (leaf + 1)
+                files[f"{directory}/x.tmp"] = "ignored\n"
+            files[f"pkg{top}/mod{middle}/keep.tmp"] = "kept\n"
+            files[f"pkg{top}/mod{middle}/skip{middle}/x.py"] = "ignored\n"
+            files[f"pkg{top}/mod{middle}/blob.bin"] = b"\0" + bytes([top, middle])
+        files[f"pkg{top}/README"] = f"package {top}\n"
+    return files
+
+
+def tree_digest(root: Path) -> Dict[str, bytes]:
+    """
+    Returns the content of every file below root, keyed by POSIX path.
+    """
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in root.rglob("*") if path.is_file()}
+
+
+def big_module(name: str, changed: Optional[int] = None) -> str:
+    """
+    Returns a long source file that deltifies well against its other versions.
+    """
+    return "".join(f"def {name}_{i}(value):\n    return value * {i + 1 if i == changed else i}\n\n"
+                   for i in range(120))
+
+
+def make_history(root: Path) -> None:
+    """
+    Builds a repository with four commits on main: v1 (also the annotated tag
+    v1a), two commits that edit, add and delete files and are then repacked
+    with deltas, and a last commit left as loose objects.
+    """
+    init_repo(root, {
+        **SAMPLE_TREE,
+        ".gitignore": "*.log\n",
+        "sub/.gitignore": "gen/\n",
+        "sub/gen/out.py": "generated\n", "sub/debug.log": "ignored\n", "sub/keep.py": "kept\n",
+        **{f"big/mod{i}.py": big_module(f"mod{i}") for i in range(4)},
+    })
+    os.symlink("README.md", root / "link")
+    run_git(root, "add", "-A")
+    run_git(root, "commit", "-q", "-m", "first")
+    run_git(root, "tag", "v1")
+    run_git(root, "tag", "-a", "v1a", "-m", "annotated")
+    write_tree(root, {f"big/mod{i}.py": big_module(f"mod{i}", changed=i * 10) for i in range(4)})
+    write_tree(root, {"new.py": "print('new')\n"})
+    (root / "main.py").unlink()
+    run_git(root, "add", "-A")
+    run_git(root, "commit", "-q", "-m", "second")
+    write_tree(root, {"big/mod0.py": big_module("mod0", changed=99), ".gitignore": "*.log\n*.bin\n"})
+    run_git(root, "commit", "-q", "-am", "third")
+    run_git(root, "repack", "-q", "-a", "-d", "-f", "--depth=10", "--window=10")
+    run_git(root, "prune-packed")
+    write_tree(root, {"big/mod1.py": big_module("mod1", changed=50), "src/app.js": "loose();\n"})
+    run_git(root, "commit", "-q", "-am", "fourth")
+
+
+def checkout(root: Path, rev: str, dest: Path) -> Path:
+    """
+    Extracts the tree of a revision into dest with `git archive`.
+    """
+    data = subprocess.run(["git", "archive", "--format=tar", rev], cwd=root, check=True, capture_output=True).stdout
+    dest.mkdir(parents=True)
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        archive.extractall(dest)
+    return dest
+
+
+def pack_tree(root: Path, archive: Path, prefix: str = "proj/") -> None:
+    """
+    Packs every file below root into a zip or tar archive, chosen by the archive's
+    suffix, with the member names under prefix.
+    """
+    files = sorted(path for path in root.rglob("*") if path.is_file())
+    if archive.suffix == ".zip":
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as f:
+            for path in files:
+                f.write(path, prefix + path.relative_to(root).as_posix())
+        return
+    mode = {".gz": "w:gz", ".bz2": "w:bz2", ".xz": "w:xz"}.get(archive.suffix, "w")
+    with tarfile.open(archive, mode) as f:
+        for path in files:
+            f.add(path, prefix + path.relative_to(root).as_posix())
+
+
+# Modules that only some options need; importing repomix must not load them.
+LAZY_MODULES: Final[Tuple[str, ...]] = (
+    "gitignore_parser", "numpy", "xxhash", "zstandard", "concurrent", "multiprocessing", "subprocess",
+    "json", "lzma", "bz2", "gzip", "tarfile", "zipfile", "difflib", "tempfile", "ctypes", "random",
+    "cProfile",
+)
+
+# Prints the top-level modules loaded by `import repomix` that were not loaded before it.
+IMPORT_PROBE: Final[str] = """
+import sys
+before = set(sys.modules)
+import repomix
+print("\\n".join(sorted({name.partition(".")[0] for name in set(sys.modules) - before})))
+"""
+
+
+class TestParallelRead(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, SAMPLE_TREE)
+
+    def test_jobs_output_is_identical_to_serial(self) -> None:
+        serial = self.mix("serial.txt")
+        for jobs in (2, 8):
+            with self.subTest(jobs=jobs):
+                self.assertEqual(self.mix(f"jobs{jobs}.txt", jobs=jobs), serial)
+
+    def test_every_file_is_mixed_once(self) -> None:
+        output = self.mix()
+        self.assertEqual(sorted(split_segments(output)), sorted(SAMPLE_TREE))
+        self.assertEqual(len(re.findall(rb"(?m)^--- ", output)), len(SAMPLE_TREE))
+
+    def test_rendering(self) -> None:
+        segments = split_segments(self.mix(jobs=4))
+        self.assertEqual(segments["src/app.js"], b"\n```javascript\nconsole.log('hi');\n```\n\n")
+        self.assertEqual(segments["assets/logo.bin"], b"\n[Binary file, content not included]\n\n")
+        self.assertEqual(segments["src/lib/unicode.txt"], "\n```\nhéllo wörld\n```\n\n".encode("utf-8"))
+
+    def test_jobs_must_be_positive(self) -> None:
+        with self.assertRaises(ValueError):
+            repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", jobs=0)
+
+
+class TestWalk(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {
+            **SAMPLE_TREE,
+            ".gitignore": "build/\n*.log\n",
+            "build/out.js": "ignored\n",
+            "build/deep/out.js": "ignored\n",
+            "src/debug.log": "ignored\n",
+            ".git/HEAD": "ref: refs/heads/main\n",
+            ".git/objects/info/packs": "\n",
+        })
+
+    def test_walk_yields_relative_posix_paths(self) -> None:
+        mixer = repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt")
+        walked = list(mixer._walk_repo())
+        self.assertEqual(sorted(relative_path for _, relative_path in walked), sorted([*SAMPLE_TREE, ".gitignore"]))
+        for file_path, relative_path in walked:
+            self.assertEqual(file_path, self.root / relative_path)
+
+    def test_ignored_directories_are_not_listed(self) -> None:
+        mixer = repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt")
+        with mock.patch.object(os, "scandir", wraps=os.scandir) as scandir:
+            list(mixer._walk_repo())
+        listed = {Path(call.args[0]) for call in scandir.call_args_list}
+        self.assertIn(self.root / "src" / "lib", listed)
+        for pruned in (".git", "build"):
+            self.assertFalse(any(path.is_relative_to(self.root / pruned) for path in listed), pruned)
+
+    def test_output_inside_the_root_is_not_mixed(self) -> None:
+        output_file = self.root / "repomix.txt"
+        output_file.write_text("stale output\n")
+        with redirect_stdout(io.StringIO()):
+            repomix.RepoMixer(root_dir=self.root, output_file=output_file).run()
+        segments = split_segments(output_file.read_bytes())
+        self.assertNotIn("repomix.txt", segments)
+        self.assertEqual(sorted(segments), sorted([*SAMPLE_TREE, ".gitignore"]))
+
+
+class TestLayeredIgnoreRules(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.config_home = self.base / "config"
+        patcher = mock.patch.dict(os.environ, {"XDG_CONFIG_HOME": str(self.config_home)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mixed_paths(self) -> set:
+        return set(split_segments(self.mix()))
+
+    def test_nested_rules_apply_relative_to_their_directory(self) -> None:
+        write_tree(self.root, {
+            ".gitignore": "*.tmp\n",
+            "a.tmp": "", "a.txt": "a\n",
+            "sub/.gitignore": "local.txt\n/anchored.txt\n!keep.tmp\n",
+            "sub/x.tmp": "", "sub/keep.tmp": "kept\n", "sub/local.txt": "", "sub/anchored.txt": "",
+            "sub/deeper/anchored.txt": "kept\n", "sub/deeper/local.txt": "",
+            "other/local.txt": "kept\n", "other/anchored.txt": "kept\n",
+        })
+        self.assertEqual(self.mixed_paths(), {
+            ".gitignore", "a.txt", "sub/.gitignore", "sub/keep.tmp", "sub/deeper/anchored.txt",
+            "other/local.txt", "other/anchored.txt",
+        })
+
+    def test_directory_patterns_and_negation(self) -> None:
+        write_tree(self.root, {
+            ".gitignore": "logs/\ngen*/\n!gen_keep/\n",
+            "logs/today.txt": "", "data/logs": "a file, not a directory\n",
+            "gen_a/x.txt": "", "gen_keep/x.txt": "kept\n",
+        })
+        self.assertEqual(self.mixed_paths(), {".gitignore", "data/logs", "gen_keep/x.txt"})
+
+    def test_repository_wide_exclude_files(self) -> None:
+        write_tree(self.root, {
+            ".git/info/exclude": "secret.txt\n",
+            "secret.txt": "", "sub/secret.txt": "", "notes.bak": "", "draft.old": "", "kept.txt": "kept\n",
+        })
+        write_tree(self.config_home, {"git/ignore": "*.bak\n"})
+        self.assertEqual(self.mixed_paths(), {"draft.old", "kept.txt"})
+
+        # core.excludesFile replaces $XDG_CONFIG_HOME/git/ignore
+        write_tree(self.base, {"excludes": "*.old\n"})
+        write_tree(self.root, {".git/config": f"[core]\n\texcludesFile = {self.base / 'excludes'}\n"})
+        self.assertEqual(self.mixed_paths(), {"notes.bak", "kept.txt"})
+
+    def test_rules_match_relative_paths(self) -> None:
+        rules = repomix.IgnoreRules(["*.py", "!keep.py", "build/", "/root.txt", "# comment", ""])
+        self.assertTrue(rules.match("a.py", False))
+        self.assertIs(rules.match("keep.py", False), False)
+        self.assertIsNone(rules.match("a.txt", False))
+        self.assertTrue(rules.match("src/build", True))
+        self.assertIsNone(rules.match("src/build", False))
+        self.assertTrue(rules.match("root.txt", False))
+        self.assertIsNone(rules.match("src/root.txt", False))
+
+
+class TestIgnoreEngine(unittest.TestCase):
+    def test_engine_matches_per_rule_evaluation(self) -> None:
+        for seed, rule_count in ((1, 10), (2, 60), (3, 400)):
+            lines, paths = random_rules_and_paths(seed, rule_count, 3000)
+            rules = repomix.IgnoreRules(lines)
+            reference = repomix_bench.per_rule_matcher(lines)
+            mismatches = [(path, is_dir) for path, is_dir in paths
+                          if rules.match(path, is_dir) != reference(path, is_dir)]
+            self.assertEqual(mismatches, [], f"seed {seed}")
+
+    def test_last_matching_rule_wins(self) -> None:
+        rules = repomix.IgnoreRules(["*.log", "!important.log", "important.log", "!*.log", "debug.log"])
+        self.assertTrue(rules.match("debug.log", False))
+        self.assertIs(rules.match("important.log", False), False)
+        self.assertIs(rules.match("sub/other.log", False), False)
+
+    def test_empty_rules(self) -> None:
+        rules = repomix.IgnoreRules(["", "# only a comment"])
+        self.assertFalse(rules)
+        self.assertIsNone(rules.match("anything", False))
+
+
+class TestIncremental(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, SAMPLE_TREE)
+        age_tree(self.root)
+
+    def mix_counting(self, **options) -> "tuple[bytes, int]":
+        """
+        Mixes incrementally into repomix.txt and counts the files actually rendered.
+        """
+        with mock.patch.object(repomix.RepoMixer, "_render_file", autospec=True,
+                               side_effect=repomix.RepoMixer._render_file) as render:
+            output = self.mix(incremental=True, **options)
+        return output, render.call_count
+
+    def test_unchanged_files_are_reused(self) -> None:
+        first, rendered = self.mix_counting()
+        self.assertEqual(rendered, len(SAMPLE_TREE))
+        self.assertEqual(first, self.mix("full.txt"))
+
+        write_tree(self.root, {"README.md": "# Changed\n", "src/new.py": "print('new')\n"})
+        for name in ("README.md", "src/new.py"):
+            os.utime(self.root / name, (time.time() - 30,) * 2)
+        (self.root / "many" / "file007.txt").unlink()
+
+        second, rendered = self.mix_counting()
+        self.assertEqual(rendered, 2)
+        self.assertEqual(second, self.mix("full.txt"))
+
+    def test_corrupt_manifest_falls_back_to_a_full_rebuild(self) -> None:
+        full = self.mix_counting()[0]
+        manifest_file = self.out / ("repomix.txt" + repomix.MANIFEST_SUFFIX)
+        self.assertTrue(manifest_file.exists())
+        for garbage in ("{not json", '{"version": 1}', "[]"):
+            with self.subTest(manifest=garbage):
+                manifest_file.write_text(garbage)
+                output, rendered = self.mix_counting()
+                self.assertEqual(rendered, len(SAMPLE_TREE))
+                self.assertEqual(output, full)
+
+    def test_changed_output_falls_back_to_a_full_rebuild(self) -> None:
+        full = self.mix_counting()[0]
+        with (self.out / "repomix.txt").open("ab") as f:
+            f.write(b"edited by hand\n")
+        output, rendered = self.mix_counting()
+        self.assertEqual(rendered, len(SAMPLE_TREE))
+        self.assertEqual(output, full)
+
+    def test_changed_rendering_options_rebuild(self) -> None:
+        self.mix_counting()
+        for options in ({"sample": [("many/*.txt", 1)]}, {"max_file_size": 10},
+                        {"max_file_size": 10, "oversize": "skip"}, {}):
+            with self.subTest(options=options):
+                output, rendered = self.mix_counting(**options)
+                self.assertEqual(rendered, len(SAMPLE_TREE))
+                self.assertEqual(output, self.mix("full.txt", **options))
+
+
+class TestWatch(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {**SAMPLE_TREE, ".gitignore": "*.log\n"})
+
+    def watch(self, steps: List[Callable[[], List[Tuple[Optional[str], int]]]]) -> ScriptedWatcher:
+        watcher = ScriptedWatcher(self.out / "repomix.txt", steps)
+        with mock.patch.object(repomix, "_InotifyWatcher", watcher), \
+                mock.patch.object(repomix, "_PollingWatcher", watcher), redirect_stdout(io.StringIO()):
+            repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt").watch(debounce=0)
+        self.assertTrue(watcher.closed)
+        return watcher
+
+    def event(self, relative_path: str, mask: int) -> List[Tuple[Optional[str], int]]:
+        return [(str(self.root / relative_path), mask)]
+
+    def test_output_follows_changes(self) -> None:
+        expected = [self.mix("initial.txt")]
+
+        def step(files: Dict[str, Union[str, bytes]], events: List[Tuple[str, int]], delete: str = ""):
+            def apply() -> List[Tuple[Optional[str], int]]:
+                write_tree(self.root, files)
+                if delete:
+                    (self.root / delete).unlink()
+                expected.append(self.mix(f"expected{len(expected)}.txt"))
+                return [(str(self.root / path) if path else None, mask) for path, mask in events]
+            return apply
+
+        watcher = self.watch([
+            step({"README.md": "# Modified\n"}, [("README.md", repomix.IN_CLOSE_WRITE)]),
+            step({}, [("main.py", repomix.IN_DELETE)], delete="main.py"),
+            step({"src/new.py": "print('new')\n", "src/debug.log": "ignored\n"},
+                 [("src/new.py", repomix.IN_CREATE), ("src/debug.log", repomix.IN_CREATE)]),
+            step({".gitignore": "*.log\nmany/\n"}, [(".gitignore", repomix.IN_CLOSE_WRITE)]),
+            step({"docs/empty.txt": "no longer empty\n"}, [("", repomix.IN_Q_OVERFLOW)]),
+        ])
+        self.assertIn(str(self.root / "src" / "lib"), watcher.directories)
+        self.assertEqual(len(set(expected)), len(expected))
+        self.assertEqual(watcher.outputs, expected)
+
+    def test_events_for_ignored_paths_keep_the_output(self) -> None:
+        def ignored():
+            write_tree(self.root, {"trace.log": "ignored\n"})
+            return self.event("trace.log", repomix.IN_CREATE)
+
+        watcher = self.watch([ignored])
+        self.assertEqual(watcher.outputs[0], watcher.outputs[1])
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_inotify_reports_changes_in_watched_directories(self) -> None:
+        watcher = repomix._InotifyWatcher()
+        self.addCleanup(watcher.close)
+        watcher.add(str(self.root / "src"))
+        write_tree(self.root, {"src/app.js": "changed\n", "docs/empty.txt": "unwatched\n"})
+        events = watcher.read(5.0)
+        self.assertTrue(events)
+        self.assertEqual({path for path, _ in events}, {str(self.root / "src" / "app.js")})
+        self.assertTrue(any(mask & repomix.IN_CLOSE_WRITE for _, mask in events))
+        self.assertEqual(watcher.read(0), [])
+
+
+@requires_git
+class TestGitIndex(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        init_repo(self.root, {
+            **SAMPLE_TREE,
+            ".gitignore": "*.log\n",
+            "src/lib/util_test.go": "package lib\n",
+            "src/lib/utilities/x.go": "package utilities\n",
+        })
+        # A gitlink, as left by a submodule, is not a file of this work tree
+        run_git(self.root, "update-index", "--add", "--cacheinfo", f"160000,{'1' * 40},vendor/module")
+
+    def ls_files(self) -> list:
+        return [path for path in run_git(self.root, "ls-files", "-z", "--cached").split("\0")
+                if path and path != "vendor/module"]
+
+    def test_index_versions_match_ls_files(self) -> None:
+        for version in ("2", "3", "4"):
+            with self.subTest(version=version):
+                run_git(self.root, "update-index", "--index-version", version)
+                paths = repomix._read_git_index(self.root / ".git" / "index")
+                self.assertEqual(paths, self.ls_files())
+
+    def test_intent_to_add_entries(self) -> None:
+        write_tree(self.root, {"later.txt": "later\n"})
+        run_git(self.root, "add", "-N", "later.txt")
+        self.assertIn("later.txt", repomix._read_git_index(self.root / ".git" / "index"))
+
+    def test_split_index_is_rejected(self) -> None:
+        run_git(self.root, "update-index", "--split-index")
+        with self.assertRaises(ValueError):
+            repomix._read_git_index(self.root / ".git" / "index")
+        # The mixer falls back to git ls-files
+        self.assertEqual(split_segments(self.mix("split.txt", git_index=True)), split_segments(self.mix()))
+
+    def test_tracked_files_are_mixed(self) -> None:
+        write_tree(self.root, {"tracked.log": "tracked despite .gitignore\n"})
+        run_git(self.root, "add", "-f", "tracked.log")
+        write_tree(self.root, {"untracked.txt": "untracked\n", "untracked.log": "ignored\n"})
+        (self.root / "README.md").unlink()
+
+        output = self.mix(git_index=True)
+        tracked = set(self.ls_files()) - {"README.md"}
+        self.assertEqual(set(split_segments(output)), tracked)
+        self.assertEqual(list(split_segments(output)), sorted(tracked))
+        self.assertEqual(set(split_segments(self.mix("untracked.txt", git_index=True, untracked=True))),
+                         tracked | {"untracked.txt"})
+
+    def test_segments_match_the_walk(self) -> None:
+        self.assertEqual(split_segments(self.mix("index.txt", git_index=True)), split_segments(self.mix()))
+
+
+class TestReadFile(MixerTestCase):
+    def test_content_around_the_check_block(self) -> None:
+        block = repomix.BINARY_CHECK_BYTES
+        for size in (0, 1, block - 1, block, block + 1, 3 * block + 5):
+            with self.subTest(size=size):
+                content = bytes(b"abcdefg\n"[i % 8] for i in range(size))
+                write_tree(self.root, {"f.txt": content})
+                self.assertEqual(repomix.RepoMixer._read_file(self.root / "f.txt"), (False, content))
+
+    def test_binary_detection_matches_is_binary(self) -> None:
+        block = repomix.BINARY_CHECK_BYTES
+        write_tree(self.root, {
+            "early.bin": b"text\0more", "late.txt": b"a" * block + b"\0",
+            "edge.bin": b"a" * (block - 1) + b"\0", "plain.txt": b"plain\n",
+        })
+        for name in ("early.bin", "late.txt", "edge.bin", "plain.txt"):
+            with self.subTest(name=name):
+                path = self.root / name
+                is_binary, data = repomix.RepoMixer._read_file(path)
+                self.assertEqual(is_binary, repomix.RepoMixer._is_binary(path))
+                self.assertEqual(data, b"" if is_binary else path.read_bytes())
+
+    def test_short_reads_are_not_the_end_of_the_file(self) -> None:
+        class ShortReadFile(io.FileIO):
+            # Returns at most 7 bytes per read, as a network file system may
+            def read(self, size: int = -1) -> bytes:
+                return super().read(min(size, 7) if size >= 0 else size)
+
+        block = repomix.BINARY_CHECK_BYTES
+        write_tree(self.root, {"text.txt": b"abcdefg\n" * (block // 4), "short.txt": b"0123456789",
+                               "late.bin": b"a" * 100 + b"\0"})
+        with mock.patch.object(Path, "open", lambda path, *args, **kwargs: ShortReadFile(path)):
+            for name in ("text.txt", "short.txt"):
+                with self.subTest(name=name):
+                    path = self.root / name
+                    self.assertEqual(repomix.RepoMixer._read_file(path), (False, path.read_bytes()))
+            self.assertEqual(repomix.RepoMixer._read_file(self.root / "late.bin"), (True, b""))
+
+    def test_decode_matches_read_text(self) -> None:
+        write_tree(self.root, {"f.txt": b"a\r\nb\rc\n\r\n\xff\xfeok \xc3\xa9\r"})
+        path = self.root / "f.txt"
+        self.assertEqual(repomix.RepoMixer._decode_text(path.read_bytes()),
+                         path.read_text(encoding="utf-8", errors="ignore"))
+
+    def test_each_file_is_opened_once(self) -> None:
+        write_tree(self.root, SAMPLE_TREE)
+        with counting_opens() as opened:
+            self.mix()
+        self.assertEqual({path: count for path, count in opened.items() if path.is_relative_to(self.root)},
+                         {self.root / name: 1 for name in SAMPLE_TREE})
+
+
+class TestUtf8Bytes(unittest.TestCase):
+    def test_strip_utf8_matches_str_strip(self) -> None:
+        rng = random.Random(9)
+        for _ in range(5000):
+            text = random_text(rng, rng.randrange(12))
+            self.assertEqual(repomix.RepoMixer._strip_utf8(text.encode("utf-8")), text.strip().encode("utf-8"),
+                             repr(text))
+
+    def test_is_utf8_across_chunks(self) -> None:
+        rng = random.Random(10)
+        samples = [random_text(rng, 20).encode("utf-8") for _ in range(200)]
+        samples += [sample[:rng.randrange(len(sample))] + bytes([rng.randrange(256)]) + sample for sample in samples]
+        with mock.patch.object(repomix, "UTF8_VALIDATE_CHUNK_BYTES", 3):
+            for sample in samples:
+                try:
+                    sample.decode("utf-8")
+                    valid = True
+                except UnicodeDecodeError:
+                    valid = False
+                self.assertEqual(repomix.RepoMixer._is_utf8(sample), valid, repr(sample))
+
+
+class TestUtf8Rendering(MixerTestCase):
+    def test_rendering_matches_decoded_text(self) -> None:
+        rng = random.Random(11)
+        files = {f"f{i}.txt": random_text(rng, 30).encode("utf-8") for i in range(50)}
+        files["invalid.txt"] = b"\xa0 caf\xe9 \r\n\x1c"
+        write_tree(self.root, files)
+        segments = split_segments(self.mix())
+        for name, content in files.items():
+            text = content.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+            self.assertEqual(segments[name], b"\n```\n" + text.strip().encode("utf-8") + b"\n```\n\n", name)
+
+
+class TestStreaming(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, SAMPLE_TREE)
+
+    def test_iter_chunks_matches_the_output_file(self) -> None:
+        mixer = repomix.RepoMixer(root_dir=self.root, output_file=None)
+        self.assertEqual(b"".join(mixer.iter_chunks()), self.mix())
+
+    def test_iter_chunks_reads_lazily(self) -> None:
+        mixer = repomix.RepoMixer(root_dir=self.root, output_file=None)
+        with mock.patch.object(repomix.RepoMixer, "_render_file", autospec=True,
+                               side_effect=repomix.RepoMixer._render_file) as render:
+            chunks = mixer.iter_chunks()
+            self.assertEqual(render.call_count, 0)
+            next(chunks)
+            next(chunks)
+            self.assertLess(render.call_count, len(SAMPLE_TREE))
+            chunks.close()
+
+    def test_incremental_requires_an_output_file(self) -> None:
+        with self.assertRaises(ValueError):
+            repomix.RepoMixer(root_dir=self.root, output_file=None, incremental=True)
+
+    def test_standard_output(self) -> None:
+        result = run_script(str(self.root), "-o", "-", check=True)
+        self.assertEqual(result.stdout, self.mix())
+        self.assertFalse((self.root / "-").exists())
+
+    def test_closed_pipe(self) -> None:
+        write_tree(self.root, {f"big/{i:03d}.txt": "x" * 2000 + "\n" for i in range(200)})
+        process = subprocess.Popen([sys.executable, repomix.__file__, str(self.root), "-o", "-"],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertTrue(process.stdout.read(100))
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        self.assertEqual(process.wait(timeout=60), 1)
+        self.assertIn(b"Output pipe closed", stderr)
+        self.assertNotIn(b"Traceback", stderr)
+
+
+class TestCompression(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, SAMPLE_TREE)
+        self.plain = self.mix()
+
+    def test_compressed_output_decompresses_to_the_plain_output(self) -> None:
+        for method, decompress in (("gzip", gzip.decompress), ("xz", lzma.decompress)):
+            for level in (None, 0, 9):
+                with self.subTest(method=method, level=level):
+                    output = self.mix(f"repomix-{level}.txt", compress=method, compress_level=level, jobs=4)
+                    self.assertEqual(decompress(output), self.plain)
+
+    @unittest.skipUnless(importlib.util.find_spec("zstandard"), "zstandard is not installed")
+    def test_zstd(self) -> None:
+        import zstandard
+        output = self.mix("repomix.txt.zst", compress="zstd")
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(output), self.plain)
+
+    def test_invalid_combinations(self) -> None:
+        for options in ({"compress": "bzip3"}, {"compress": "gzip", "incremental": True}):
+            with self.subTest(options=options), self.assertRaises(ValueError):
+                repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", **options)
+
+    def test_command_line(self) -> None:
+        run_script(str(self.root), "-o", str(self.out / "cli.txt"), "--compress", "gzip", check=True)
+        self.assertEqual(gzip.decompress((self.out / "cli.txt.gz").read_bytes()), self.plain)
+        result = run_script(str(self.root), "-o", "-", "--compress", "xz", "--compress-level", "1", check=True)
+        self.assertEqual(lzma.decompress(result.stdout), self.plain)
+        result = run_script(str(self.root), "--compress", "gzip", "--compress-level", "10")
+        self.assertEqual(result.returncode, 2)
+
+
+class TestShards(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, SAMPLE_TREE)
+        self.segments = split_segments(self.mix("plain.txt"))
+
+    def shard(self, name: str = "repomix.txt", **options) -> dict:
+        """
+        Writes a sharded mix named after name into `out` and returns its manifest.
+        """
+        with redirect_stdout(io.StringIO()):
+            repomix.RepoMixer(root_dir=self.root, output_file=self.out / name, **options).run()
+        return json.loads((self.out / (name + repomix.SHARD_MANIFEST_SUFFIX)).read_text())
+
+    def check_parts(self, manifest: dict, decompress=lambda data: data) -> list:
+        parts = [decompress((self.out / shard["path"]).read_bytes()) for shard in manifest["shards"]]
+        self.assertEqual([shard["bytes"] for shard in manifest["shards"]], [len(part) for part in parts])
+        self.assertEqual([shard["files"] for shard in manifest["shards"]],
+                         [len(split_segments(part)) for part in parts])
+        merged = {}
+        for part in parts:
+            self.assertTrue(part.startswith(b"# Repository Mix"))
+            merged.update(split_segments(part))
+        self.assertEqual(list(merged.items()), list(self.segments.items()))
+        for relative_path, (index, offset, length) in manifest["files"].items():
+            self.assertEqual(parts[index][offset:offset + length],
+                             f"--- {relative_path} ---".encode() + self.segments[relative_path])
+        return parts
+
+    def test_shard_size(self) -> None:
+        manifest = self.shard(shard_size=400)
+        parts = self.check_parts(manifest)
+        self.assertGreater(len(parts), 3)
+        for part in parts:
+            self.assertTrue(len(part) <= 400 or len(split_segments(part)) == 1)
+        self.assertEqual([shard["path"] for shard in manifest["shards"]][:2],
+                         ["repomix.part001.txt", "repomix.part002.txt"])
+
+    def test_shard_count(self) -> None:
+        for count in (1, 3, 7):
+            with self.subTest(shards=count):
+                parts = self.check_parts(self.shard(shards=count))
+                self.assertEqual(len(parts), count)
+
+    def test_compressed_parts(self) -> None:
+        manifest = self.shard("repomix.txt.gz", shards=2, compress="gzip", jobs=3)
+        self.assertEqual(manifest["shards"][0]["path"], "repomix.part001.txt.gz")
+        self.check_parts(manifest, gzip.decompress)
+
+    def test_stale_parts_are_removed(self) -> None:
+        self.shard(shards=5)
+        self.assertTrue((self.out / "repomix.part005.txt").exists())
+        self.check_parts(self.shard(shards=2))
+        self.assertEqual(sorted(path.name for path in self.out.glob("repomix.part*")),
+                         ["repomix.part001.txt", "repomix.part002.txt"])
+
+    def test_parts_of_another_compression_are_removed(self) -> None:
+        self.shard("repomix.txt.gz", shards=3, compress="gzip")
+        self.check_parts(self.shard(shards=2))
+        self.assertEqual(sorted(path.name for path in self.out.glob("repomix*")),
+                         ["repomix.part001.txt", "repomix.part002.txt", "repomix.txt.shards.json"])
+        self.check_parts(self.shard("repomix.txt.gz", shards=2, compress="gzip"), gzip.decompress)
+        self.assertEqual(sorted(path.name for path in self.out.glob("repomix*")),
+                         ["repomix.part001.txt.gz", "repomix.part002.txt.gz", "repomix.txt.gz.shards.json"])
+
+    def test_parts_inside_the_root_are_not_mixed(self) -> None:
+        output_file = self.root / "repomix.txt"
+        for _ in range(2):
+            with redirect_stdout(io.StringIO()):
+                repomix.RepoMixer(root_dir=self.root, output_file=output_file, shards=2).run()
+        mixed = set()
+        for path in self.root.glob("repomix.part*.txt"):
+            mixed.update(split_segments(path.read_bytes()))
+        self.assertEqual(mixed, set(SAMPLE_TREE))
+
+    def test_parts_are_not_mixed_into_a_plain_run(self) -> None:
+        output_file = self.root / "repomix.txt"
+        with redirect_stdout(io.StringIO()):
+            repomix.RepoMixer(root_dir=self.root, output_file=output_file, shards=2).run()
+            repomix.RepoMixer(root_dir=self.root, output_file=output_file).run()
+        self.assertEqual(sorted(split_segments(output_file.read_bytes())), sorted(SAMPLE_TREE))
+
+    def test_manifests_of_another_compression_are_not_mixed(self) -> None:
+        output_file = self.root / "repomix.txt"
+        with redirect_stdout(io.StringIO()):
+            repomix.RepoMixer(root_dir=self.root, output_file=self.root / "repomix.txt.gz", shards=2,
+                              compress="gzip").run()
+            repomix.RepoMixer(root_dir=self.root, output_file=output_file).run()
+        self.assertEqual(sorted(split_segments(output_file.read_bytes())), sorted(SAMPLE_TREE))
+
+
+class TestDedupe(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {
+            **SAMPLE_TREE,
+            "a/x.py": DUPLICATE_BODY, "b/x.py": DUPLICATE_BODY, "c/y.py": "\n" + DUPLICATE_BODY + "  \n",
+            "a/short.txt": "tiny\n", "b/short.txt": "tiny\n",
+            "a/logo.bin": SAMPLE_TREE["assets/logo.bin"],
+        })
+
+    def test_repeated_bodies_become_stubs(self) -> None:
+        plain = split_segments(self.mix("plain.txt"))
+        deduped = split_segments(self.mix(dedupe=True))
+        self.assertEqual(list(deduped), list(plain))
+        self.assertEqual(deduped["b/x.py"], b" [identical to: a/x.py]\n\n")
+        self.assertEqual(deduped["c/y.py"], b" [identical to: a/x.py]\n\n")
+        for relative_path in plain:
+            if relative_path not in ("b/x.py", "c/y.py"):
+                self.assertEqual(deduped[relative_path], plain[relative_path], relative_path)
+
+    def test_output_does_not_depend_on_jobs_or_compression(self) -> None:
+        serial = self.mix(dedupe=True)
+        self.assertEqual(self.mix("jobs.txt", dedupe=True, jobs=4), serial)
+        self.assertEqual(gzip.decompress(self.mix("gzip.txt", dedupe=True, jobs=4, compress="gzip")), serial)
+
+    def test_incremental_is_excluded(self) -> None:
+        with self.assertRaises(ValueError):
+            repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", dedupe=True,
+                              incremental=True)
+
+
+class TestNearDedupe(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {
+            "a/base.py": numbered_lines(60),
+            "b/variant.py": numbered_lines(60, changed=20),
+            "c/copy.py": numbered_lines(60),
+            "d/unrelated.py": "".join(f"print({i} * {i})\n" for i in range(60)),
+            "e/small.py": "x = 1\n",
+        })
+
+    def test_near_duplicates_become_diffs(self) -> None:
+        plain = split_segments(self.mix("plain.txt"))
+        segments = split_segments(self.mix(near_dedupe=0.8))
+        self.assertEqual(list(segments), list(plain))
+        stub = segments["b/variant.py"].decode("utf-8")
+        self.assertRegex(stub, r"^ \[similar to: a/base\.py \(\d+%\)\]\n```diff\n")
+        self.assertIn("\n-value_20 = compute(20, 'item 20')  # original\n", stub)
+        self.assertIn("\n+value_20 = compute(20, 'item 20')  # changed\n", stub)
+        self.assertNotIn("value_10 =", stub)
+        self.assertEqual(segments["c/copy.py"], b" [identical to: a/base.py]\n\n")
+        for relative_path in ("a/base.py", "d/unrelated.py", "e/small.py"):
+            self.assertEqual(segments[relative_path], plain[relative_path], relative_path)
+
+    def test_threshold_range(self) -> None:
+        for threshold in (0, 1.5):
+            with self.subTest(threshold=threshold), self.assertRaises(ValueError):
+                repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", near_dedupe=threshold)
+
+    def test_output_does_not_depend_on_jobs(self) -> None:
+        self.assertEqual(self.mix("jobs.txt", near_dedupe=0.8, jobs=4), self.mix(near_dedupe=0.8))
+
+    def test_signature_similarity(self) -> None:
+        def similarity(left: str, right: str) -> float:
+            a = repomix._minhash_signature(left.encode())
+            b = repomix._minhash_signature(right.encode())
+            return sum(x == y for x, y in zip(a, b)) / len(a)
+
+        self.assertEqual(similarity(numbered_lines(60), numbered_lines(60)), 1.0)
+        self.assertGreater(similarity(numbered_lines(60), numbered_lines(60, changed=20)), 0.8)
+        self.assertLess(similarity(numbered_lines(60), "".join(f"print({i})\n" for i in range(60))), 0.2)
+
+
+class TestLargeFiles(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        rng = random.Random(15)
+        self.files = {f"text/{i:02d}.txt": random_content(rng, rng.randrange(1200 if i % 2 else 100))
+                      for i in range(40)}
+        self.files["text/big.txt"] = b"\n  " + b"line of text\r\n" * 300 + b" \n"
+        write_tree(self.root, {**SAMPLE_TREE, **self.files})
+
+    def test_streaming_matches_the_in_memory_rendering(self) -> None:
+        in_memory = self.mix("memory.txt")
+        with mock.patch.object(repomix, "LARGE_FILE_BYTES", 16), mock.patch.object(repomix, "STREAM_CHUNK_BYTES", 5):
+            self.assertEqual(self.mix("streamed.txt"), in_memory)
+            self.assertEqual(self.mix("streamed-jobs.txt", jobs=4), in_memory)
+
+    def test_iter_stripped_text_matches_decode_and_strip(self) -> None:
+        for chunk_bytes in (1, 2, 3, 7, 64):
+            with self.subTest(chunk_bytes=chunk_bytes), \
+                    mock.patch.object(repomix, "STREAM_CHUNK_BYTES", chunk_bytes):
+                for name, content in self.files.items():
+                    for limit in (None, 50):
+                        with (self.root / name).open("rb") as f:
+                            text = "".join(repomix.RepoMixer._iter_stripped_text(f, limit))
+                        expected = repomix.RepoMixer._decode_text(content[:limit]).strip()
+                        self.assertEqual(text, expected, (name, limit))
+
+    def test_max_file_size(self) -> None:
+        plain = split_segments(self.mix("plain.txt"))
+        size = len(self.files["text/big.txt"])
+        truncated = split_segments(self.mix("truncated.txt", max_file_size=1500))
+        body = repomix.RepoMixer._decode_text(self.files["text/big.txt"][:1500]).strip().encode()
+        self.assertEqual(truncated["text/big.txt"],
+                         b"\n```\n" + body + f"\n[... truncated: showing the first 1500 of {size} bytes]\n```\n\n".encode())
+        skipped = split_segments(self.mix("skipped.txt", max_file_size=1500, oversize="skip"))
+        self.assertEqual(skipped["text/big.txt"], f"\n[File too large, content not included: {size} bytes]\n\n".encode())
+        small = {path for path in plain if (self.root / path).stat().st_size <= 1500}
+        self.assertGreater(len(plain) - len(small), 1)
+        for segments in (truncated, skipped):
+            self.assertEqual({path: segments[path] for path in small}, {path: plain[path] for path in small})
+
+    def test_invalid_limits(self) -> None:
+        for options in ({"max_file_size": 0}, {"oversize": "drop"}):
+            with self.subTest(options=options), self.assertRaises(ValueError):
+                repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", **options)
+
+    def test_max_file_size_below_one_block(self) -> None:
+        write_tree(self.root, {"short.txt": "0123456789\n" * 45})
+        self.assertLess(495, repomix.BINARY_CHECK_BYTES)
+        truncated = split_segments(self.mix("truncated.txt", max_file_size=100))
+        self.assertEqual(truncated["short.txt"], b"\n```\n" + b"0123456789\n" * 9 + b"0"
+                         + b"\n[... truncated: showing the first 100 of 495 bytes]\n```\n\n")
+        skipped = split_segments(self.mix("skipped.txt", max_file_size=100, oversize="skip"))
+        self.assertEqual(skipped["short.txt"], b"\n[File too large, content not included: 495 bytes]\n\n")
+
+
+class TestSample(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.lines = [f"row {i}" for i in range(1, 401)]
+        write_tree(self.root, {
+            **SAMPLE_TREE,
+            "data/rows.csv": "\n".join(self.lines) + "\n",
+            "data/short.csv": "a\nb\nc\nd\n",
+            "logs/run.log": "\r\n".join(self.lines),
+        })
+
+    def sampled_body(self, segment: bytes) -> list:
+        self.assertTrue(segment.startswith(b"\n```") and segment.endswith(b"\n```\n\n"), segment)
+        return segment.decode("utf-8").split("\n")[2:-3]
+
+    def test_small_files_are_sampled_exactly(self) -> None:
+        plain = split_segments(self.mix("plain.txt"))
+        segments = split_segments(self.mix(sample=[("*.csv", 3), ("logs/*.log", 2)]))
+        size = (self.root / "data/rows.csv").stat().st_size
+        self.assertEqual(self.sampled_body(segments["data/rows.csv"]), [
+            "row 1", "row 2", "row 3", f"[... sampled: first 3 and last 3 of 400 lines ({size} bytes) ...]",
+            "row 398", "row 399", "row 400"])
+        self.assertEqual(self.sampled_body(segments["logs/run.log"])[:2], ["row 1", "row 2"])
+        self.assertEqual(self.sampled_body(segments["logs/run.log"])[-2:], ["row 399", "row 400"])
+        # Files with no more than twice the kept lines, and unmatched files, are left whole
+        for relative_path in plain:
+            if relative_path not in ("data/rows.csv", "logs/run.log"):
+                self.assertEqual(segments[relative_path], plain[relative_path], relative_path)
+
+    def test_large_files_are_sampled_from_both_ends(self) -> None:
+        size = (self.root / "data/rows.csv").stat().st_size
+        with mock.patch.object(repomix, "SAMPLE_WINDOW_BYTES", 100):
+            body = self.sampled_body(split_segments(self.mix(sample=[("rows.csv", 4)]))["data/rows.csv"])
+        self.assertEqual(body, ["row 1", "row 2", "row 3", "row 4",
+                                f"[... sampled: first 4 and last 4 of 400 lines ({size} bytes) ...]",
+                                "row 397", "row 398", "row 399", "row 400"])
+
+    def test_line_counts_are_exact(self) -> None:
+        # Line endings of every kind, split across reads, and blank lines at both ends that are stripped
+        rows = [f"row {i}" + " " * (i % 13) for i in range(1, 1001)]
+        contents = {"lf.csv": "\n".join(rows), "crlf.csv": "\r\n".join(rows), "cr.csv": "\r".join(rows),
+                    "mixed.csv": "".join(row + ("\n", "\r\n", "\r")[i % 3] for i, row in enumerate(rows)),
+                    "padded.csv": "\r\n \n\t\r\n" + "\n".join(rows) + "\n\n  \r\n\n"}
+        write_tree(self.root, {f"counted/{name}": content for name, content in contents.items()})
+        for window, chunk in ((100, 7), (100, 64), (4096, 1 << 20)):
+            with self.subTest(window=window, chunk=chunk), mock.patch.object(repomix, "SAMPLE_WINDOW_BYTES", window), \
+                    mock.patch.object(repomix, "STREAM_CHUNK_BYTES", chunk):
+                segments = split_segments(self.mix(sample=[("counted/*", 2)]))
+                archive = self.base / "counted.tar"
+                with tarfile.open(archive, "w") as f:
+                    f.add(self.root / "counted", "counted")
+                with mock.patch.object(repomix, "LARGE_FILE_BYTES", 16):
+                    members = split_segments(self.mix("archive.txt", root=archive, sample=[("*.csv", 2)]))
+                for name, content in contents.items():
+                    size = len(content.encode("utf-8"))
+                    summary = f"[... sampled: first 2 and last 2 of 1000 lines ({size} bytes) ...]"
+                    self.assertEqual(self.sampled_body(segments[f"counted/{name}"])[2], summary, name)
+                    self.assertEqual(self.sampled_body(members[name])[2], summary, name)
+
+    def test_files_beyond_the_count_limit_report_their_size(self) -> None:
+        size = (self.root / "data/rows.csv").stat().st_size
+        with mock.patch.object(repomix, "SAMPLE_WINDOW_BYTES", 100), \
+                mock.patch.object(repomix, "SAMPLE_COUNT_MAX_BYTES", 1000), counting_opens() as opened:
+            body = self.sampled_body(split_segments(self.mix(sample=[("rows.csv", 4)]))["data/rows.csv"])
+        self.assertEqual(body[4], f"[... sampled: first 4 and last 4 of {size} bytes ...]")
+        self.assertEqual(body[5:], ["row 397", "row 398", "row 399", "row 400"])
+        self.assertEqual(opened[self.root / "data/rows.csv"], 1)
+
+    def test_files_left_whole_are_opened_once(self) -> None:
+        write_tree(self.root, {"data/blob.csv": b"\0binary"})
+        with counting_opens() as opened:
+            sampled = split_segments(self.mix(sample=[("*.csv", 3), ("*.md", 10)]))
+        plain = split_segments(self.mix("plain.txt"))
+        for name in ("data/short.csv", "data/blob.csv", "README.md"):
+            self.assertEqual(opened[self.root / name], 1, name)
+            self.assertEqual(sampled[name], plain[name], name)
+
+    def test_output_does_not_depend_on_jobs(self) -> None:
+        rules = [("*.csv", 3), ("*.log", 5)]
+        self.assertEqual(self.mix("jobs.txt", sample=rules, jobs=4), self.mix(sample=rules))
+
+    def test_sample_argument(self) -> None:
+        self.assertEqual(repomix._parse_sample("*.csv"), ("*.csv", repomix.DEFAULT_SAMPLE_LINES))
+        self.assertEqual(repomix._parse_sample("data/*.csv:5"), ("data/*.csv", 5))
+        with self.assertRaises(ValueError):
+            repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", sample=[("*.csv", 0)])
+
+
+class TestBinaryCache(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {**SAMPLE_TREE, "assets/icon.ico": b"\0\0\1\0", "assets/data.db": b"SQLite\0"})
+        age_tree(self.root)
+        self.cache_dir = self.base / "cache"
+        self.binary = {"assets/logo.bin", "assets/icon.ico", "assets/data.db"}
+
+    def test_binary_files_are_not_opened_again(self) -> None:
+        plain = self.mix("plain.txt")
+        self.assertEqual(self.mix("first.txt", cache_dir=self.cache_dir), plain)
+        self.assertEqual(len(list(self.cache_dir.iterdir())), 1)
+        with counting_opens() as opened:
+            self.assertEqual(self.mix("second.txt", cache_dir=self.cache_dir), plain)
+        self.assertEqual({path for path in opened if path.is_relative_to(self.root)},
+                         {self.root / name for name in SAMPLE_TREE if name not in self.binary})
+
+    def test_changed_files_miss_the_cache(self) -> None:
+        self.mix("first.txt", cache_dir=self.cache_dir)
+        write_tree(self.root, {"assets/data.db": "now text\n"})
+        age_tree(self.root / "assets", 30)
+        segments = split_segments(self.mix("second.txt", cache_dir=self.cache_dir))
+        self.assertEqual(segments["assets/data.db"], b"\n```\nnow text\n```\n\n")
+        self.assertEqual(segments["assets/icon.ico"], b"\n[Binary file, content not included]\n\n")
+
+    def test_corrupt_cache_is_ignored(self) -> None:
+        plain = self.mix("plain.txt")
+        self.mix("first.txt", cache_dir=self.cache_dir)
+        for cache_file in self.cache_dir.iterdir():
+            cache_file.write_bytes(b"garbage")
+        self.assertEqual(self.mix("second.txt", cache_dir=self.cache_dir), plain)
+
+    def test_files_modified_during_the_run_are_not_cached(self) -> None:
+        write_tree(self.root, {"assets/fresh.bin": b"\0fresh"})
+        # An mtime after the start of the run, as left by a write while the run was going on
+        os.utime(self.root / "assets" / "fresh.bin", (time.time() + 60,) * 2)
+        self.mix("first.txt", cache_dir=self.cache_dir)
+        with counting_opens() as opened:
+            self.mix("second.txt", cache_dir=self.cache_dir)
+        self.assertIn(self.root / "assets" / "fresh.bin", opened)
+        self.assertNotIn(self.root / "assets" / "logo.bin", opened)
+
+    def test_partial_passes_keep_the_cache(self) -> None:
+        self.mix("first.txt", cache_dir=self.cache_dir)
+        write_tree(self.root, {"assets/new.bin": b"\0new"})
+        age_tree(self.root / "assets", 30)
+        for _ in range(2):
+            self.mix("incremental.txt", cache_dir=self.cache_dir, incremental=True)
+        with counting_opens() as opened:
+            self.mix("last.txt", cache_dir=self.cache_dir)
+        self.assertFalse({self.root / name for name in self.binary} & set(opened))
+        self.assertNotIn(self.root / "assets" / "new.bin", opened)
+
+
+class TestBatch(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.repos = [self.base / "a" / "proj", self.base / "b" / "proj", self.base / "tool"]
+        for position, root in enumerate(self.repos):
+            write_tree(root, {**SAMPLE_TREE, "ID": f"repository {position}\n"})
+
+    def test_outputs_match_single_runs(self) -> None:
+        missing = self.base / "missing"
+        results = repomix.RepoMixer.batch([*self.repos, missing], output_dir=self.out / "batch", processes=2,
+                                          dedupe=True)
+        self.assertEqual([result.root_dir for result in results], [*self.repos, missing])
+        self.assertEqual([result.ok for result in results], [True, True, True, False])
+        self.assertEqual([result.output_file.name for result in results[:3]], ["proj.txt", "proj-2.txt", "tool.txt"])
+        self.assertTrue(results[3].error)
+        for root, result in zip(self.repos, results):
+            self.assertEqual(result.file_count, len(SAMPLE_TREE) + 1)
+            self.assertEqual(result.output_file.read_bytes(), self.mix(f"{root.name}.txt", root=root, dedupe=True))
+
+    def test_default_outputs_go_into_each_repository(self) -> None:
+        results = repomix.RepoMixer.batch(self.repos[:2], processes=1)
+        for root, result in zip(self.repos, results):
+            self.assertEqual(result.output_file, root / repomix.DEFAULT_OUTPUT_FILENAME)
+            self.assertTrue(result.output_file.exists())
+
+    def test_command_line(self) -> None:
+        repos_file = self.base / "repos.txt"
+        repos_file.write_text("# repositories\n\na/proj\n" + str(self.repos[2]) + "\n")
+        result = run_script("batch", str(repos_file), "-d", str(self.out / "cli"), "-P", "2", "--compress", "gzip")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(sorted(path.name for path in (self.out / "cli").iterdir()), ["proj.txt.gz", "tool.txt.gz"])
+        self.assertEqual(gzip.decompress((self.out / "cli" / "tool.txt.gz").read_bytes()),
+                         self.mix("tool.txt", root=self.repos[2]))
+
+        repos_file.write_text("a/proj\nmissing\n")
+        result = run_script("batch", str(repos_file), "-d", str(self.out / "cli"))
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b"[FAILED]", result.stdout)
+
+
+class TestPartitions(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, nested_tree())
+        self.serial = self.mix("serial.txt")
+
+    def test_output_is_identical_to_serial(self) -> None:
+        for partitions in (2, 3, 8):
+            with self.subTest(partitions=partitions):
+                self.assertEqual(self.mix(f"p{partitions}.txt", partitions=partitions), self.serial)
+        self.assertEqual(self.mix("jobs.txt", partitions=2, jobs=3), self.serial)
+        self.assertEqual(gzip.decompress(self.mix("p.txt.gz", partitions=4, compress="gzip")), self.serial)
+        self.assertEqual(b"".join(repomix.RepoMixer(root_dir=self.root, output_file=None, partitions=3).iter_chunks()),
+                         self.serial)
+
+    def test_options_reach_the_workers(self) -> None:
+        options = {"sample": [("code.py", 1)], "max_file_size": 8}
+        self.assertEqual(self.mix("p.txt", partitions=3, **options), self.mix("s.txt", **options))
+
+    def test_binary_cache_is_saved_by_the_parent(self) -> None:
+        age_tree(self.root)
+        cache_dir = self.base / "cache"
+        self.mix("first.txt", partitions=3, cache_dir=cache_dir)
+        with counting_opens() as opened:
+            self.assertEqual(self.mix("second.txt", cache_dir=cache_dir), self.serial)
+        self.assertFalse([path for path in opened if path.suffix == ".bin" and path.is_relative_to(self.root)])
+
+    def test_invalid_combinations(self) -> None:
+        for options in ({"partitions": 0}, {"partitions": 2, "incremental": True}, {"partitions": 2, "dedupe": True}):
+            with self.subTest(options=options), self.assertRaises(ValueError):
+                repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", **options)
+
+
+class TestBenchRepository(MixerTestCase):
+    def generate(self, root: Path, seed: int = 20, binary_ratio: float = 0.3) -> int:
+        root.mkdir()
+        return repomix_bench.generate_repo(root, random.Random(seed), depth=2, fanout=3, files_per_dir=4,
+                                           file_size=200, binary_ratio=binary_ratio, rule_count=20,
+                                           negation_ratio=0.2)
+
+    def test_generation_is_deterministic(self) -> None:
+        count = self.generate(self.base / "first")
+        self.generate(self.base / "second")
+        first, second = tree_digest(self.base / "first"), tree_digest(self.base / "second")
+        self.assertEqual(first, second)
+        self.assertEqual(count, len(first) - 1)
+        self.assertTrue(any(data.startswith(b"\0") for data in first.values()))
+        self.generate(self.base / "other", seed=21)
+        self.assertNotEqual(tree_digest(self.base / "other"), first)
+
+    def test_binary_ratio(self) -> None:
+        self.generate(self.base / "text", binary_ratio=0)
+        self.assertFalse(any(b"\0" in data for data in tree_digest(self.base / "text").values()))
+
+    def test_bench_repo_reports_every_stage(self) -> None:
+        self.generate(self.root / "generated")
+        with redirect_stdout(io.StringIO()):
+            results = repomix_bench.bench_repo(self.root, repeat=1, jobs=2)
+        self.assertEqual(results["files"], len(split_segments(self.mix())))
+        self.assertEqual(results["output_bytes"], len(self.mix()))
+        for stage in ("walk_s", "is_binary_s", "run_s"):
+            self.assertGreater(results[stage], 0, stage)
+
+    def test_nested_ignore_files(self) -> None:
+        self.generate(self.base / "nested")
+        nested = tree_digest(self.base / "nested")
+        ignore_files = sorted(name for name in nested if name.endswith("/.gitignore"))
+        self.assertEqual(len(ignore_files), 3 + 9)
+        self.assertTrue(all(name.count("/") <= 2 for name in ignore_files))
+        (self.base / "flat").mkdir()
+        repomix_bench.generate_repo(self.base / "flat", random.Random(20), depth=2, fanout=3, files_per_dir=4,
+                                    file_size=200, binary_ratio=0.3, rule_count=20, negation_ratio=0.2,
+                                    nested_rule_count=0)
+        self.assertEqual(tree_digest(self.base / "flat"),
+                         {name: data for name, data in nested.items() if name not in ignore_files})
+
+    def test_bench_repo_times_ignore_matching(self) -> None:
+        self.generate(self.root / "generated")
+        with redirect_stdout(io.StringIO()):
+            results = repomix_bench.bench_repo(self.root, repeat=1, jobs=2)
+        self.assertGreater(results["ignore_s"], 0)
+        self.assertGreater(results["ignore_paths"], results["files"])
+
+
+class TestRunStats(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {**SAMPLE_TREE, ".gitignore": "*.log\nbuild/\n", "a.log": "", "build/x": ""})
+
+    def counters(self, **options) -> Dict[str, int]:
+        mixer = repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", **options)
+        with redirect_stdout(io.StringIO()):
+            mixer.run()
+        report = mixer.stats_report()
+        self.assertEqual(set(report["phases_seconds"]), set(repomix.STATS_PHASES))
+        return report["counters"]
+
+    def test_counters(self) -> None:
+        counters = self.counters()
+        self.assertEqual(counters["files"], len(SAMPLE_TREE) + 1)
+        self.assertEqual(counters["binary"], 1)
+        self.assertEqual(counters["text"], len(SAMPLE_TREE))
+        self.assertEqual(counters["ignored"], 2)
+        self.assertEqual(counters["directories"], 6)
+        self.assertEqual(counters["errors"], 0)
+        self.assertEqual(counters["bytes_written"], (self.out / "repomix.txt").stat().st_size)
+        self.assertEqual(counters["bytes_read"], sum(
+            (self.root / name).stat().st_size for name in [*SAMPLE_TREE, ".gitignore"] if name != "assets/logo.bin"))
+
+    def test_counters_do_not_depend_on_threads_or_processes(self) -> None:
+        serial = self.counters()
+        self.assertEqual(self.counters(jobs=4), serial)
+        self.assertEqual(self.counters(partitions=3), serial)
+
+    def test_command_line_reports(self) -> None:
+        stats_file, profile_file = self.out / "stats.json", self.out / "run.prof"
+        result = run_script(str(self.root), "-o", str(self.out / "cli.txt"), "--stats", str(stats_file),
+                            "--profile", str(profile_file))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(stats_file.read_text())
+        self.assertEqual(report["counters"]["files"], len(SAMPLE_TREE) + 1)
+        self.assertGreater(report["wall_seconds"], 0)
+        self.assertEqual(report["root_dir"], str(self.root))
+        self.assertTrue(pstats.Stats(str(profile_file)).total_calls)
+
+    def test_profile_covers_construction_and_reader_threads(self) -> None:
+        profile_file = self.out / "run.prof"
+        result = run_script(str(self.root), "-o", str(self.out / "cli.txt"), "--jobs", "4",
+                            "--profile", str(profile_file))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        calls = collections.Counter()
+        for (file_name, _, function), (_, call_count, *_) in pstats.Stats(str(profile_file)).stats.items():
+            if file_name == repomix.__file__:
+                calls[function] += call_count
+        self.assertGreater(calls["_load_ignore_rules"], 0)
+        self.assertEqual(calls["_render_file"], len(SAMPLE_TREE) + 1)
+
+    def test_reports_are_written_when_the_run_fails(self) -> None:
+        stats_file = self.out / "stats.json"
+        result = run_script(str(self.root), "-o", str(self.out / "missing" / "cli.txt"), "--stats", str(stats_file))
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("counters", json.loads(stats_file.read_text()))
+
+    def test_pickling_keeps_the_statistics(self) -> None:
+        stats = repomix.RunStats()
+        stats.add("walk", 5000, "directories", 3)
+        stats.count("errors")
+        restored = pickle.loads(pickle.dumps(stats))
+        phase_ns, counters = stats.take()
+        self.assertEqual((phase_ns["walk"], counters["directories"], counters["errors"]), (5000, 3, 1))
+        self.assertEqual(restored.take(), (phase_ns, counters))
+
+
+class TestRuleCache(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {
+            **SAMPLE_TREE,
+            ".gitignore": "*.log\nbuild/\n!keep.log\n",
+            "src/.gitignore": "lib/*.go\n",
+            "a.log": "", "keep.log": "kept\n", "build/x": "",
+        })
+        self.cache_dir = self.base / "cache"
+
+    def test_cached_rules_need_no_translation(self) -> None:
+        plain = self.mix("plain.txt")
+        self.assertEqual(self.mix("first.txt", cache_dir=self.cache_dir), plain)
+        self.assertEqual(len(list((self.cache_dir / repomix.RULE_CACHE_DIRNAME).iterdir())), 2)
+        with mock.patch.object(repomix, "_import_rule_translator", side_effect=AssertionError("not cached")):
+            self.assertEqual(self.mix("second.txt", cache_dir=self.cache_dir), plain)
+
+    def test_unusable_entries_are_recompiled(self) -> None:
+        plain = self.mix("plain.txt")
+        self.mix("first.txt", cache_dir=self.cache_dir)
+        for cache_file in (self.cache_dir / repomix.RULE_CACHE_DIRNAME).iterdir():
+            cache_file.write_bytes(b"not marshal data")
+        self.assertEqual(self.mix("second.txt", cache_dir=self.cache_dir), plain)
+
+    def test_without_a_cache_directory_nothing_is_written(self) -> None:
+        self.mix()
+        self.assertFalse(self.cache_dir.exists())
+
+    def test_state_round_trip(self) -> None:
+        lines, paths = random_rules_and_paths(22, 300, 2000)
+        rules = repomix.IgnoreRules(lines)
+        restored = repomix.IgnoreRules._from_state(marshal.loads(marshal.dumps(rules.__getstate__())), "test")
+        self.assertEqual([restored.match(path, is_dir) for path, is_dir in paths],
+                         [rules.match(path, is_dir) for path, is_dir in paths])
+
+    def test_unused_entries_are_evicted(self) -> None:
+        rule_dir = self.cache_dir / repomix.RULE_CACHE_DIRNAME
+        self.mix("first.txt", cache_dir=self.cache_dir)
+        current = sorted(rule_dir.iterdir())
+        # Two days old: a hit refreshes them; forty days old: evicted at the next miss
+        two_days_ago = time.time() - 2 * 24 * 3600
+        for path in current:
+            os.utime(path, (two_days_ago,) * 2)
+        stale = rule_dir / ("0" * 32 + ".bin")
+        stale.write_bytes(b"old")
+        os.utime(stale, (time.time() - 40 * 24 * 3600,) * 2)
+        self.mix("second.txt", cache_dir=self.cache_dir)
+        self.assertTrue(stale.exists())
+        self.assertTrue(all(path.stat().st_mtime > two_days_ago + 3600 for path in current))
+
+        write_tree(self.root, {"docs/.gitignore": "*.tmp\n"})
+        self.mix("third.txt", cache_dir=self.cache_dir)
+        self.assertFalse(stale.exists())
+        self.assertEqual(len(list(rule_dir.iterdir())), 3)
+
+    def test_least_recently_used_entries_are_evicted_over_the_size_limit(self) -> None:
+        rule_dir = self.cache_dir / repomix.RULE_CACHE_DIRNAME
+        rule_dir.mkdir(parents=True)
+        for age in range(1, 5):
+            filler = rule_dir / f"{age:032d}.bin"
+            filler.write_bytes(b"x" * 1000)
+            os.utime(filler, (time.time() - age * 3600,) * 2)
+        with mock.patch.object(repomix, "RULE_CACHE_MAX_BYTES", 2500):
+            self.mix(cache_dir=self.cache_dir)
+        remaining = sorted(path.name for path in rule_dir.iterdir())
+        self.assertNotIn(f"{4:032d}.bin", remaining)
+        self.assertNotIn(f"{3:032d}.bin", remaining)
+        self.assertLessEqual(sum((rule_dir / name).stat().st_size for name in remaining), 2500)
+
+    def test_missing_translator_is_reported_before_the_output_opens(self) -> None:
+        # The root rules load from the cache; only the new nested file needs the translator
+        output_file = self.out / "repomix.txt"
+        previous = self.mix(cache_dir=self.cache_dir)
+        write_tree(self.root, {"docs/.gitignore": "*.tmp\n"})
+        stderr = io.StringIO()
+        with mock.patch.dict(sys.modules, {"gitignore_parser": None}), redirect_stderr(stderr), \
+                self.assertRaises(SystemExit):
+            self.mix(cache_dir=self.cache_dir)
+        self.assertIn("'gitignore-parser' is not installed", stderr.getvalue())
+        self.assertEqual(output_file.read_bytes(), previous)
+
+
+@requires_git
+class TestGitRevision(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        make_history(self.root)
+
+    def test_revisions_match_a_checkout(self) -> None:
+        head = run_git(self.root, "rev-parse", "HEAD").strip()
+        for rev in ("HEAD", "main", "HEAD~1", "HEAD^^", "HEAD~3", "v1", "v1a", head[:8], "v1a~0"):
+            with self.subTest(rev=rev):
+                commit = run_git(self.root, "rev-parse", f"{rev}^{{commit}}").strip()
+                expected = split_segments(self.mix("checkout.txt", root=checkout(self.root, commit, self.base / rev)))
+                # A symlink has no content in the tree; the checkout holds a copy of its target
+                expected.pop("link", None)
+                output = self.mix(rev=rev)
+                self.assertIn(f"# Revision: {rev} ({commit})\n".encode(), output)
+                self.assertEqual(split_segments(output), expected)
+
+    def test_files_follow_tree_order(self) -> None:
+        listed = run_git(self.root, "ls-tree", "-r", "--name-only", "HEAD").split("\n")
+        mixed = list(split_segments(self.mix(rev="HEAD")))
+        self.assertEqual(mixed, [path for path in listed if path in mixed])
+
+    def test_objects_match_git(self) -> None:
+        store = repomix._GitObjectStore(self.root / ".git")
+        self.assertTrue(store.packs)
+        batch = run_git(self.root, "cat-file", "--batch-all-objects", "--batch-check").split("\n")
+        deltified = run_git(self.root, "verify-pack", "-v", *map(str, (self.root / ".git/objects/pack").glob("*.idx")))
+        self.assertRegex(deltified, r"(?m)^chain length = [1-9]")
+        for line in filter(None, batch):
+            oid, kind, size = line.split()
+            content = subprocess.run(["git", "cat-file", kind, oid], cwd=self.root, check=True,
+                                     capture_output=True).stdout
+            self.assertEqual(store.read(bytes.fromhex(oid)), (kind, content), oid)
+            self.assertEqual(store.size(bytes.fromhex(oid)), int(size), oid)
+
+    def test_bare_repository(self) -> None:
+        bare = self.base / "bare.git"
+        run_git(self.base, "clone", "-q", "--bare", str(self.root), str(bare))
+        self.assertEqual(split_segments(self.mix("bare.txt", root=bare, rev="v1a")),
+                         split_segments(self.mix(rev="v1a")))
+
+    def test_unknown_revisions(self) -> None:
+        for rev in ("nope", "HEAD~9", "HEAD^3", "0000000"):
+            with self.subTest(rev=rev), self.assertRaises((ValueError, SystemExit)):
+                self.mix(rev=rev)
+
+    def test_peeling(self) -> None:
+        store = repomix._GitObjectStore(self.root / ".git")
+        for rev in ("v1a^{}", "v1a^{commit}", "v1a^{tag}", "v1a^{object}", "v1a^{tree}", "v1^{}", "HEAD^{tree}",
+                    "HEAD~1^{commit}", "v1a^{}~0", "HEAD^{commit}^"):
+            with self.subTest(rev=rev):
+                tree = run_git(self.root, "rev-parse", f"{rev}^{{tree}}").strip()
+                self.assertEqual(store.resolve(rev)[1].hex(), tree)
+        tree = run_git(self.root, "rev-parse", "v1a^{tree}").strip()
+        output = self.mix(rev="v1a^{tree}")
+        self.assertIn(f"# Revision: v1a^{{tree}} ({tree})\n".encode(), output)
+        self.assertEqual(split_segments(output), split_segments(self.mix("v1.txt", rev="v1")))
+
+    def test_unsupported_revision_syntax(self) -> None:
+        store = repomix._GitObjectStore(self.root / ".git")
+        for rev in ("HEAD@{1}", "HEAD^{/first}", "HEAD:README.md", "main^{}:README.md"):
+            with self.subTest(rev=rev), self.assertRaisesRegex(ValueError, "unsupported revision syntax"):
+                store.resolve(rev)
+        for rev in ("HEAD^{bogus}", "HEAD^{blob}", "HEAD^{tag}"):
+            with self.subTest(rev=rev), self.assertRaises(ValueError):
+                store.resolve(rev)
+
+
+class TestGitDelta(unittest.TestCase):
+    def test_copy_and_insert(self) -> None:
+        base = b"0123456789abcdef"
+        # Sizes 16 and 11; copy 4 bytes at offset 2, insert "XYZ", copy 4 bytes at offset 12
+        delta = bytes([16, 11, 0x91, 2, 4, 3]) + b"XYZ" + bytes([0x91, 12, 4])
+        self.assertEqual(repomix._apply_git_delta(base, delta), b"2345XYZcdef")
+
+    def test_base_size_mismatch(self) -> None:
+        with self.assertRaises(ValueError):
+            repomix._apply_git_delta(b"short", bytes([16, 1, 1]) + b"x")
+
+
+@requires_git
+class TestDiffBase(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        make_history(self.root)
+        write_tree(self.root, {"sub/keep.py": "edited\n", "untracked.py": "new\n", "untracked.log": "ignored\n"})
+        (self.root / "README.md").unlink()
+
+    def changed(self, *revs: str) -> list:
+        return sorted(filter(None, run_git(self.root, "diff", "--name-only", "--no-renames", "--diff-filter=d",
+                                           *revs, "--").split("\n")))
+
+    def test_work_tree_changes(self) -> None:
+        full = split_segments(self.mix("full.txt"))
+        output = self.mix(diff_base="v1")
+        commit = run_git(self.root, "rev-parse", "v1").strip()
+        self.assertIn(f"# Changes since: v1 ({commit})\n".encode(), output)
+        segments = split_segments(output)
+        self.assertEqual(list(segments), self.changed("v1"))
+        self.assertIn("sub/keep.py", segments)
+        self.assertNotIn("README.md", segments)
+        for relative_path, segment in segments.items():
+            self.assertEqual(segment, full[relative_path], relative_path)
+
+        segments = split_segments(self.mix("untracked.txt", diff_base="v1", untracked=True))
+        self.assertEqual(list(segments), sorted(self.changed("v1") + ["untracked.py"]))
+
+    def test_tree_changes(self) -> None:
+        full = split_segments(self.mix("full.txt", rev="HEAD"))
+        segments = split_segments(self.mix(rev="HEAD", diff_base="v1a"))
+        self.assertEqual(list(segments), self.changed("v1", "HEAD"))
+        for relative_path, segment in segments.items():
+            self.assertEqual(segment, full[relative_path], relative_path)
+        self.assertEqual(self.mix("same.txt", rev="HEAD", diff_base="HEAD").count(b"\n--- "), 0)
+
+    def test_context_files(self) -> None:
+        segments = split_segments(self.mix(rev="HEAD", diff_base="HEAD~1", context=["Dockerfile", "src/lib/util.go"]))
+        self.assertEqual(list(segments), sorted(self.changed("HEAD~1", "HEAD") + ["Dockerfile", "src/lib/util.go"]))
+        with self.assertRaises(ValueError):
+            repomix.RepoMixer(root_dir=self.root, output_file=self.out / "repomix.txt", context=["Dockerfile"])
+
+
+class TestArchive(MixerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        write_tree(self.root, {**SAMPLE_TREE, ".gitignore": "*.log\nbuild/\n", "app.log": "noise\n",
+                               "build/out.txt": "generated\n", "src/.gitignore": "!keep.log\n",
+                               "src/keep.log": "kept\n"})
+
+    def test_archives_mix_like_the_directory(self) -> None:
+        expected = split_segments(self.mix("tree.txt"))
+        self.assertIn("src/keep.log", expected)
+        self.assertNotIn("app.log", expected)
+        for name in ("tree.tar", "tree.tar.gz", "tree.tar.bz2", "tree.tar.xz", "tree.zip"):
+            with self.subTest(archive=name):
+                archive = self.base / name
+                pack_tree(self.root, archive)
+                self.assertEqual(split_segments(self.mix(f"{name}.txt", root=archive)), expected)
+                self.assertEqual(split_segments(self.mix(f"{name}.jobs.txt", root=archive, jobs=4)), expected)
+
+    def test_archive_without_a_top_level_directory(self) -> None:
+        archive = self.base / "flat.tar.gz"
+        pack_tree(self.root, archive, prefix="")
+        self.assertEqual(split_segments(self.mix(root=archive)), split_segments(self.mix("tree.txt")))
+
+    def test_member_names_are_normalized_and_links_skipped(self) -> None:
+        archive = self.base / "odd.tar"
+        with tarfile.open(archive, "w") as f:
+            for name, data in (("./proj/a.txt", b"a\n"), ("proj//sub/./b.txt", b"b\n"),
+                               ("proj/../escape.txt", b"x\n")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                f.addfile(info, io.BytesIO(data))
+            link = tarfile.TarInfo("proj/link.txt")
+            link.type = tarfile.SYMTYPE
+            link.linkname = "a.txt"
+            f.addfile(link)
+        self.assertEqual(sorted(split_segments(self.mix(root=archive))), ["a.txt", "sub/b.txt"])
+
+    def test_unreadable_archives(self) -> None:
+        archive = self.base / "tree.tar.gz"
+        pack_tree(self.root, archive)
+        truncated = self.base / "truncated.tar.gz"
+        truncated.write_bytes(archive.read_bytes()[:archive.stat().st_size // 2])
+        with self.assertRaisesRegex(ValueError, "Failed to read archive"):
+            self.mix(root=truncated)
+        text = self.base / "notes.txt"
+        text.write_text("not an archive\n")
+        with self.assertRaisesRegex(ValueError, "neither a directory nor a zip or tar archive"):
+            self.mix(root=text)
+
+    def test_incompatible_options(self) -> None:
+        archive = self.base / "tree.zip"
+        pack_tree(self.root, archive)
+        for options in ({"incremental": True}, {"git_index": True}, {"rev": "HEAD"}, {"diff_base": "HEAD"},
+                        {"partitions": 2}, {"shards": 2}):
+            with self.subTest(**options), self.assertRaises(ValueError):
+                repomix.RepoMixer(root_dir=archive, output_file=self.out / "repomix.txt", **options)
+
+    def test_near_duplicates_of_evicted_members_are_emitted_in_full(self) -> None:
+        write_tree(self.root, {"a/base.py": numbered_lines(60), "b/variant.py": numbered_lines(60, changed=20)})
+        archive = self.base / "tree.tar.gz"
+        pack_tree(self.root, archive)
+        plain = split_segments(self.mix("plain.txt"))
+        expected = split_segments(self.mix("tree.txt", near_dedupe=0.8))
+        self.assertTrue(expected["b/variant.py"].startswith(b" [similar to: a/base.py"))
+        self.assertEqual(split_segments(self.mix("kept.txt", root=archive, near_dedupe=0.8)), expected)
+        with mock.patch.object(repomix, "ARCHIVE_DIFF_BASES_BYTES", 1):
+            evicted = split_segments(self.mix("evicted.txt", root=archive, near_dedupe=0.8))
+        self.assertEqual(evicted["b/variant.py"], plain["b/variant.py"])
+        self.assertEqual({**evicted, "b/variant.py": expected["b/variant.py"]}, expected)
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_defers_optional_modules(self) -> None:
+        """
+        Importing repomix loads none of LAZY_MODULES.
+        """
+        result = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=Path(__file__).resolve().parent,
+                                capture_output=True, text=True, check=True)
+        loaded = sorted(set(result.stdout.split()).intersection(LAZY_MODULES))
+        self.assertEqual(loaded, [], f"importing repomix loads {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    unittest.main()